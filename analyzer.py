@@ -1,17 +1,111 @@
 import os
 import re
+import json
+import hashlib
+import mmap
+import struct
+import zlib
 import zipfile
-import shutil
 from pathlib import Path
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 
-def extract_apk_completely(apk_path, extract_dir=None):
-    """Extract APK to extract_dir (created if None) and return list of files."""
+from apk_digest import digest_apk
+from arsc_parser import ARSCError, ResourceTable
+from axml_parser import AXMLError, is_axml, parse_manifest
+from dex_parser import DANGEROUS_APIS, DexError, DexFile, find_dangerous_apis
+from elf_parser import PACKER_SIGNATURES, SENSITIVE_IMPORTS, ELFError, analyze_elf, packers_for_name
+from file_types import PAYLOAD_KINDS, SNIFF_BYTES, is_disguised, sniff
+from pattern_matcher import MultiPatternMatcher, MatchStream, TokenStream
+from result_cache import DEFAULT_MAX_BYTES, ResultCache
+from similarity import add_features, densify, entry_feature, merge, new_bins
+from zip_budget import DecompressionBudget
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Archives smaller than this are scanned serially even when workers are
+# requested; below it, starting the pool costs more than it saves.
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+# Smallest work unit handed to a worker, in compressed + uncompressed bytes.
+WORK_UNIT_MIN_BYTES = 4 * 1024 * 1024
+
+# Applied when no budget is passed; see zip_budget.DecompressionBudget.
+DEFAULT_BUDGET = DecompressionBudget()
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.ico', '.svg'}
+# Content types (see file_types.sniff) the text rules are run over; media,
+# fonts, compressed streams and resources.arsc (scanned by ResourceVisitor)
+# and native libraries (read from their symbol tables by NativeVisitor)
+# are not. Nested zips are, as their stored entries are plain bytes.
+CODE_SCAN_KINDS = {'text', 'dex', 'axml', 'zip', 'binary'}
+# Raw bytes inflated to sniff a deflated entry; enough for SNIFF_BYTES even
+# when the data does not compress.
+SNIFF_RAW_BYTES = 4096
+
+SUSPICIOUS_PATTERNS = [
+    (r'lock|锁机|解锁|屏幕锁', '锁机相关'),
+    (r'accessibility|无障碍', '无障碍服务'),
+    (r'qq|tencent|wechat|微信', '社交应用操作'),
+    (r'killProcess|forceStop|uninstall', '进程操作'),
+    (r'System\.exit|Runtime\.getRuntime', '系统操作'),
+    (r'exec|su|root', 'Root相关'),
+    (r'monkey|adb', '自动化操作')
+]
+
+# str \s also stops at the \x1c-\x1f separators and bytes \s does not, so
+# they are listed for the bytes regexes below.
+URL_PATTERN = r'https?://[^\s\x1c-\x1f<>\"]+|www\.[^\s\x1c-\x1f<>\"]+'
+
+CODE_MATCHER = MultiPatternMatcher(SUSPICIOUS_PATTERNS)
+RESOURCE_MATCHER_UTF16 = MultiPatternMatcher(SUSPICIOUS_PATTERNS, 'utf-16-le')
+URL_REGEX = re.compile(URL_PATTERN.encode())
+URL_DELIMITER = re.compile(rb'[\s\x1c-\x1f<>\"]')
+URL_LOOKAHEAD = 16
+# Longer URLs are cut to this many bytes, which bounds what a scan holds for one.
+URL_MAX_LENGTH = 2048
+# Source entries kept per URL in the index; the count covers all of them.
+URL_SOURCE_LIMIT = 20
+# Most recent APKs kept per signer certificate in the cache.
+SIGNER_SAMPLE_LIMIT = 100
+DANGEROUS_PERMISSIONS = [
+    "android.permission.BIND_ACCESSIBILITY_SERVICE",
+    "android.permission.SYSTEM_ALERT_WINDOW",
+    "android.permission.WRITE_SECURE_SETTINGS",
+    "android.permission.DEVICE_ADMIN",
+    "android.permission.PACKAGE_USAGE_STATS"
+]
+SUSPICIOUS_URL_REGEX = re.compile('lock|virus|hack|malware', re.IGNORECASE)
+
+# Bump when a stage's result format or parsing changes; the rule tables are
+# hashed in, so editing them invalidates cached results automatically.
+CACHE_FORMAT = 7
+RULES_VERSION = hashlib.sha256(json.dumps(
+    [CACHE_FORMAT, SUSPICIOUS_PATTERNS, URL_PATTERN, URL_MAX_LENGTH, DANGEROUS_APIS, SENSITIVE_IMPORTS,
+     PACKER_SIGNATURES],
+    ensure_ascii=False
+).encode('utf-8')).hexdigest()[:16]
+
+
+def extract_apk_completely(apk_path, extract_dir=None, tracker=None):
+    """Extract APK to extract_dir (created if None) and return list of files.
+
+    Entries are extracted one at a time against a budget tracker (from
+    DEFAULT_BUDGET when None); oversized entries and whatever exceeds the
+    total are not written, and are listed in tracker.finish().
+    """
     if extract_dir is None:
         extract_dir = tempfile.mkdtemp(prefix="apk_analysis_")
+    if tracker is None:
+        tracker = DEFAULT_BUDGET.tracker()
 
-    with zipfile.ZipFile(apk_path, 'r') as apk_zip:
-        apk_zip.extractall(extract_dir)
+    with open(apk_path, 'rb') as fp:
+        if tracker.check_archive(fp):
+            with zipfile.ZipFile(fp, 'r') as apk_zip:
+                for info in apk_zip.infolist():
+                    if info.is_dir() or tracker.admit(info, sample=False) is None:
+                        apk_zip.extract(info, extract_dir)
 
     file_list = []
     for root, dirs, files in os.walk(extract_dir):
@@ -24,47 +118,141 @@ def extract_apk_completely(apk_path, extract_dir=None):
     return extract_dir, file_list
 
 
-def analyze_file_structure(extract_dir):
-    analysis = {
+def _new_structure_analysis():
+    return {
         'total_files': 0,
         'file_types': {},
+        'content_types': {},
         'largest_files': [],
-        'suspicious_files': []
+        'suspicious_files': [],
+        'disguised_files': []
     }
 
-    suspicious_extensions = {'.dex', '.so', '.xml', '.json', '.properties'}
+
+def _add_to_structure(analysis, rel_path, kind):
+    """Count the entry by extension and by content; code and archives are suspicious."""
+    analysis['total_files'] += 1
+    file_ext = Path(rel_path).suffix.lower()
+    analysis['file_types'][file_ext] = analysis['file_types'].get(file_ext, 0) + 1
+    analysis['content_types'][kind] = analysis['content_types'].get(kind, 0) + 1
+    if kind in PAYLOAD_KINDS:
+        analysis['suspicious_files'].append(rel_path)
+    if is_disguised(rel_path, kind):
+        analysis['disguised_files'].append(f"{rel_path} ({kind})")
+
+
+def _sniff_file(path):
+    with open(path, 'rb') as f:
+        return sniff(f.read(SNIFF_BYTES))
+
+
+def analyze_file_structure(extract_dir):
+    analysis = _new_structure_analysis()
 
     for root, dirs, files in os.walk(extract_dir):
         for file in files:
-            analysis['total_files'] += 1
             file_path = os.path.join(root, file)
-            file_ext = Path(file).suffix.lower()
-            analysis['file_types'][file_ext] = analysis['file_types'].get(file_ext, 0) + 1
-            if file_ext in suspicious_extensions:
-                analysis['suspicious_files'].append(os.path.relpath(file_path, extract_dir))
+            _add_to_structure(analysis, os.path.relpath(file_path, extract_dir), _sniff_file(file_path))
 
     return analysis
 
 
-def extract_all_images(extract_dir, output_dir):
-    image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.ico', '.svg'}
-    image_count = 0
+IMAGE_MANIFEST = 'images.json'
+
+
+class ImageStore:
+    """Content-addressed image files.
+
+    Each distinct payload is written once as <root>/<aa>/<sha256><ext>,
+    whatever path or sample it came from, so density variants and icons
+    shared between samples cost nothing extra. A store can be shared by
+    any number of analyses; writes go through a temporary file and an
+    atomic rename.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def open_blob(self, ext):
+        return _BlobWriter(self, ext)
+
+    def add_file(self, path):
+        with open(path, 'rb') as f, self.open_blob(Path(path).suffix.lower()) as blob:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                blob.write(chunk)
+        return blob.path
+
+
+class _BlobWriter:
+    def __init__(self, store, ext):
+        self.store = store
+        self.ext = ext
+        self.path = None
+        self._digest = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, suffix='.tmp')
+        self._out = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self._digest.update(chunk)
+        self._out.write(chunk)
+
+    def commit(self):
+        """Move the payload to its content address and return that path."""
+        self._out.close()
+        digest = self._digest.hexdigest()
+        directory = os.path.join(self.store.root, digest[:2])
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, digest + self.ext)
+        if os.path.exists(self.path):
+            os.remove(self._tmp_path)
+        else:
+            os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def discard(self):
+        self._out.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def write_image_manifest(output_dir, paths):
+    """Write {original path: stored file relative to output_dir} as images.json."""
+    manifest = {name: Path(os.path.relpath(path, output_dir)).as_posix() for name, path in paths.items()}
+    with open(os.path.join(output_dir, IMAGE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def extract_all_images(extract_dir, output_dir, store_dir=None):
+    """Export images into a content-addressed store (output_dir unless store_dir is given).
+
+    output_dir/images.json maps each original path to its stored copy.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    store = ImageStore(store_dir or output_dir)
+    paths = {}
 
     for root, dirs, files in os.walk(extract_dir):
         for file in files:
-            if Path(file).suffix.lower() in image_extensions:
-                rel_path = Path(root).relative_to(extract_dir)
-                output_path = Path(output_dir) / rel_path / file
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(os.path.join(root, file), output_path)
-                image_count += 1
+            if Path(file).suffix.lower() in IMAGE_EXTENSIONS:
+                file_path = os.path.join(root, file)
+                rel_path = Path(os.path.relpath(file_path, extract_dir)).as_posix()
+                paths[rel_path] = store.add_file(file_path)
 
-    return image_count
+    write_image_manifest(output_dir, paths)
+    return len(paths)
 
 
-def analyze_android_manifest(extract_dir):
-    analysis = {
+def _new_manifest_analysis():
+    return {
         'permissions': [],
         'activities': [],
         'services': [],
@@ -73,112 +261,1210 @@ def analyze_android_manifest(extract_dir):
         'features': []
     }
 
+
+def _parse_manifest_content(content, analysis):
+    if is_axml(content):
+        analysis.update(parse_manifest(content))
+        return
+
+    # Plain-text manifests (decoded or hand-written trees)
+    text_content = content.decode('utf-8', errors='ignore')
+
+    permission_pattern = r'android\.permission\.[A-Z_]+'
+    analysis['permissions'] = re.findall(permission_pattern, text_content)
+
+    activity_pattern = r'<activity[^>]*android:name="([^"]*)"'
+    analysis['activities'] = re.findall(activity_pattern, text_content)
+
+    service_pattern = r'<service[^>]*android:name="([^"]*)"'
+    analysis['services'] = re.findall(service_pattern, text_content)
+
+
+def analyze_android_manifest(extract_dir):
+    analysis = _new_manifest_analysis()
+
     manifest_path = os.path.join(extract_dir, 'AndroidManifest.xml')
     if os.path.exists(manifest_path):
         try:
             with open(manifest_path, 'rb') as f:
                 content = f.read()
-                text_content = content.decode('utf-8', errors='ignore')
-
-            permission_pattern = r'android\.permission\.[A-Z_]+'
-            analysis['permissions'] = re.findall(permission_pattern, text_content)
+            _parse_manifest_content(content, analysis)
+        except Exception as e:
+            analysis['error'] = f"解析Manifest失败: {e}"
 
-            activity_pattern = r'<activity[^>]*android:name="([^"]*)"'
-            analysis['activities'] = re.findall(activity_pattern, text_content)
+    return analysis
 
-            service_pattern = r'<service[^>]*android:name="([^"]*)"'
-            analysis['services'] = re.findall(service_pattern, text_content)
 
-        except Exception as e:
-            analysis['error'] = f"解析Manifest失败: {e}"
+def read_manifest(apk_zip, tracker=None):
+    """Manifest analysis from the AndroidManifest.xml entry alone, without scanning the rest of the APK.
 
+    A missing, unreadable or (with a BudgetTracker) over-budget manifest is
+    reported in analysis['error'].
+    """
+    analysis = _new_manifest_analysis()
+    try:
+        info = apk_zip.getinfo('AndroidManifest.xml')
+        if tracker is not None and tracker.admit(info, sample=False) is not None:
+            analysis['error'] = "Manifest 超出解压限制"
+            return analysis
+        _parse_manifest_content(apk_zip.read(info), analysis)
+    except KeyError:
+        analysis['error'] = "未找到 AndroidManifest.xml"
+    except Exception as e:
+        analysis['error'] = f"解析Manifest失败: {e}"
     return analysis
 
 
-def analyze_code_files(extract_dir):
-    analysis = {
+def _new_code_analysis():
+    return {
         'suspicious_strings': [],
         'dangerous_api_calls': [],
-        'urls': [],
+        'urls': {},
         'file_operations': []
     }
 
-    suspicious_patterns = [
-        (r'lock|锁机|解锁|屏幕锁', '锁机相关'),
-        (r'accessibility|无障碍', '无障碍服务'),
-        (r'qq|tencent|wechat|微信', '社交应用操作'),
-        (r'killProcess|forceStop|uninstall', '进程操作'),
-        (r'System\.exit|Runtime\.getRuntime', '系统操作'),
-        (r'exec|su|root', 'Root相关'),
-        (r'monkey|adb', '自动化操作')
-    ]
+
+class _CodeScan:
+    """Chunked scan of one file; memory is bounded by the chunk size, not the file."""
+
+    def __init__(self, rule_times=None):
+        self.rules = MatchStream(CODE_MATCHER, True, rule_times)
+        self.urls = TokenStream(URL_REGEX, URL_DELIMITER, URL_LOOKAHEAD, URL_MAX_LENGTH)
+
+    def feed(self, chunk):
+        self.rules.feed(chunk)
+        self.urls.feed(chunk)
+
+    def finish(self):
+        """Per-file record: indexes of the rules that hit and {url: occurrences}."""
+        self.rules.close()
+        urls = {}
+        for url in self.urls.close():
+            url = url.decode('utf-8', errors='ignore')
+            urls[url] = urls.get(url, 0) + 1
+        return {
+            'rules': sorted({index for _offset, index in self.rules.hits}),
+            'urls': urls
+        }
+
+
+def _add_code_record(record, rel_path, analysis):
+    """Add a file's record ({} if it hit nothing); analysis['urls'] maps each URL to its count and source files."""
+    for index in record.get('rules', ()):
+        analysis['suspicious_strings'].append(f"{SUSPICIOUS_PATTERNS[index][1]}: {rel_path}")
+    for url, count in record.get('urls', {}).items():
+        entry = analysis['urls'].get(url)
+        if entry is None:
+            entry = analysis['urls'][url] = {'count': 0, 'files': []}
+        entry['count'] += count
+        if len(entry['files']) < URL_SOURCE_LIMIT:
+            entry['files'].append(rel_path)
+
+
+def _scan_dex(data):
+    """Per-file record: [(description, api)] referenced by the dex, or None if it is not valid."""
+    try:
+        return {'apis': find_dangerous_apis(data)}
+    except DexError:
+        return {'apis': None}
+
+
+def _add_dex_record(record, rel_path, analysis):
+    for description, api in record['apis'] or ():
+        analysis['dangerous_api_calls'].append(f"{description}: {api} ({rel_path})")
+
+
+def analyze_code_files(extract_dir):
+    analysis = _new_code_analysis()
 
     for root, dirs, files in os.walk(extract_dir):
         for file in files:
             file_path = os.path.join(root, file)
+            rel_path = os.path.relpath(file_path, extract_dir)
             try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    for pattern, description in suspicious_patterns:
-                        if re.search(pattern, content, re.IGNORECASE):
-                            analysis['suspicious_strings'].append(f"{description}: {os.path.relpath(file_path, extract_dir)}")
-
-                    urls = re.findall(r'https?://[^\s<>\"]+|www\.[^\s<>\"]+', content)
-                    analysis['urls'].extend(urls)
+                kind = _sniff_file(file_path)
+                if kind not in CODE_SCAN_KINDS:
+                    continue
+                scan = _CodeScan()
+                with open(file_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                        scan.feed(chunk)
+                    _add_code_record(scan.finish(), rel_path, analysis)
+                    if kind == 'dex':
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                            _add_dex_record(_scan_dex(mapped), rel_path, analysis)
             except Exception:
                 continue
 
     return analysis
 
 
-def analyze_resource_files(extract_dir):
-    analysis = {
+def _new_resource_analysis():
+    return {
         'strings': [],
         'layouts': [],
-        'drawables': []
+        'drawables': [],
+        'suspicious_strings': []
     }
 
-    # Placeholder for future expansion
+
+def _parse_resource_table(data, analysis):
+    """Fill analysis from a resources.arsc image (bytes or mmap).
+
+    Only resource names (the small key pools) are listed; values in the
+    global string pool are decoded only for strings the rules hit.
+    """
+    table = ResourceTable(data)
+    analysis['strings'] = table.names('string')
+    analysis['layouts'] = table.names('layout')
+    analysis['drawables'] = table.names('drawable')
+    data_matcher = CODE_MATCHER if table.strings.utf8 else RESOURCE_MATCHER_UTF16
+    for index, value in table.find_strings(CODE_MATCHER, data_matcher):
+        analysis['suspicious_strings'].append(f"资源字符串 {SUSPICIOUS_PATTERNS[index][1]}: {value}")
+
+
+def analyze_resource_files(extract_dir):
+    analysis = _new_resource_analysis()
+
+    arsc_path = os.path.join(extract_dir, 'resources.arsc')
+    if os.path.exists(arsc_path):
+        try:
+            with open(arsc_path, 'rb') as f:
+                mapped = _map_file(f)
+                if mapped is not None:
+                    with mapped:
+                        _parse_resource_table(mapped, analysis)
+        except (ARSCError, AXMLError, struct.error) as e:
+            analysis['error'] = f"解析资源表失败: {e}"
+
     return analysis
 
 
-def detect_malicious_behavior(manifest_analysis, code_analysis, resource_analysis):
-    findings = []
-    dangerous_permissions = [
-        "android.permission.BIND_ACCESSIBILITY_SERVICE",
-        "android.permission.SYSTEM_ALERT_WINDOW",
-        "android.permission.WRITE_SECURE_SETTINGS",
-        "android.permission.DEVICE_ADMIN",
-        "android.permission.PACKAGE_USAGE_STATS"
-    ]
+def _scan_native(data):
+    """Per-library record (see elf_parser.analyze_elf), or None if it is not a readable ELF."""
+    try:
+        return analyze_elf(data)
+    except (ELFError, struct.error):
+        return None
+
+
+def _add_native_record(record, rel_path, analysis):
+    """Add a library's record, with the packers its own file name points at."""
+    record = dict(record or {'arch': None, 'soname': None, 'needed': [], 'jni_exports': [], 'imports': [],
+                             'packers': []})
+    record['packers'] = sorted(set(record['packers']) | set(packers_for_name(rel_path)))
+    analysis[rel_path] = record
+
+
+def analyze_native_libraries(extract_dir):
+    """{path: record} of the ELF files under extract_dir, keyed like NativeVisitor's by archive path."""
+    analysis = {}
+
+    for root, dirs, files in os.walk(extract_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            rel_path = Path(os.path.relpath(file_path, extract_dir)).as_posix()
+            try:
+                if _sniff_file(file_path) != 'elf':
+                    continue
+                with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    _add_native_record(_scan_native(mapped), rel_path, analysis)
+            except (OSError, ValueError):
+                continue
+
+    return analysis
+
+
+class EntryVisitor:
+    """Per-entry hook driven by scan_apk.
+
+    visit() sees every file entry of the archive, with its content type
+    (file_types.sniff of its first bytes), and returns True when the visitor
+    wants the entry's bytes; those are then passed to feed() chunk by chunk
+    and close() is called once the entry is exhausted.
+
+    Cacheable visitors return a JSON-serialisable record of the entry from
+    close(), computed from its content only. scan_apk stores it under the
+    entry's CRC and size, and for an entry seen before calls replay() with
+    the stored record instead of feed()/close(). close() returns None for an
+    entry not worth storing; that is neither stored nor replayed, so the
+    entry is simply scanned again, while an empty record ({}) caches an
+    entry that adds nothing to the result. The same records let
+    scan_apk run a fork() of the visitor on a worker process and replay its
+    records here in archive order.
+
+    Entries over the decompression budget are only offered to partial
+    visitors, which must cope with being fed a prefix of the entry (or
+    nothing at all); their records for such entries are not cached.
+
+    Direct visitors may be handed a stored entry as a mapping of the
+    archive itself through close_mapped(), with no feed() calls, when the
+    entry starts on a page boundary (as zipalign -p places native libraries).
+
+    Visitors that time their rules keep {rule index: seconds} in rule_times;
+    scan_apk adds the times of forks run on the process pool to it.
+    """
+
+    stage = None
+    cacheable = False
+    partial = False
+    direct = False
+    rule_times = None
+
+    def visit(self, info, kind):
+        return False
+
+    def feed(self, info, chunk):
+        pass
+
+    def close(self, info):
+        return None
+
+    def close_mapped(self, info, mapped):
+        raise NotImplementedError
+
+    def replay(self, info, record):
+        raise NotImplementedError
+
+    def fork(self):
+        """Fresh visitor with the same configuration and no accumulated state."""
+        return type(self)()
+
+    def result(self):
+        return None
+
+
+class FileListVisitor(EntryVisitor):
+    stage = 'files'
+    partial = True
+
+    def __init__(self):
+        self.files = []
+
+    def visit(self, info, kind):
+        self.files.append((info.filename, info.file_size))
+        return False
+
+    def result(self):
+        return self.files
+
+
+class StructureVisitor(EntryVisitor):
+    stage = 'structure'
+    partial = True
+
+    def __init__(self):
+        self.analysis = _new_structure_analysis()
+
+    def visit(self, info, kind):
+        _add_to_structure(self.analysis, info.filename, kind)
+        return False
+
+    def result(self):
+        return self.analysis
+
+
+class ImageVisitor(EntryVisitor):
+    """Exports image entries into an ImageStore and writes output_dir/images.json.
+
+    The store lives in output_dir unless store_dir points at a shared one.
+    Entries repeating a (CRC, size) already exported from this archive are
+    not read again.
+    """
+
+    stage = 'images'
+
+    def __init__(self, output_dir, store_dir=None):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.store = ImageStore(store_dir or output_dir)
+        self.paths = {}
+        self._seen = {}
+        self._blob = None
+
+    def visit(self, info, kind):
+        if Path(info.filename).suffix.lower() not in IMAGE_EXTENSIONS:
+            return False
+        if (info.CRC, info.file_size) in self._seen:
+            self.paths[info.filename] = self._seen[info.CRC, info.file_size]
+            return False
+        self._blob = self.store.open_blob(Path(info.filename).suffix.lower())
+        return True
+
+    def feed(self, info, chunk):
+        self._blob.write(chunk)
+
+    def close(self, info):
+        path = self._blob.commit()
+        self._blob = None
+        self.paths[info.filename] = self._seen[info.CRC, info.file_size] = path
+
+    def result(self):
+        write_image_manifest(self.output_dir, self.paths)
+        return len(self.paths)
+
+
+class _BufferingVisitor(EntryVisitor):
+    """Collects the whole entry before handing it to process()."""
+
+    def __init__(self):
+        self._buffer = None
+
+    def accepts(self, info, kind):
+        return True
+
+    def visit(self, info, kind):
+        if not self.accepts(info, kind):
+            return False
+        self._buffer = bytearray()
+        return True
+
+    def feed(self, info, chunk):
+        self._buffer += chunk
+
+    def close(self, info):
+        content, self._buffer = bytes(self._buffer), None
+        return self.process(info, content)
+
+    def replay(self, info, record):
+        self._buffer = None
+
+    def process(self, info, content):
+        raise NotImplementedError
+
+
+class ManifestVisitor(_BufferingVisitor):
+    stage = 'manifest'
+    cacheable = True
+
+    def __init__(self):
+        super().__init__()
+        self.analysis = _new_manifest_analysis()
+
+    def accepts(self, info, kind):
+        return info.filename == 'AndroidManifest.xml'
+
+    def process(self, info, content):
+        try:
+            _parse_manifest_content(content, self.analysis)
+        except Exception as e:
+            self.analysis['error'] = f"解析Manifest失败: {e}"
+        return self.analysis
+
+    def replay(self, info, record):
+        super().replay(info, record)
+        self.analysis.update(record)
+
+    def result(self):
+        return self.analysis
 
-    for perm in manifest_analysis.get('permissions', []):
-        if perm in dangerous_permissions:
-            findings.append(f"危险权限: {perm}")
+
+class CodeVisitor(EntryVisitor):
+    """Suspicious strings and URLs; with timed, per-rule match time in rule_times."""
+
+    stage = 'code'
+    cacheable = True
+    partial = True
+
+    def __init__(self, timed=False):
+        self.analysis = _new_code_analysis()
+        self.rule_times = {} if timed else None
+        self._scan = None
+
+    def visit(self, info, kind):
+        if kind not in CODE_SCAN_KINDS:
+            return False
+        self._scan = _CodeScan(self.rule_times)
+        return True
+
+    def feed(self, info, chunk):
+        self._scan.feed(chunk)
+
+    def close(self, info):
+        record = self._scan.finish()
+        self.replay(info, record)
+        # Most entries hit nothing; {} caches that in the smallest row, so they are not scanned again
+        return record if record['rules'] or record['urls'] else {}
+
+    def replay(self, info, record):
+        self._scan = None
+        _add_code_record(record, info.filename, self.analysis)
+
+    def fork(self):
+        forked = CodeVisitor()
+        # In-process forks charge their rules straight to this visitor
+        forked.rule_times = self.rule_times
+        return forked
+
+    def result(self):
+        return self.analysis
+
+
+class _MappedVisitor(EntryVisitor):
+    """Hands accepted entries to process() as a read-only mmap.
+
+    Formats that need random access are spooled to an anonymous temporary
+    file and mapped rather than held in memory, unless scan_apk can map the
+    stored entry in place; process() must not keep the mapping past its
+    return.
+    """
+
+    direct = True
+
+    def __init__(self):
+        self._spool = None
+
+    def accepts(self, info, kind):
+        return True
+
+    def visit(self, info, kind):
+        return self.accepts(info, kind)
+
+    def feed(self, info, chunk):
+        if self._spool is None:
+            self._spool = tempfile.TemporaryFile()
+        self._spool.write(chunk)
+
+    def close(self, info):
+        spool, self._spool = self._spool, None
+        if spool is None:
+            return None
+        with spool:
+            spool.flush()
+            mapped = _map_file(spool)
+            if mapped is None:
+                return None
+            with mapped:
+                return self.process(info, mapped)
+
+    def close_mapped(self, info, mapped):
+        return self.process(info, mapped)
+
+    def process(self, info, mapped):
+        raise NotImplementedError
+
+
+class DexVisitor(_MappedVisitor):
+    """Looks up DANGEROUS_APIS in the id tables of every dex entry, whatever its name."""
+
+    stage = 'dex'
+    cacheable = True
+
+    def __init__(self, code_analysis):
+        super().__init__()
+        self.analysis = code_analysis
+        self.dex_files = []
+
+    def accepts(self, info, kind):
+        return kind == 'dex'
+
+    def process(self, info, mapped):
+        record = _scan_dex(mapped)
+        self.replay(info, record)
+        return record
+
+    def replay(self, info, record):
+        _add_dex_record(record, info.filename, self.analysis)
+        if record['apis'] is not None:
+            self.dex_files.append(info.filename)
+
+    def fork(self):
+        return DexVisitor(_new_code_analysis())
+
+    def result(self):
+        return self.dex_files
+
+
+class ResourceVisitor(_MappedVisitor):
+    stage = 'resources'
+    cacheable = True
+
+    def __init__(self):
+        super().__init__()
+        self.analysis = _new_resource_analysis()
+
+    def accepts(self, info, kind):
+        return info.filename == 'resources.arsc'
+
+    def process(self, info, mapped):
+        try:
+            _parse_resource_table(mapped, self.analysis)
+        except (ARSCError, AXMLError, struct.error) as e:
+            self.analysis['error'] = f"解析资源表失败: {e}"
+        return self.analysis
+
+    def replay(self, info, record):
+        self.analysis.update(record)
+
+    def result(self):
+        return self.analysis
+
+
+class NativeVisitor(_MappedVisitor):
+    """Reads the dynamic symbols and dependencies of every ELF entry (see elf_parser).
+
+    Only the headers and dynamic tables are touched, so the cost follows
+    the symbol tables rather than the library size. The result maps each
+    library to its record, with packers also matched on the entry name.
+    """
+
+    stage = 'native'
+    cacheable = True
+
+    def __init__(self):
+        super().__init__()
+        self.analysis = {}
+
+    def accepts(self, info, kind):
+        return kind == 'elf'
+
+    def process(self, info, mapped):
+        record = _scan_native(mapped)
+        self.replay(info, record)
+        return record
+
+    def replay(self, info, record):
+        _add_native_record(record, info.filename, self.analysis)
+
+    def result(self):
+        return self.analysis
+
+
+class FingerprintVisitor(_MappedVisitor):
+    """MinHash signature (see similarity) of the entries' CRCs and sizes, dex strings and manifest.
+
+    manifest_analysis is read in result(), after the scan has filled it.
+    """
+
+    stage = 'fingerprint'
+    cacheable = True
+
+    def __init__(self, manifest_analysis):
+        super().__init__()
+        self.manifest = manifest_analysis
+        self.bins = new_bins()
+
+    def visit(self, info, kind):
+        add_features(self.bins, [entry_feature(info.CRC, info.file_size)])
+        return kind == 'dex'
+
+    def process(self, info, mapped):
+        try:
+            bins = add_features(new_bins(), (b's' + value for value in DexFile(mapped).raw_strings()))
+        except (DexError, struct.error):
+            bins = None
+        record = {'bins': bins}
+        self.replay(info, record)
+        return record
+
+    def replay(self, info, record):
+        if record['bins'] is not None:
+            merge(self.bins, record['bins'])
+
+    def fork(self):
+        return FingerprintVisitor(_new_manifest_analysis())
+
+    def result(self):
+        bins = list(self.bins)
+        components = [f"{kind}:{name}" for kind in ('permissions', 'activities', 'services', 'receivers', 'providers')
+                      for name in self.manifest.get(kind, [])]
+        add_features(bins, (b'm' + component.encode('utf-8') for component in components))
+        return densify(bins)
+
+
+def _safe_parts(name):
+    return [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+
+
+def _map_file(fp):
+    try:
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return None
+
+
+def _entry_data_offset(mapped, info):
+    """Offset of an entry's raw (still compressed) bytes inside the mapped archive, or None."""
+    if mapped is None or info.flag_bits & 0x1:
+        return None
+    header = mapped[info.header_offset:info.header_offset + 30]
+    if len(header) < 30 or header[:4] != b'PK\x03\x04':
+        return None
+    name_len, extra_len = struct.unpack('<HH', header[26:30])
+    offset = info.header_offset + 30 + name_len + extra_len
+    if offset + info.compress_size > len(mapped):
+        return None
+    return offset
+
+
+def _stored_entry_offset(mapped, info):
+    """Offset of a stored entry's bytes inside the mapped archive, or None."""
+    if info.compress_type != zipfile.ZIP_STORED or info.file_size != info.compress_size:
+        return None
+    return _entry_data_offset(mapped, info)
+
+
+def iter_entry_chunks(apk_zip, info, mapped=None, limit=None):
+    """Yield the entry's bytes (the first limit of them, if given) in READ_CHUNK_SIZE pieces.
+
+    Stored entries are sliced straight out of the mapped archive without a
+    copy; the slices are only valid until the next chunk is requested.
+    """
+    size = info.file_size if limit is None else min(info.file_size, limit)
+    if size <= 0:
+        return
+    offset = _stored_entry_offset(mapped, info)
+    if offset is not None:
+        with memoryview(mapped) as view:
+            for start in range(offset, offset + size, READ_CHUNK_SIZE):
+                with view[start:min(start + READ_CHUNK_SIZE, offset + size)] as chunk:
+                    yield chunk
+        return
+    with apk_zip.open(info) as entry:
+        while size > 0:
+            chunk = entry.read(min(READ_CHUNK_SIZE, size))
+            if not chunk:
+                return
+            size -= len(chunk)
+            yield chunk
+
+
+def _sniff_entry(apk_zip, info, mapped=None):
+    """Content type of an entry from its first SNIFF_BYTES; unreadable entries are 'binary'.
+
+    With the archive mapped, only the start of the raw data is inflated,
+    without going through zipfile's per-entry setup.
+    """
+    if info.file_size == 0:
+        return 'empty'
+    offset = _stored_entry_offset(mapped, info)
+    if offset is not None:
+        return sniff(mapped[offset:offset + min(SNIFF_BYTES, info.file_size)])
+    offset = _entry_data_offset(mapped, info)
+    if offset is not None and info.compress_type == zipfile.ZIP_DEFLATED:
+        raw = mapped[offset:offset + min(info.compress_size, SNIFF_RAW_BYTES)]
+        try:
+            return sniff(zlib.decompressobj(-zlib.MAX_WBITS).decompress(raw, SNIFF_BYTES))
+        except zlib.error:
+            return 'binary'
+    try:
+        with apk_zip.open(info) as entry:
+            return sniff(entry.read(SNIFF_BYTES))
+    except (zipfile.BadZipFile, NotImplementedError, RuntimeError, EOFError, zlib.error):
+        return 'binary'
+
+
+def _entry_cache_key(visitor, info):
+    return f"entry:{visitor.stage}:{info.CRC:08x}:{info.file_size}"
+
+
+class _TimedVisitor(EntryVisitor):
+    """Proxy that charges a visitor's time, entries and bytes to its stage."""
+
+    def __init__(self, visitor, instrument):
+        self.visitor = visitor
+        self.instrument = instrument
+        self.stage = visitor.stage
+        self.cacheable = visitor.cacheable
+        self.partial = visitor.partial
+        self.direct = visitor.direct
+        self.rule_times = visitor.rule_times
+
+    def visit(self, info, kind):
+        # Called for every entry, so only wall time is taken here
+        started = time.perf_counter()
+        wanted = self.visitor.visit(info, kind)
+        self.instrument.charge(self.stage, time.perf_counter() - started, entries=1 if wanted else 0)
+        return wanted
+
+    def _timed(self, method, *args, nbytes=0):
+        self.instrument.take_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        value = method(*args)
+        self.instrument.charge(self.stage, time.perf_counter() - wall, time.process_time() - cpu,
+                               bytes_read=nbytes, peak_memory=self.instrument.take_peak())
+        return value
+
+    def feed(self, info, chunk):
+        self._timed(self.visitor.feed, info, chunk, nbytes=len(chunk))
+
+    def close(self, info):
+        return self._timed(self.visitor.close, info)
+
+    def close_mapped(self, info, mapped):
+        return self._timed(self.visitor.close_mapped, info, mapped, nbytes=len(mapped))
+
+    def replay(self, info, record):
+        self._timed(self.visitor.replay, info, record)
+
+    def fork(self):
+        return self.visitor.fork()
+
+    def result(self):
+        return self.visitor.result()
+
+
+def _timed_chunks(chunks, info, instrument):
+    """Charge the time spent producing chunks (reading and inflating) to 'extract'."""
+    instrument.charge('extract', entries=1, bytes_read=info.compress_size)
+    while True:
+        instrument.take_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        chunk = next(chunks, None)
+        instrument.charge('extract', time.perf_counter() - wall, time.process_time() - cpu,
+                          bytes_decompressed=len(chunk) if chunk is not None else 0,
+                          peak_memory=instrument.take_peak())
+        if chunk is None:
+            return
+        yield chunk
+        instrument.advance(len(chunk))
+
+
+def _map_stored_entry(fp, mapped, info):
+    """Read-only mmap of just a stored entry's bytes, when they start on an mmap boundary; else None."""
+    offset = _stored_entry_offset(mapped, info)
+    if offset is None or offset % mmap.ALLOCATIONGRANULARITY or info.file_size == 0:
+        return None
+    try:
+        return mmap.mmap(fp.fileno(), info.file_size, offset=offset, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return None
+
+
+def _read_entry(apk_zip, info, mapped, readers, instrument=None, limit=None):
+    """Feed one entry (or its first limit bytes) to readers and close them; returns (records, read_error).
+
+    Direct readers of an entry that can be mapped in place are closed on
+    the mapping and never fed.
+    """
+    records = {}
+    if limit is None and any(visitor.direct for visitor in readers):
+        entry_map = _map_stored_entry(apk_zip.fp, mapped, info)
+        if entry_map is not None:
+            with entry_map:
+                for visitor in readers:
+                    if visitor.direct:
+                        records[visitor] = visitor.close_mapped(info, entry_map)
+    streamed = [visitor for visitor in readers if visitor not in records]
+    error = None
+    if streamed:
+        chunks = iter_entry_chunks(apk_zip, info, mapped, limit)
+        if instrument is not None:
+            chunks = _timed_chunks(chunks, info, instrument)
+        try:
+            for chunk in chunks:
+                for visitor in streamed:
+                    visitor.feed(info, chunk)
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError, EOFError, zlib.error) as e:
+            error = f"{info.filename}: {e}"
+        finally:
+            for visitor in streamed:
+                records[visitor] = visitor.close(info)
+    elif instrument is not None:
+        instrument.advance(info.file_size)
+    return [records[visitor] for visitor in readers], error
+
+
+def _scan_unit(apk_path, unit):
+    """Worker side of scan_apk: run forked visitors over a unit of entries.
+
+    unit is [(position in infolist, content type, [visitor, ...])]; the
+    archive is opened afresh so every worker has its own handle and mapping.
+    Returns ([(position, records, error)], {stage: rule_times}).
+    """
+    results = []
+    rule_times = {}
+    with open(apk_path, 'rb') as fp, zipfile.ZipFile(fp, 'r') as apk_zip:
+        mapped = _map_file(fp)
+        try:
+            infos = apk_zip.infolist()
+            for position, kind, readers in unit:
+                info = infos[position]
+                for visitor in readers:
+                    if visitor.rule_times is not None:
+                        # Drop the copy of the parent's times that came with the fork
+                        visitor.rule_times = rule_times.setdefault(visitor.stage, {})
+                readers = [visitor for visitor in readers if visitor.visit(info, kind)]
+                records, error = _read_entry(apk_zip, info, mapped, readers)
+                results.append((position, records, error))
+        finally:
+            if mapped is not None:
+                mapped.close()
+    return results, rule_times
+
+
+def _work_units(jobs, kinds, infos, workers):
+    """Split {position: visitors} into units of roughly equal cost.
+
+    Cost is compressed plus uncompressed size (inflate, then scan). Large
+    entries get a unit of their own; small ones are grouped in archive
+    order. Units are returned largest first so the pool finishes evenly.
+    """
+    cost = {position: infos[position].compress_size + infos[position].file_size for position in jobs}
+    target = max(sum(cost.values()) // (workers * 4), WORK_UNIT_MIN_BYTES)
+    units = []
+    unit, unit_cost = [], 0
+    for position in sorted(jobs):
+        unit.append((position, kinds[position], jobs[position]))
+        unit_cost += cost[position]
+        if unit_cost >= target:
+            units.append((unit_cost, unit))
+            unit, unit_cost = [], 0
+    if unit:
+        units.append((unit_cost, unit))
+    units.sort(key=lambda item: item[0], reverse=True)
+    return [unit for _cost, unit in units]
+
+
+def scan_apk(apk_path, visitors, cache=None, workers=1, instrument=None, budget=None):
+    """Stream every entry of the APK once through the given visitors.
+
+    Returns a dict mapping each visitor's stage to its result, plus
+    'read_errors' listing entries that could not be decompressed and
+    'budget' listing what the DecompressionBudget (DEFAULT_BUDGET when None)
+    sampled or skipped. Sampled entries only reach partial visitors, and
+    an archive whose central directory is over budget is not opened. With a
+    ResultCache, entries whose (CRC, size) a cacheable visitor has already
+    seen are replayed from the cache instead of being decompressed again.
+
+    With workers > 1 (and an archive of at least PARALLEL_MIN_BYTES) the
+    cacheable visitors' entries are decompressed and scanned on a process
+    pool and their records replayed in archive order, so the results are
+    the same as a serial scan. Other visitors still run here.
+
+    An Instrumentation gets the time, entries and bytes of every visitor
+    charged to its stage, reading and inflating charged to 'extract', and
+    progress advanced by uncompressed bytes.
+    """
+    tracker = (budget or DEFAULT_BUDGET).tracker()
+    with open(apk_path, 'rb') as fp:
+        if not tracker.check_archive(fp):
+            results = {v.stage: v.result() for v in visitors}
+            results['read_errors'] = []
+            results['budget'] = tracker.finish()
+            return results
+
+    errors = {}
+    deferred = []   # (position, info, visitor, record or None), replayed in archive order
+    jobs = {}       # position -> forked visitors for the pool
+    kinds = {}      # position -> content type, for the pool
+    computed = {}   # (position, stage) -> record computed off the visitor, for deferred
+    unread = set()  # positions of pool entries whose progress is reported by the pool
+    if instrument is not None:
+        visitors = [_TimedVisitor(visitor, instrument) for visitor in visitors]
+    with open(apk_path, 'rb') as fp, zipfile.ZipFile(fp, 'r') as apk_zip:
+        infos = apk_zip.infolist()
+        total_size = sum(info.file_size for info in infos)
+        parallel = workers > 1 and total_size >= PARALLEL_MIN_BYTES
+        if instrument is not None:
+            instrument.add_total(total_size)
+        mapped = _map_file(fp)
+        try:
+            for position, info in enumerate(infos):
+                if info.is_dir():
+                    continue
+                limit = tracker.admit(info)
+                kind = _sniff_entry(apk_zip, info, mapped)
+                readers = []
+                for visitor in visitors:
+                    if limit is not None and not visitor.partial:
+                        continue
+                    if not visitor.visit(info, kind):
+                        continue
+                    if limit is not None:
+                        if parallel and visitor.cacheable:
+                            # Keep the archive order of the pool's records
+                            deferred.append((position, info, visitor, None))
+                            visitor = visitor.fork()
+                            visitor.visit(info, kind)
+                        readers.append(visitor)
+                        continue
+                    if cache is not None and visitor.cacheable:
+                        record = cache.get(_entry_cache_key(visitor, info))
+                        if record is not None:
+                            if parallel:
+                                deferred.append((position, info, visitor, record))
+                            else:
+                                visitor.replay(info, record)
+                            continue
+                    if parallel and visitor.cacheable:
+                        deferred.append((position, info, visitor, None))
+                        jobs.setdefault(position, []).append(visitor.fork())
+                        kinds[position] = kind
+                        continue
+                    readers.append(visitor)
+                if not readers:
+                    if position in jobs:
+                        unread.add(position)
+                    elif instrument is not None:
+                        instrument.advance(info.file_size)
+                    continue
+                records, error = _read_entry(apk_zip, info, mapped, readers, instrument, limit)
+                if limit is not None:
+                    if instrument is not None:
+                        instrument.advance(max(info.file_size - limit, 0))
+                    for visitor, record in zip(readers, records):
+                        computed[position, visitor.stage] = record
+                    if error:
+                        errors[position] = error
+                elif error:
+                    errors[position] = error
+                elif cache is not None:
+                    for visitor, record in zip(readers, records):
+                        if visitor.cacheable and record is not None:
+                            cache.put(_entry_cache_key(visitor, info), record)
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+    if jobs:
+        with instrument.stage('parallel') if instrument is not None else nullcontext(), \
+                ProcessPoolExecutor(workers) as pool:
+            units = _work_units(jobs, kinds, infos, workers)
+            timed = {visitor.stage: visitor.rule_times for visitor in visitors if visitor.rule_times is not None}
+            for results, rule_times in pool.map(_scan_unit, [apk_path] * len(units), units):
+                for stage, times in rule_times.items():
+                    for index, seconds in times.items():
+                        timed[stage][index] = timed[stage].get(index, 0.0) + seconds
+                for position, records, error in results:
+                    if instrument is not None:
+                        info = infos[position]
+                        instrument.charge('parallel', entries=1, bytes_read=info.compress_size,
+                                          bytes_decompressed=info.file_size)
+                        if position in unread:
+                            instrument.advance(info.file_size)
+                    if error:
+                        errors[position] = error
+                    for forked, record in zip(jobs[position], records):
+                        computed[position, forked.stage] = record
+                        if cache is not None and record is not None and not error:
+                            cache.put(_entry_cache_key(forked, infos[position]), record)
+    for position, info, visitor, record in deferred:
+        if record is None:
+            record = computed.get((position, visitor.stage))
+        if record is not None:
+            visitor.replay(info, record)
+
+    results = {v.stage: v.result() for v in visitors}
+    results['read_errors'] = [errors[position] for position in sorted(errors)]
+    results['budget'] = tracker.finish()
+    return results
+
+
+def open_cache(path=None, max_bytes=DEFAULT_MAX_BYTES):
+    """ResultCache bound to the current rule set."""
+    return ResultCache(RULES_VERSION, path, max_bytes)
+
+
+def signer_cache_key(fingerprint):
+    """Cache key listing the APKs (by SHA-256) seen signed by a certificate."""
+    return f"signer:{fingerprint}"
+
+
+def _remember_signers(cache, identity):
+    for certificate in identity['signature']['certificates']:
+        key = signer_cache_key(certificate['sha256'])
+        samples = [sample for sample in cache.get(key) or [] if sample != identity['sha256']]
+        cache.put(key, ([identity['sha256']] + samples)[:SIGNER_SAMPLE_LIMIT])
+
+
+def analyze_apk(apk_path, image_dir=None, cache=None, workers=1, image_store=None, instrument=None,
+                budget=None, identity=None):
+    """Run the file list, structure, image, manifest, code, resource, native and fingerprint stages in one pass.
+
+    The file's digests and signer certificates (see apk_digest) are taken
+    first, as 'identity', unless the caller already has them; an archive
+    the budget refuses to open is only hashed. Images are only written when
+    image_dir is given, into image_store when that names a store shared
+    between analyses (see ImageVisitor); nothing else touches disk unless a
+    ResultCache (see open_cache) is passed. Then a known APK (by SHA-256) is
+    answered from the cache, for a new one only entries whose CRC and size
+    have not been seen before are scanned, and signer_cache_key() lists the
+    APKs seen from each signer certificate. workers > 1 spreads the entries
+    of a large APK over a process pool (see scan_apk). With an
+    Instrumentation the whole pass is measured as stage 'scan', with
+    per-stage and per-rule breakdowns. budget bounds decompression (see
+    scan_apk); results that hit it are not cached.
+    """
+    scan = instrument.stage('scan') if instrument is not None else nullcontext()
+    with scan:
+        if identity is None:
+            with instrument.stage('digest') if instrument is not None else nullcontext():
+                with open(apk_path, 'rb') as fp:
+                    admitted = (budget or DEFAULT_BUDGET).tracker().check_archive(fp)
+                identity = digest_apk(apk_path, read_v1=admitted)
+        apk_key = None
+        if cache is not None:
+            apk_key = f"apk:{identity['sha256']}"
+            results = cache.get(apk_key)
+            if results is not None:
+                results['identity'] = identity
+                if image_dir:
+                    visitors = [ImageVisitor(image_dir, image_store)]
+                    results['images'] = scan_apk(apk_path, visitors, instrument=instrument,
+                                                 budget=budget)['images']
+                else:
+                    results['images'] = 0
+                return results
+
+        manifest = ManifestVisitor()
+        code = CodeVisitor(timed=instrument is not None)
+        visitors = [FileListVisitor(), StructureVisitor(), manifest, code, DexVisitor(code.analysis),
+                    ResourceVisitor(), NativeVisitor(), FingerprintVisitor(manifest.analysis)]
+        if image_dir:
+            visitors.append(ImageVisitor(image_dir, image_store))
+        try:
+            results = scan_apk(apk_path, visitors, cache, workers, instrument, budget)
+        finally:
+            if instrument is not None:
+                instrument.stats('code').rules = {SUSPICIOUS_PATTERNS[index][1]: seconds
+                                                  for index, seconds in code.rule_times.items()}
+        results.setdefault('images', 0)
+        if apk_key is not None and not results['read_errors'] and not results['budget']:
+            cache.put(apk_key, {stage: value for stage, value in results.items() if stage != 'images'})
+            _remember_signers(cache, identity)
+        results['identity'] = identity
+        return results
+
+
+def dangerous_permissions(manifest_analysis):
+    """The manifest's permissions that are in DANGEROUS_PERMISSIONS, in manifest order."""
+    return [perm for perm in manifest_analysis.get('permissions', []) if perm in DANGEROUS_PERMISSIONS]
+
+
+def detect_malicious_behavior(manifest_analysis, code_analysis, resource_analysis, budget_violations=(),
+                              structure_analysis=None, blocklist=None, native_analysis=None, identity=None):
+    """Findings as display strings; blocklist is an optional ioc.DomainBlocklist for the URL hosts."""
+    findings = [f"压缩包异常: {violation}" for violation in budget_violations]
+    signature = (identity or {}).get('signature', {})
+    if signature.get('content_digest') is False:
+        findings.append("签名摘要不符: APK 在签名后被修改")
+    for entry in (structure_analysis or {}).get('disguised_files', []):
+        findings.append(f"伪装文件: {entry}")
+
+    for perm in dangerous_permissions(manifest_analysis):
+        findings.append(f"危险权限: {perm}")
 
     findings.extend(code_analysis.get('suspicious_strings', []))
 
-    suspicious_domains = ['lock', 'virus', 'hack', 'malware']
-    for url in code_analysis.get('urls', []):
-        if any(domain in url.lower() for domain in suspicious_domains):
+    for call in code_analysis.get('dangerous_api_calls', []):
+        findings.append(f"危险API: {call}")
+
+    findings.extend(resource_analysis.get('suspicious_strings', []))
+
+    for path, library in (native_analysis or {}).items():
+        for packer in library['packers']:
+            findings.append(f"加固: {packer} ({path})")
+        for name in library['imports']:
+            findings.append(f"危险API: {SENSITIVE_IMPORTS[name]}: {name} ({path})")
+
+    for url in code_analysis.get('urls', {}):
+        rule = blocklist.match_url(url) if blocklist is not None else None
+        if rule is not None:
+            findings.append(f"恶意域名: {url} (情报: {rule})")
+        elif SUSPICIOUS_URL_REGEX.search(url):
             findings.append(f"可疑URL: {url}")
 
     return findings
 
 
-def create_comprehensive_zip(apk_path, extract_dir, overview_text, details_text, files_list, image_dir=None):
+# Payloads that do not shrink when deflated again; the report stores them as is.
+PRECOMPRESSED_EXTENSIONS = {'.apk', '.zip', '.jar', '.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+
+def _report_compression(name):
+    if Path(name).suffix.lower() in PRECOMPRESSED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _copy_raw_entry(mapped, info, dst_zip, arcname):
+    """Copy an entry's compressed bytes into dst_zip without inflating them.
+
+    zipfile has no public raw-write API, so the local header is written
+    from a ZipInfo carrying the source CRC and sizes. Returns False when the
+    entry cannot be copied that way (encrypted, unknown method, bad header).
+    """
+    if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        return False
+    offset = _entry_data_offset(mapped, info)
+    if offset is None:
+        return False
+    zinfo = zipfile.ZipInfo(arcname, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.external_attr = info.external_attr
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    fp = dst_zip.fp
+    fp.seek(dst_zip.start_dir)
+    zinfo.header_offset = fp.tell()
+    fp.write(zinfo.FileHeader())
+    with memoryview(mapped) as view:
+        fp.write(view[offset:offset + info.compress_size])
+    dst_zip.filelist.append(zinfo)
+    dst_zip.NameToInfo[arcname] = zinfo
+    dst_zip.start_dir = fp.tell()
+    dst_zip._didModify = True
+    return True
+
+
+def _copy_apk_images(apk_path, dst_zip, prefix):
+    """Copy each distinct image payload of the APK once, plus an images.json index.
+
+    Payloads are named <crc32>-<size><ext> under prefix and the index maps
+    every original path to one of them.
+    """
+    paths = {}
+    with open(apk_path, 'rb') as fp, zipfile.ZipFile(fp, 'r') as apk_zip:
+        mapped = _map_file(fp)
+        try:
+            for info in apk_zip.infolist():
+                ext = Path(info.filename).suffix.lower()
+                if info.is_dir() or ext not in IMAGE_EXTENSIONS:
+                    continue
+                name = f"{info.CRC:08x}-{info.file_size}{ext}"
+                arcname = f"{prefix}/{name}"
+                if arcname not in dst_zip.NameToInfo and not _copy_raw_entry(mapped, info, dst_zip, arcname):
+                    try:
+                        dst_zip.writestr(arcname, apk_zip.read(info), _report_compression(info.filename))
+                    except (zipfile.BadZipFile, NotImplementedError, RuntimeError, EOFError, zlib.error):
+                        continue
+                paths['/'.join(_safe_parts(info.filename))] = name
+        finally:
+            if mapped is not None:
+                mapped.close()
+    dst_zip.writestr(f"{prefix}/{IMAGE_MANIFEST}",
+                     json.dumps(paths, ensure_ascii=False, indent=1, sort_keys=True).encode('utf-8'))
+    return len(paths)
+
+
+def create_comprehensive_zip(apk_path, extract_dir, overview_text, details_text, files_list, image_dir=None,
+                             output_dir=None, apk_images=False):
+    """Write the 疑似病毒_<name>.zip report into output_dir (default: the working directory).
+
+    The APK and already-compressed images are stored rather than deflated
+    again. With apk_images, the APK's image entries are copied into the
+    report as raw compressed bytes instead of being read from image_dir,
+    each distinct payload once (see _copy_apk_images).
+    """
     apk_name = Path(apk_path).stem
     zip_filename = f"疑似病毒_{apk_name}.zip"
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        zip_filename = os.path.join(output_dir, zip_filename)
     with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(apk_path, f"原始APK/{apk_name}.apk")
+        zipf.write(apk_path, f"原始APK/{apk_name}.apk", zipfile.ZIP_STORED)
         zipf.writestr("分析报告.txt", overview_text.encode('utf-8'))
         zipf.writestr("详细分析.txt", details_text.encode('utf-8'))
         zipf.writestr("文件列表.txt", '\n'.join([f"{p} ({s} bytes)" for p, s in files_list]).encode('utf-8'))
-        if image_dir and os.path.exists(image_dir):
+        if apk_images:
+            _copy_apk_images(apk_path, zipf, '提取图片')
+        elif image_dir and os.path.exists(image_dir):
             for root, dirs, files in os.walk(image_dir):
                 for file in files:
                     file_path = os.path.join(root, file)
                     arcname = os.path.join('提取图片', os.path.relpath(file_path, image_dir))
-                    zipf.write(file_path, arcname)
+                    zipf.write(file_path, arcname, _report_compression(file))
 
     return zip_filename
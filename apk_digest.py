@@ -0,0 +1,318 @@
+"""Whole-file digests and signer identity of an APK.
+
+digest_apk() maps the file once and walks it in HASH_CHUNK_SIZE windows.
+Each window is fed to MD5, SHA-1 and SHA-256 together. The APK Signing
+Block (v2/v3 schemes) is located from the end of central directory, and
+the content digest those schemes sign is recomputed as the walk reaches
+each 1 MB chunk, on a thread pool (hashlib releases the GIL while hashing).
+v1 (JAR) signer certificates come from the PKCS#7 blocks under META-INF/;
+those are a few KB, so larger (or too many) signature files are not read.
+
+Signatures themselves are not verified. The content digest only tells
+whether the archive was changed after signing, and the certificate
+fingerprints identify who signed it.
+"""
+
+import hashlib
+import mmap
+import os
+import re
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from zip_budget import EOCD_SEARCH, EOCD_SIGNATURE, EOCD_SIZE
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+FILE_DIGESTS = ('md5', 'sha1', 'sha256')
+
+SIGNING_BLOCK_MAGIC = b'APK Sig Block 42'
+SCHEME_IDS = {0x7109871a: 'v2', 0xf05368c0: 'v3', 0x1b93ad61: 'v3.1'}
+CONTENT_CHUNK_SIZE = 1024 * 1024
+# Signature algorithm ids whose digests are over 1 MB chunks; the verity
+# ones (0x0421...) use a Merkle tree and are not recomputed.
+CHUNKED_DIGESTS = {
+    0x0101: 'sha256', 0x0102: 'sha512', 0x0103: 'sha256', 0x0104: 'sha512',
+    0x0201: 'sha256', 0x0202: 'sha512', 0x0301: 'sha256',
+}
+
+V1_SIGNATURE_NAME = re.compile(r'^META-INF/[^/]+\.(RSA|DSA|EC)$', re.IGNORECASE)
+V1_SIGNATURE_MAX_BYTES = 256 * 1024
+V1_SIGNATURE_MAX_FILES = 16
+NAME_ATTRIBUTES = {
+    b'\x55\x04\x03': 'CN', b'\x55\x04\x06': 'C', b'\x55\x04\x07': 'L',
+    b'\x55\x04\x08': 'ST', b'\x55\x04\x0a': 'O', b'\x55\x04\x0b': 'OU',
+}
+
+
+class SignatureError(ValueError):
+    pass
+
+
+def _der(data, pos, end=None):
+    """(tag, content start, content end) of the DER element at pos."""
+    end = len(data) if end is None else end
+    if pos + 2 > end:
+        raise SignatureError('truncated DER element')
+    tag, length = data[pos], data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        count = length & 0x7F
+        if not 0 < count <= 4:
+            raise SignatureError('unsupported DER length')
+        length = int.from_bytes(data[pos:pos + count], 'big')
+        pos += count
+    if pos + length > end:
+        raise SignatureError('truncated DER element')
+    return tag, pos, pos + length
+
+
+def _der_children(data, start, end):
+    """Yield (tag, element start, content start, content end) of the elements in [start, end)."""
+    while start < end:
+        tag, content, content_end = _der(data, start, end)
+        yield tag, start, content, content_end
+        start = content_end
+
+
+def _name(data, start, end):
+    """'CN=..., O=...' of an X.501 Name, with the attributes in NAME_ATTRIBUTES."""
+    parts = []
+    for _tag, _pos, rdn, rdn_end in _der_children(data, start, end):
+        for _tag, _pos, pair, pair_end in _der_children(data, rdn, rdn_end):
+            (_, _, oid, oid_end), (value_tag, _, value, value_end) = list(_der_children(data, pair, pair_end))[:2]
+            label = NAME_ATTRIBUTES.get(bytes(data[oid:oid_end]))
+            if label is None:
+                continue
+            encoding = 'utf-16-be' if value_tag == 0x1E else 'utf-8'
+            parts.append(f"{label}={bytes(data[value:value_end]).decode(encoding, errors='replace')}")
+    return ', '.join(parts)
+
+
+def certificate_info(der):
+    """Fingerprints and subject of a DER X.509 certificate."""
+    info = {'sha256': hashlib.sha256(der).hexdigest(), 'sha1': hashlib.sha1(der).hexdigest(), 'subject': None}
+    try:
+        _tag, cert, cert_end = _der(der, 0)
+        _tag, tbs, tbs_end = _der(der, cert, cert_end)
+        fields = [child for child in _der_children(der, tbs, tbs_end) if child[0] != 0xA0]
+        # serial, signature algorithm, issuer, validity, subject
+        _tag, _pos, subject, subject_end = fields[4]
+        info['subject'] = _name(der, subject, subject_end)
+    except (SignatureError, IndexError, ValueError):
+        pass
+    return info
+
+
+def pkcs7_certificates(data):
+    """DER certificates embedded in a PKCS#7 SignedData block (a v1 .RSA/.DSA/.EC file)."""
+    _tag, info, info_end = _der(data, 0)
+    children = list(_der_children(data, info, info_end))
+    if len(children) < 2 or children[1][0] != 0xA0:
+        raise SignatureError('not a PKCS#7 SignedData block')
+    _tag, signed, signed_end = _der(data, children[1][2], children[1][3])
+    for tag, _pos, content, content_end in _der_children(data, signed, signed_end):
+        if tag == 0xA0:
+            return [bytes(data[pos:cert_end]) for _tag, pos, _content, cert_end
+                    in _der_children(data, content, content_end)]
+    return []
+
+
+def _length_prefixed(data, pos, end):
+    """(start, end) of the uint32-length-prefixed field at pos."""
+    if pos + 4 > end:
+        raise SignatureError('truncated signing block field')
+    length = struct.unpack_from('<I', data, pos)[0]
+    if pos + 4 + length > end:
+        raise SignatureError('truncated signing block field')
+    return pos + 4, pos + 4 + length
+
+
+def _length_prefixed_items(data, start, end):
+    while start < end:
+        item, item_end = _length_prefixed(data, start, end)
+        yield item, item_end
+        start = item_end
+
+
+def parse_signers(value):
+    """[{'digests': {algorithm id: digest}, 'certificates': [der]}] of a v2/v3 scheme block."""
+    signers = []
+    sequence, sequence_end = _length_prefixed(value, 0, len(value))
+    for signer, signer_end in _length_prefixed_items(value, sequence, sequence_end):
+        signed, signed_end = _length_prefixed(value, signer, signer_end)
+        digests, digests_end = _length_prefixed(value, signed, signed_end)
+        certificates, certificates_end = _length_prefixed(value, digests_end, signed_end)
+        entry = {'digests': {}, 'certificates': []}
+        for digest, digest_end in _length_prefixed_items(value, digests, digests_end):
+            algorithm = struct.unpack_from('<I', value, digest)[0]
+            start, stop = _length_prefixed(value, digest + 4, digest_end)
+            entry['digests'][algorithm] = bytes(value[start:stop])
+        for start, stop in _length_prefixed_items(value, certificates, certificates_end):
+            entry['certificates'].append(bytes(value[start:stop]))
+        signers.append(entry)
+    return signers
+
+
+def find_signing_block(data):
+    """(block offset, central directory offset, EOCD offset, {scheme id: value}), or None if unsigned.
+
+    data is the whole APK (bytes or mmap).
+    """
+    eocd = data.rfind(EOCD_SIGNATURE, max(len(data) - EOCD_SEARCH, 0))
+    if eocd < 0 or eocd + EOCD_SIZE > len(data):
+        return None
+    cd_offset = struct.unpack_from('<I', data, eocd + 16)[0]
+    if cd_offset < 32 or cd_offset > eocd or data[cd_offset - 16:cd_offset] != SIGNING_BLOCK_MAGIC:
+        return None
+    size = struct.unpack_from('<Q', data, cd_offset - 24)[0]
+    block = cd_offset - size - 8
+    if block < 0 or struct.unpack_from('<Q', data, block)[0] != size:
+        raise SignatureError('APK Signing Block sizes disagree')
+    values = {}
+    pos = block + 8
+    while pos < cd_offset - 24:
+        length, pair_id = struct.unpack_from('<QI', data, pos)
+        if length < 4 or pos + 8 + length > cd_offset - 24:
+            raise SignatureError('malformed APK Signing Block entry')
+        values[pair_id] = bytes(data[pos + 12:pos + 8 + length])
+        pos += 8 + length
+    return block, cd_offset, eocd, values
+
+
+def _chunk_digest(name, view, start, end):
+    digest = hashlib.new(name)
+    digest.update(b'\xa5' + (end - start).to_bytes(4, 'little'))
+    with view[start:end] as chunk:
+        digest.update(chunk)
+    return digest.digest()
+
+
+def _content_chunks(block, cd_offset, eocd):
+    """(start, end) of the 1 MB chunks of the contents and the central directory."""
+    return [(start, min(start + CONTENT_CHUNK_SIZE, section_end))
+            for section_start, section_end in ((0, block), (cd_offset, eocd))
+            for start in range(section_start, section_end, CONTENT_CHUNK_SIZE)]
+
+
+def _signature_summary(layout, v1_certificates, content_digests):
+    """Report of the schemes present, their certificates and whether the content digests match."""
+    summary = {'schemes': [], 'certificates': [], 'content_digest': None}
+    certificates = {}
+
+    def add(der, scheme):
+        info = certificates.get(der)
+        if info is None:
+            info = certificates[der] = dict(certificate_info(der), schemes=[])
+        if scheme not in info['schemes']:
+            info['schemes'].append(scheme)
+
+    if v1_certificates:
+        summary['schemes'].append('v1')
+        for der in v1_certificates:
+            add(der, 'v1')
+    for scheme, signers in (layout or {}).items():
+        summary['schemes'].append(scheme)
+        for signer in signers:
+            for der in signer['certificates']:
+                add(der, scheme)
+            for algorithm, expected in signer['digests'].items():
+                computed = content_digests.get(CHUNKED_DIGESTS.get(algorithm))
+                if computed is not None:
+                    matches = computed == expected
+                    summary['content_digest'] = matches and summary['content_digest'] is not False
+    summary['certificates'] = list(certificates.values())
+    return summary
+
+
+def _v1_certificates(fp):
+    certificates = []
+    try:
+        with zipfile.ZipFile(fp) as apk_zip:
+            signatures = [info for info in apk_zip.infolist() if V1_SIGNATURE_NAME.match(info.filename)]
+            for info in signatures[:V1_SIGNATURE_MAX_FILES]:
+                # zipfile never inflates past the declared size, so this bounds the read
+                if info.file_size > V1_SIGNATURE_MAX_BYTES:
+                    continue
+                try:
+                    certificates.extend(pkcs7_certificates(apk_zip.read(info)))
+                except (SignatureError, IndexError):
+                    continue
+    except (zipfile.BadZipFile, OSError, RuntimeError, NotImplementedError):
+        pass
+    return certificates
+
+
+def digest_apk(path, workers=None, read_v1=True):
+    """{'md5', 'sha1', 'sha256', 'signature'} of the APK at path, from one walk over the file.
+
+    signature lists the schemes present ('v1', 'v2', 'v3', 'v3.1'), every
+    signer certificate once (sha256 and sha1 fingerprints, subject and the
+    schemes using it) and content_digest: True when the v2/v3 digests match
+    the file, False when one does not, None when there is nothing to check.
+    A malformed signing block is reported as signature['error']. read_v1
+    False leaves the archive's entries alone (no v1 certificates), for
+    archives the decompression budget refuses to open.
+    """
+    hashes = [hashlib.new(name) for name in FILE_DIGESTS]
+    layout = {}
+    error = None
+    content_digests = {}
+    with open(path, 'rb') as f, ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mapped = None   # empty file
+        if mapped is None:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                for digest in hashes:
+                    digest.update(chunk)
+        else:
+            with mapped, memoryview(mapped) as view:
+                try:
+                    found = find_signing_block(mapped)
+                except (SignatureError, struct.error) as e:
+                    found, error = None, str(e)
+                algorithms = set()
+                if found is not None:
+                    block, cd_offset, eocd, values = found
+                    for pair_id, scheme in SCHEME_IDS.items():
+                        if pair_id in values:
+                            try:
+                                layout[scheme] = parse_signers(values[pair_id])
+                            except (SignatureError, struct.error) as e:
+                                error = f"{scheme}: {e}"
+                                continue
+                            algorithms.update(CHUNKED_DIGESTS[algorithm] for signer in layout[scheme]
+                                              for algorithm in signer['digests'] if algorithm in CHUNKED_DIGESTS)
+                pending = _content_chunks(block, cd_offset, eocd) if algorithms else []
+                futures = {name: [] for name in algorithms}
+                next_chunk = 0
+                for start in range(0, len(mapped), HASH_CHUNK_SIZE):
+                    end = min(start + HASH_CHUNK_SIZE, len(mapped))
+                    # Queue the content chunks of this window before hashing it
+                    while next_chunk < len(pending) and pending[next_chunk][0] < end:
+                        for name in algorithms:
+                            futures[name].append(pool.submit(_chunk_digest, name, view, *pending[next_chunk]))
+                        next_chunk += 1
+                    with view[start:end] as window:
+                        list(pool.map(lambda digest: digest.update(window), hashes))
+                if algorithms:
+                    # The EOCD (always under 1 MB) is digested with its central
+                    # directory offset pointing at the signing block instead
+                    eocd_bytes = bytearray(mapped[eocd:])
+                    struct.pack_into('<I', eocd_bytes, 16, block)
+                for name, chunk_futures in futures.items():
+                    chunks = [future.result() for future in chunk_futures]
+                    chunks.append(_chunk_digest(name, memoryview(eocd_bytes), 0, len(eocd_bytes)))
+                    top = hashlib.new(name, b'\x5a' + len(chunks).to_bytes(4, 'little'))
+                    for chunk in chunks:
+                        top.update(chunk)
+                    content_digests[name] = top.digest()
+        f.seek(0)
+        v1_certificates = _v1_certificates(f) if read_v1 else []
+    result = {name: digest.hexdigest() for name, digest in zip(FILE_DIGESTS, hashes)}
+    result['signature'] = _signature_summary(layout, v1_certificates, content_digests)
+    if error:
+        result['signature']['error'] = error
+    return result
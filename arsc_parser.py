@@ -0,0 +1,191 @@
+import struct
+from bisect import bisect_right
+
+from axml_parser import StringPool
+
+RES_STRING_POOL_TYPE = 0x0001
+RES_TABLE_TYPE = 0x0002
+RES_TABLE_PACKAGE_TYPE = 0x0200
+RES_TABLE_TYPE_TYPE = 0x0201
+RES_TABLE_TYPE_SPEC_TYPE = 0x0202
+
+NO_ENTRY = 0xFFFFFFFF
+FLAG_COMPLEX = 0x0001
+FLAG_COMPACT = 0x0008
+TYPE_FLAG_SPARSE = 0x01
+TYPE_FLAG_OFFSET16 = 0x02
+TYPE_STRING = 0x03
+
+_CHUNK_HEADER = struct.Struct('<HHI')
+# Smallest headers holding the fields read from each chunk
+PACKAGE_HEADER_SIZE = 280
+TYPE_HEADER_SIZE = 20
+TYPE_SPEC_HEADER_SIZE = 16
+
+
+class ARSCError(ValueError):
+    pass
+
+
+class ResourcePackage:
+    def __init__(self, package_id, name, type_names, keys):
+        self.id = package_id
+        self.name = name
+        self.type_names = type_names
+        self.keys = keys
+        # type id -> offsets of its ResTable_type chunks (one per configuration)
+        self.types = {}
+        # type id -> number of entries declared by its ResTable_typeSpec
+        self.entry_counts = {}
+
+
+class ResourceTable:
+    """Index over a resources.arsc image.
+
+    Building the table only walks chunk headers: packages, their type and
+    key string pools and the offset of every ResTable_type chunk. Entries,
+    keys and values (including the global string pool, which can hold
+    hundreds of thousands of strings) are decoded on demand.
+    """
+
+    def __init__(self, data):
+        if len(data) < 12 or _CHUNK_HEADER.unpack_from(data, 0)[0] != RES_TABLE_TYPE:
+            raise ARSCError('not a resource table')
+        self.data = data
+        self.strings = None
+        self.packages = []
+        _type, header_size, size = _CHUNK_HEADER.unpack_from(data, 0)
+        end = min(size, len(data))
+        pos = header_size
+        while pos + 8 <= end:
+            chunk_type, chunk_header, chunk_size = _CHUNK_HEADER.unpack_from(data, pos)
+            if chunk_size < 8 or chunk_header < 8 or pos + chunk_header > end:
+                raise ARSCError(f'bad chunk at offset {pos}')
+            if chunk_type == RES_STRING_POOL_TYPE and self.strings is None:
+                self.strings = StringPool(data, pos)
+            elif chunk_type == RES_TABLE_PACKAGE_TYPE:
+                self.packages.append(self._read_package(pos, chunk_header, min(pos + chunk_size, end)))
+            pos += chunk_size
+        if self.strings is None:
+            raise ARSCError('missing global string pool')
+
+    def _read_package(self, start, header_size, end):
+        data = self.data
+        if header_size < PACKAGE_HEADER_SIZE:
+            raise ARSCError(f'truncated package header at offset {start}')
+        package_id = struct.unpack_from('<I', data, start + 8)[0]
+        name = bytes(data[start + 12:start + 268]).decode('utf-16-le', errors='replace').split('\x00', 1)[0]
+        type_strings, _last_type, key_strings = struct.unpack_from('<III', data, start + 268)
+        package = ResourcePackage(package_id, name, StringPool(data, start + type_strings),
+                                  StringPool(data, start + key_strings))
+        pos = start + header_size
+        while pos + 8 <= end:
+            chunk_type, chunk_header, chunk_size = _CHUNK_HEADER.unpack_from(data, pos)
+            if chunk_size < 8 or chunk_header < 8 or pos + chunk_header > end:
+                raise ARSCError(f'bad chunk at offset {pos}')
+            if chunk_type == RES_TABLE_TYPE_TYPE and chunk_header < TYPE_HEADER_SIZE or (
+                    chunk_type == RES_TABLE_TYPE_SPEC_TYPE and chunk_header < TYPE_SPEC_HEADER_SIZE):
+                raise ARSCError(f'truncated type header at offset {pos}')
+            if chunk_type == RES_TABLE_TYPE_TYPE:
+                package.types.setdefault(data[pos + 8], []).append(pos)
+            elif chunk_type == RES_TABLE_TYPE_SPEC_TYPE:
+                package.entry_counts[data[pos + 8]] = struct.unpack_from('<I', data, pos + 12)[0]
+            pos += chunk_size
+        return package
+
+    def type_name(self, package, type_id):
+        return package.type_names[type_id - 1]
+
+    def config_entries(self, chunk):
+        """{entry_index: entry_offset} of one ResTable_type chunk (one configuration)."""
+        data = self.data
+        _type, header_size, _size = _CHUNK_HEADER.unpack_from(data, chunk)
+        flags = data[chunk + 9]
+        entry_count, entries_start = struct.unpack_from('<II', data, chunk + 12)
+        offsets_at = chunk + header_size
+        base = chunk + entries_start
+        if flags & TYPE_FLAG_SPARSE:
+            pairs = struct.unpack_from(f'<{2 * entry_count}H', data, offsets_at)
+            return {index: base + offset * 4 for index, offset in zip(pairs[0::2], pairs[1::2])}
+        if flags & TYPE_FLAG_OFFSET16:
+            offsets = struct.unpack_from(f'<{entry_count}H', data, offsets_at)
+            return {index: base + offset * 4 for index, offset in enumerate(offsets) if offset != 0xFFFF}
+        offsets = struct.unpack_from(f'<{entry_count}I', data, offsets_at)
+        return {index: base + offset for index, offset in enumerate(offsets) if offset != NO_ENTRY}
+
+    def entries(self, package, type_id):
+        """{entry_index: entry_offset} for every entry of the type.
+
+        Configurations are merged in table order and the walk stops as soon
+        as every entry declared by the typeSpec has been seen, which for
+        most tables means only the default configuration is read.
+        """
+        found = {}
+        expected = package.entry_counts.get(type_id)
+        for chunk in package.types.get(type_id, ()):
+            for index, entry in self.config_entries(chunk).items():
+                found.setdefault(index, entry)
+            if len(found) == expected:
+                break
+        return found
+
+    def entry_key(self, entry):
+        """Key string index of the entry at the given offset."""
+        size_or_key, flags = struct.unpack_from('<HH', self.data, entry)
+        if flags & FLAG_COMPACT:
+            return size_or_key
+        return struct.unpack_from('<I', self.data, entry + 4)[0]
+
+    def entry_value(self, entry):
+        """Decoded value of a simple entry; strings come from the global pool."""
+        size_or_key, flags = struct.unpack_from('<HH', self.data, entry)
+        if flags & FLAG_COMPACT:
+            data_type, value = flags >> 8, struct.unpack_from('<I', self.data, entry + 4)[0]
+        elif flags & FLAG_COMPLEX:
+            return None
+        else:
+            _size, _res0, data_type, value = struct.unpack_from('<HBBI', self.data, entry + size_or_key)
+        if data_type == TYPE_STRING:
+            return self.strings[value]
+        return value
+
+    def names(self, type_name):
+        """Sorted 'type/key' names of every resource of the given type."""
+        names = set()
+        for package in self.packages:
+            for type_id in package.types:
+                if self.type_name(package, type_id) != type_name:
+                    continue
+                for entry in self.entries(package, type_id).values():
+                    names.add(f"{type_name}/{package.keys[self.entry_key(entry)]}")
+        return sorted(names)
+
+    def find_strings(self, matcher, data_matcher=None):
+        """Run a MultiPatternMatcher over the raw global string pool.
+
+        Returns (rule_index, string) with the first pool string that hits
+        each rule. data_matcher is the matcher compiled for the pool's
+        encoding (UTF-8 or UTF-16LE); candidates it finds are decoded one by
+        one and confirmed with matcher, so only hit strings are decoded.
+        """
+        pool = self.strings
+        if not len(pool):
+            return []
+        data_matcher = data_matcher or matcher
+        order = {}
+        for index, offset in enumerate(pool.offsets):
+            order.setdefault(offset, index)
+        offsets = sorted(order)
+        found = {}
+        for offset, rule in data_matcher.scan(self.data[pool.strings_start:pool.strings_end]):
+            if rule in found:
+                continue
+            slot = bisect_right(offsets, offset)
+            if not slot:
+                continue
+            value = pool[order[offsets[slot - 1]]]
+            if rule in {index for _offset, index in matcher.scan(value.encode('utf-8'), first_only=True)}:
+                found[rule] = value
+                if len(found) == len(matcher.rules):
+                    break
+        return sorted(found.items())
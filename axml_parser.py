@@ -0,0 +1,226 @@
+import codecs
+import struct
+
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+
+UTF8_FLAG = 0x100
+TYPE_STRING = 0x03
+NO_INDEX = 0xFFFFFFFF
+
+# android:name / android:permission, resolved through the resource map so
+# that obfuscated attribute name strings do not hide them.
+ATTR_NAME = 0x01010003
+ATTR_PERMISSION = 0x01010006
+
+COMPONENT_TAGS = {
+    'activity': 'activities',
+    'activity-alias': 'activities',
+    'service': 'services',
+    'receiver': 'receivers',
+    'provider': 'providers',
+}
+PERMISSION_TAGS = {'uses-permission', 'uses-permission-sdk-23', 'uses-permission-sdk-m'}
+
+
+class AXMLError(ValueError):
+    pass
+
+
+class StringPool:
+    """ResStringPool chunk; the offset index is read up front, entries are
+    decoded on first access and cached."""
+
+    def __init__(self, data, offset):
+        (_type, _header_size, size, count, _style_count, flags,
+         strings_start, styles_start) = _POOL_HEADER.unpack_from(data, offset)
+        if offset + 28 + 4 * count > offset + size or offset + size > len(data):
+            raise AXMLError('string pool index out of bounds')
+        self.data = data
+        self.utf8 = bool(flags & UTF8_FLAG)
+        self.offsets = struct.unpack_from(f'<{count}I', data, offset + 28)
+        self.strings_start = offset + strings_start
+        self.strings_end = offset + (styles_start or size)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        try:
+            return self._cache[index]
+        except KeyError:
+            pass
+        value = self._decode(index) if 0 <= index < len(self.offsets) else ''
+        self._cache[index] = value
+        return value
+
+    def _decode(self, index):
+        data = self.data
+        pos = self.strings_start + self.offsets[index]
+        try:
+            if self.utf8:
+                pos += 2 if data[pos] & 0x80 else 1
+                length = data[pos]
+                if length & 0x80:
+                    length = ((length & 0x7F) << 8) | data[pos + 1]
+                    pos += 1
+                pos += 1
+                return data[pos:pos + length].decode('utf-8', errors='replace')
+            length = data[pos] | (data[pos + 1] << 8)
+            if length & 0x8000:
+                length = ((length & 0x7FFF) << 16) | data[pos + 2] | (data[pos + 3] << 8)
+                pos += 2
+            pos += 2
+            return _utf16_decode(data[pos:pos + 2 * length], 'replace')[0]
+        except IndexError:
+            return ''
+
+
+_utf16_decode = codecs.utf_16_le_decode
+_CHUNK_HEADER = struct.Struct('<HHI')
+_POOL_HEADER = struct.Struct('<HHIIIIII')
+_ELEMENT_EXT = struct.Struct('<IIHHH')
+_ATTRIBUTE = struct.Struct('<IIIHBBI')
+_U32 = struct.Struct('<I')
+_attribute_arrays = {}
+
+
+def _attribute_array(count):
+    if count not in _attribute_arrays:
+        _attribute_arrays[count] = struct.Struct('<' + 'IIIHBBI' * count)
+    return _attribute_arrays[count]
+
+
+def is_axml(data):
+    return len(data) >= 8 and _CHUNK_HEADER.unpack_from(data, 0)[:2] == (RES_XML_TYPE, 8)
+
+
+class AXMLDocument:
+    """Chunk-level view of a binary XML document.
+
+    Only the string pool index and the resource map are read up front;
+    strings are decoded when first read and attributes are only unpacked for
+    the elements a caller asks about.
+    """
+
+    def __init__(self, data):
+        data = bytes(data)
+        if not is_axml(data):
+            raise AXMLError('not a binary XML document')
+        self.data = data
+        self.strings = None
+        self.resource_map = ()
+        self._body = 8
+        pos = 8
+        while pos + 8 <= len(data):
+            chunk_type, header_size, size = _CHUNK_HEADER.unpack_from(data, pos)
+            if chunk_type == RES_STRING_POOL_TYPE:
+                self.strings = StringPool(data, pos)
+            elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+                count = (min(pos + size, len(data)) - pos - header_size) // 4
+                self.resource_map = struct.unpack_from(f'<{count}I', data, pos + header_size)
+            else:
+                break
+            pos += max(size, 8)
+        if self.strings is None:
+            raise AXMLError('missing string pool')
+        self._body = pos
+
+    def iter_elements(self):
+        """Yield (tag, element_offset) for every start element, in document order."""
+        data = self.data
+        strings = self.strings
+        end = len(data)
+        pos = self._body
+        unpack_header = _CHUNK_HEADER.unpack_from
+        while pos + 8 <= end:
+            chunk_type, header_size, size = unpack_header(data, pos)
+            if size < 8 or header_size < 8:
+                raise AXMLError(f'bad chunk at offset {pos}')
+            if chunk_type == RES_XML_START_ELEMENT_TYPE and pos + header_size + 20 <= end:
+                ext = pos + header_size
+                yield strings[_U32.unpack_from(data, ext + 4)[0]], ext
+            pos += size
+
+    def attributes(self, element):
+        """Map each attribute's resource id (or its name, when it has none) to
+        a raw (raw_value, data_type, data) tuple; pass those to value()."""
+        data = self.data
+        resource_map = self.resource_map
+        _ns, _name, attr_start, attr_size, attr_count = _ELEMENT_EXT.unpack_from(data, element)
+        attributes = {}
+        try:
+            if attr_size == _ATTRIBUTE.size:
+                fields = _attribute_array(attr_count).unpack_from(data, element + attr_start)
+            else:
+                fields = ()
+                for index in range(attr_count):
+                    fields += _ATTRIBUTE.unpack_from(data, element + attr_start + index * attr_size)
+        except struct.error:
+            raise AXMLError(f'truncated element at offset {element}')
+        for index in range(0, len(fields), 7):
+            attr_name = fields[index + 1]
+            raw = (fields[index + 2], fields[index + 5], fields[index + 6])
+            if attr_name < len(resource_map) and resource_map[attr_name]:
+                attributes[resource_map[attr_name]] = raw
+            else:
+                attributes[self.strings[attr_name]] = raw
+        return attributes
+
+    def value(self, raw):
+        raw_value, data_type, value = raw
+        if raw_value != NO_INDEX:
+            return self.strings[raw_value]
+        if data_type == TYPE_STRING:
+            return self.strings[value]
+        return str(value)
+
+
+def parse_manifest(data):
+    """Parse a binary AndroidManifest.xml into the analyzer's manifest dict.
+
+    'permissions' holds requested permissions followed by any permission
+    guarding a component (e.g. BIND_ACCESSIBILITY_SERVICE on a service),
+    without duplicates. Class names starting with '.' are qualified with the
+    package name.
+    """
+    analysis = {
+        'package': None,
+        'permissions': [],
+        'activities': [],
+        'services': [],
+        'receivers': [],
+        'providers': [],
+        'features': []
+    }
+    document = AXMLDocument(data)
+    value = document.value
+    guarded = []
+    package = ''
+    for tag, element in document.iter_elements():
+        key = COMPONENT_TAGS.get(tag)
+        if key is not None:
+            attributes = document.attributes(element)
+            if ATTR_NAME in attributes:
+                name = value(attributes[ATTR_NAME])
+                analysis[key].append(package + name if name[:1] == '.' else name)
+            if ATTR_PERMISSION in attributes:
+                guarded.append(value(attributes[ATTR_PERMISSION]))
+        elif tag in PERMISSION_TAGS or tag == 'uses-feature':
+            attributes = document.attributes(element)
+            if ATTR_NAME in attributes:
+                key = 'features' if tag == 'uses-feature' else 'permissions'
+                analysis[key].append(value(attributes[ATTR_NAME]))
+        elif tag == 'application':
+            attributes = document.attributes(element)
+            if ATTR_PERMISSION in attributes:
+                guarded.append(value(attributes[ATTR_PERMISSION]))
+        elif tag == 'manifest':
+            attributes = document.attributes(element)
+            if 'package' in attributes:
+                package = analysis['package'] = value(attributes['package'])
+    analysis['permissions'] = list(dict.fromkeys(analysis['permissions'] + guarded))
+    return analysis
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Headless batch analysis: one JSON line per APK.
+
+    python batch.py samples/ 'more/**/*.apk' -j 8 -o results.jsonl --resume
+"""
+
+import argparse
+import copy
+import glob
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from analyzer import analyze_apk, detect_malicious_behavior, open_cache
+from instrument import Instrumentation, JsonLinesSink
+from ioc import DomainBlocklist
+from result_cache import DEFAULT_CACHE_PATH
+from similarity import SimilarityIndex, sample_label
+from triage import add_policy_arguments, policy_from_arguments, triage
+
+_cache = None
+_entry_workers = 1
+_image_store = None
+_profile_dir = None
+_trace_memory = False
+_stage_log = None
+_blocklist = None
+_similarity = None
+_triage = None
+
+
+def find_apks(patterns):
+    """Sorted, de-duplicated APK paths from files, directories (recursive) and globs."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                paths.update(os.path.join(root, f) for f in files if f.lower().endswith('.apk'))
+        elif glob.has_magic(pattern):
+            paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+        elif os.path.isfile(pattern):
+            paths.add(pattern)
+    return sorted({os.path.normpath(p) for p in paths})
+
+
+def completed_apks(output_path):
+    """APK paths already recorded in an earlier (possibly interrupted) run."""
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['apk'])
+            except (ValueError, KeyError, TypeError):
+                continue    # truncated last line of an interrupted run
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _init_worker(cache_path, entry_workers=1, image_store=None, profile_dir=None, ioc_feeds=(),
+                 similarity_path=None, triage_policy=None, trace_memory=False, stage_log=None):
+    global _cache, _entry_workers, _image_store, _profile_dir, _blocklist, _similarity, _triage
+    global _trace_memory, _stage_log
+    if cache_path:
+        _cache = open_cache(cache_path)
+    if similarity_path:
+        _similarity = SimilarityIndex(similarity_path)
+    if ioc_feeds:
+        _blocklist = DomainBlocklist()
+        for path in ioc_feeds:
+            _blocklist.load(path)
+    _entry_workers = entry_workers
+    _image_store = image_store
+    _profile_dir = profile_dir
+    _triage = triage_policy
+    _trace_memory = trace_memory
+    _stage_log = stage_log
+
+
+def sample_name(apk_path):
+    """<stem>_<hash of the absolute path>, unique per input file."""
+    stem = os.path.splitext(os.path.basename(apk_path))[0]
+    tag = hashlib.sha1(os.path.abspath(apk_path).encode('utf-8')).hexdigest()[:8]
+    return f'{stem}_{tag}'
+
+
+def image_dirs(image_store, apk_path):
+    """(per-APK manifest directory, shared payload store) inside image_store."""
+    return (os.path.join(image_store, 'samples', sample_name(apk_path)),
+            os.path.join(image_store, 'objects'))
+
+
+def analyze_one(apk_path, progress=None, sinks=(), report=None, deep=False, label=None):
+    """Full record for one APK; failures are reported in 'error' rather than raised.
+
+    progress and sinks are handed to the run's Instrumentation, along with
+    a JsonLinesSink for the stage log when one is set. With a
+    triage policy the record also has 'triage' (verdict, tier, reason) and
+    only the stages the tiers ran; report and deep are passed on to
+    triage.triage (deep forcing the full scan for this APK). label names
+    the sample in the similarity index (see similarity.sample_label).
+    """
+    record = {'apk': apk_path}
+    start = time.perf_counter()
+    profile_path = None
+    if _profile_dir:
+        os.makedirs(_profile_dir, exist_ok=True)
+        profile_path = os.path.join(_profile_dir, sample_name(apk_path) + '.prof')
+    sinks = list(sinks)
+    if _stage_log:
+        sinks.append(JsonLinesSink(_stage_log, {'apk': apk_path}))
+    instrument = Instrumentation(sinks, progress, profile_path, _trace_memory)
+    try:
+        with instrument:
+            image_dir = store_dir = None
+            if _image_store:
+                image_dir, store_dir = image_dirs(_image_store, apk_path)
+            if _triage is not None:
+                policy = _triage
+                if deep and not policy.deep:
+                    policy = copy.copy(policy)
+                    policy.deep = True
+                result = triage(apk_path, policy, _cache, report, _entry_workers, instrument, _blocklist,
+                                image_dir, store_dir)
+                stages, findings = result['stages'], result['findings']
+                record['triage'] = {key: result[key] for key in ('verdict', 'tier', 'reason')}
+            else:
+                stages = analyze_apk(apk_path, image_dir, _cache, _entry_workers, store_dir, instrument)
+                with instrument.stage('detection'):
+                    findings = detect_malicious_behavior(stages['manifest'], stages['code'], stages['resources'],
+                                                         stages['budget'], stages['structure'], _blocklist,
+                                                         stages['native'], stages['identity'])
+        record['stages'] = stages
+        record['findings'] = findings
+        if _similarity is not None and stages.get('fingerprint') is not None:
+            matches = _similarity.query_and_add(stages['identity']['sha256'], stages['fingerprint'],
+                                                sample_label(apk_path, stages, label))
+            record['similar'] = [{'sample': sample, 'label': label, 'similarity': round(score, 3)}
+                                 for score, sample, label in matches]
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['timings'] = {stats.pop('stage'): stats for stats in instrument.records()}
+    record['timings']['total'] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def _write_records(records, out):
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+
+
+def _pool_record(future, apk_path):
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        return {'apk': apk_path, 'error': f"{type(e).__name__}: {e}"}
+
+
+def _run_pool(apks, out, jobs, initargs):
+    """analyze_one over apks on jobs worker processes, writing records as they complete.
+
+    Each worker holds one APK at a time. A worker that dies (killed for
+    memory, a crash in native code) breaks the pool: the APKs it held are
+    recorded as errors and a new pool takes the rest.
+    """
+    remaining = iter(apks)
+    running = {}
+    pool = None
+    try:
+        while True:
+            if pool is None:
+                pool = ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=initargs)
+            for apk_path in itertools.islice(remaining, jobs - len(running)):
+                running[pool.submit(analyze_one, apk_path)] = apk_path
+            if not running:
+                return
+            done, _pending = wait(running, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                # Everything still on the pool ends with it
+                done = wait(running)[0]
+                pool.shutdown(wait=False)
+                pool = None
+            _write_records([_pool_record(future, running.pop(future)) for future in done], out)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def run(apks, out, jobs, cache_path, entry_workers=1, image_store=None, profile_dir=None, ioc_feeds=(),
+        similarity_path=None, triage_policy=None, trace_memory=False, stage_log=None):
+    """Analyse apks on a pool of jobs processes, writing each record to out as it completes.
+
+    With a single job the APKs are analysed in this process, which lets
+    entry_workers spread the entries of each APK over a pool instead. A
+    triage.TriagePolicy switches to tiered triage (see triage.triage).
+    """
+    if jobs == 1:
+        _init_worker(cache_path, entry_workers, image_store, profile_dir, ioc_feeds, similarity_path,
+                     triage_policy, trace_memory, stage_log)
+        _write_records(map(analyze_one, apks), out)
+        return
+    _run_pool(apks, out, jobs, (cache_path, 1, image_store, profile_dir, ioc_feeds, similarity_path,
+                                triage_policy, trace_memory, stage_log))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量分析 APK，每个 APK 输出一行 JSON')
+    parser.add_argument('paths', nargs='+', help='APK 文件、目录或通配符')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='并行进程数')
+    parser.add_argument('-o', '--output', help='输出 .jsonl 文件（默认标准输出）')
+    parser.add_argument('--resume', action='store_true', help='跳过输出文件中已有结果的 APK')
+    parser.add_argument('--cache', help='结果缓存路径（默认 ~/.cache/apk_analyzer/results.sqlite）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用结果缓存')
+    parser.add_argument('--image-store', help='导出图片到共享的内容寻址目录（相同图片只保存一份）')
+    parser.add_argument('--ioc', action='append', default=[], metavar='FILE',
+                        help='恶意域名情报（每行一个域名，支持 *.example.com），可多次指定')
+    parser.add_argument('--similarity-index', metavar='FILE',
+                        help='相似样本索引（SQLite）；每个 APK 先与已有样本比对，再加入索引')
+    parser.add_argument('--profile-dir', help='为每个 APK 保存 cProfile 数据（.prof）到此目录')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='用 tracemalloc 记录各阶段峰值内存（timings 中的 peak_memory，分析会变慢）')
+    parser.add_argument('--stage-log', metavar='FILE', help='每个阶段的统计追加一行 JSON 到此文件')
+    parser.add_argument('--entry-workers', type=int, default=1,
+                        help='单个 APK 内并行扫描的进程数（仅 -j 1 时可用，适合少量超大 APK）')
+    add_policy_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.resume and not args.output:
+        parser.error('--resume 需要同时指定 --output')
+    if args.jobs < 1:
+        parser.error('--jobs 必须大于 0')
+    if args.entry_workers > 1 and args.jobs > 1:
+        parser.error('--entry-workers 只能与 -j 1 同时使用')
+
+    apks = find_apks(args.paths)
+    if args.resume:
+        done = completed_apks(args.output)
+        apks = [apk for apk in apks if apk not in done]
+    if not apks:
+        print('没有需要分析的 APK', file=sys.stderr)
+        return 0
+
+    cache_path = None if args.no_cache else (args.cache or DEFAULT_CACHE_PATH)
+    triage_policy = policy_from_arguments(args)
+
+    print(f'分析 {len(apks)} 个 APK，{args.jobs} 个进程', file=sys.stderr)
+    if args.output:
+        with open(args.output, 'a' if args.resume else 'w', encoding='utf-8') as out:
+            if out.tell() and not _ends_with_newline(args.output):
+                out.write('\n')
+            run(apks, out, args.jobs, cache_path, args.entry_workers, args.image_store,
+                args.profile_dir, args.ioc, args.similarity_index, triage_policy, args.trace_memory,
+                args.stage_log)
+    else:
+        run(apks, sys.stdout, args.jobs, cache_path, args.entry_workers, args.image_store,
+            args.profile_dir, args.ioc, args.similarity_index, triage_policy, args.trace_memory,
+            args.stage_log)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Benchmarks for analyzer.py with regression thresholds.
+
+Each benchmark runs in a fresh subprocess so its peak RSS is its own;
+the best of --repeat runs is kept. The APK is generated in a subprocess
+too: Linux carries a process's peak RSS into the children it forks, so
+generating in this process would set a floor under every measurement. Results are compared with
+baseline.json (per preset and benchmark) and the run fails when a time or
+peak RSS exceeds the baseline by more than the tolerance (and, for times,
+by more than --min-delta seconds, so sub-millisecond noise is ignored).
+Throughput is the APK's total uncompressed size over the benchmark time.
+
+    python benchmarks/run_benchmarks.py --preset small --preset medium
+    python benchmarks/run_benchmarks.py --save-baseline     # after an accepted change
+
+Baselines are machine-specific; regenerate them on the machine that runs
+the comparison.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from synth_apk import PRESETS, make_apk  # noqa: E402
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+BENCHMARKS = [
+    'extract_apk_completely',
+    'analyze_file_structure',
+    'extract_all_images',
+    'analyze_android_manifest',
+    'analyze_code_files',
+    'analyze_resource_files',
+    'analyze_native_libraries',
+    'create_comprehensive_zip',
+    'pipeline',
+]
+
+
+def _peak_rss():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_one(name, apk_path, workdir):
+    """Child side: set up, time one benchmark and print its measurements as JSON."""
+    import analyzer
+
+    extract_dir = None
+    if name not in ('extract_apk_completely', 'create_comprehensive_zip', 'pipeline'):
+        extract_dir, _files = analyzer.extract_apk_completely(apk_path, os.path.join(workdir, 'extract'))
+    with zipfile.ZipFile(apk_path) as apk:
+        files = [(info.filename, info.file_size) for info in apk.infolist()]
+
+    start = time.perf_counter()
+    if name == 'extract_apk_completely':
+        analyzer.extract_apk_completely(apk_path, os.path.join(workdir, 'extract'))
+    elif name == 'analyze_file_structure':
+        analyzer.analyze_file_structure(extract_dir)
+    elif name == 'extract_all_images':
+        analyzer.extract_all_images(extract_dir, os.path.join(workdir, 'images'))
+    elif name == 'analyze_android_manifest':
+        analyzer.analyze_android_manifest(extract_dir)
+    elif name == 'analyze_code_files':
+        analyzer.analyze_code_files(extract_dir)
+    elif name == 'analyze_resource_files':
+        analyzer.analyze_resource_files(extract_dir)
+    elif name == 'analyze_native_libraries':
+        analyzer.analyze_native_libraries(extract_dir)
+    elif name == 'create_comprehensive_zip':
+        analyzer.create_comprehensive_zip(apk_path, None, 'overview', 'details', files,
+                                          output_dir=workdir, apk_images=True)
+    elif name == 'pipeline':
+        stages = analyzer.analyze_apk(apk_path)
+        findings = analyzer.detect_malicious_behavior(stages['manifest'], stages['code'], stages['resources'],
+                                                      stages['budget'], stages['structure'],
+                                                      native_analysis=stages['native'],
+                                                      identity=stages['identity'])
+        analyzer.create_comprehensive_zip(apk_path, None, '\n'.join(findings), '', stages['files'],
+                                          output_dir=workdir, apk_images=True)
+        if not any(finding.startswith('危险API') for finding in findings):
+            raise SystemExit('pipeline missed the planted dangerous API calls')
+        if not any(finding.startswith('危险API') and '.so)' in finding for finding in findings):
+            raise SystemExit('pipeline missed the planted native imports')
+    else:
+        raise SystemExit(f'unknown benchmark {name}')
+    seconds = time.perf_counter() - start
+    print(json.dumps({'seconds': seconds, 'peak_rss': _peak_rss()}))
+
+
+def measure(name, apk_path, repeat):
+    best = None
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix='apk_bench_')
+        try:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, apk_path, workdir],
+                                    check=True, capture_output=True, text=True).stdout
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None:
+            best = result
+        else:
+            best = {'seconds': min(best['seconds'], result['seconds']),
+                    'peak_rss': min(best['peak_rss'], result['peak_rss'])}
+    return best
+
+
+def compare(results, baseline, tolerance, rss_tolerance, min_delta):
+    """Lines describing every measurement that regressed past the baseline."""
+    failures = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['seconds'] > max(base['seconds'] * (1 + tolerance), base['seconds'] + min_delta):
+            failures.append(f"{key}: {result['seconds']:.3f}s > 基线 {base['seconds']:.3f}s")
+        if result['peak_rss'] > base['peak_rss'] * (1 + rss_tolerance):
+            failures.append(f"{key}: 峰值内存 {result['peak_rss'] >> 20} MB > 基线 {base['peak_rss'] >> 20} MB")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='analyzer.py 基准测试')
+    parser.add_argument('--preset', action='append', choices=sorted(PRESETS), help='默认 small')
+    parser.add_argument('--only', action='append', choices=BENCHMARKS, help='只运行指定基准')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许的耗时回退比例')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='小于该秒数的耗时差异视为噪声')
+    parser.add_argument('--rss-tolerance', type=float, default=0.25, help='允许的峰值内存回退比例')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写入基线')
+    parser.add_argument('--child', nargs=3, metavar=('NAME', 'APK', 'WORKDIR'), help=argparse.SUPPRESS)
+    parser.add_argument('--make', nargs=2, metavar=('PRESET', 'APK'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_one(*args.child)
+        return 0
+    if args.make:
+        make_apk(args.make[1], **PRESETS[args.make[0]])
+        return 0
+
+    results = {}
+    apk_dir = tempfile.mkdtemp(prefix='apk_bench_src_')
+    try:
+        for preset in args.preset or ['small']:
+            apk_path = os.path.join(apk_dir, f'{preset}.apk')
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--make', preset, apk_path], check=True)
+            with zipfile.ZipFile(apk_path) as apk:
+                megabytes = sum(info.file_size for info in apk.infolist()) / (1 << 20)
+            for name in args.only or BENCHMARKS:
+                result = measure(name, apk_path, args.repeat)
+                results[f'{preset}/{name}'] = result
+                print(f"{preset:<7} {name:<26} {result['seconds']:>8.3f}s "
+                      f"{megabytes / result['seconds']:>9.1f} MB/s {result['peak_rss'] >> 20:>6} MB")
+    finally:
+        shutil.rmtree(apk_dir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f'基线已保存: {args.baseline}')
+        return 0
+
+    failures = compare(results, baseline, args.tolerance, args.rss_tolerance, args.min_delta)
+    for failure in failures:
+        print(f'性能回退: {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
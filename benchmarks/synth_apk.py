@@ -0,0 +1,296 @@
+"""Synthetic APK generator for the benchmarks.
+
+Builds archives with the shape of real APKs: a binary AndroidManifest.xml,
+multidex classes*.dex with real id tables, a resources.arsc, ELF native
+libraries with dynamic symbol tables, density-variant images and assets,
+with rule hits planted at known places. Output is deterministic for a
+given seed.
+"""
+
+import random
+import struct
+import zipfile
+
+ANDROID_NS = 'http://schemas.android.com/apk/res/android'
+ATTR_IDS = [('name', 0x01010003), ('permission', 0x01010006)]
+
+PLANTED_PERMISSIONS = ['android.permission.SYSTEM_ALERT_WINDOW', 'android.permission.BIND_ACCESSIBILITY_SERVICE']
+PLANTED_APIS = [('Ljava/lang/Runtime;', 'exec'), ('Landroid/telephony/SmsManager;', 'sendTextMessage')]
+PLANTED_TEXT = [b'lockNow', b'accessibility', b'Runtime.getRuntime', b'killProcess', b'http://lock.example.com/pay']
+PLANTED_IMPORTS = ['system', 'ptrace']
+
+WORDS = [b'android', b'view', b'layout', b'string', b'value', b'config', b'module', b'service', b'item',
+         b'data', b'cache', b'event', b'handler', b'color', b'style', b'theme', b'text', b'width']
+DENSITIES = ['mdpi', 'hdpi', 'xhdpi', 'xxhdpi', 'xxxhdpi']
+
+PRESETS = {
+    'small': dict(entries=300, dex_count=1, dex_size=1 << 20, so_count=1, so_size=1 << 20, images=60),
+    'medium': dict(entries=2000, dex_count=2, dex_size=4 << 20, so_count=2, so_size=8 << 20, images=400),
+    'large': dict(entries=10000, dex_count=3, dex_size=16 << 20, so_count=4, so_size=32 << 20, images=2000),
+}
+
+
+def _uleb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _string_pool(strings, utf8=False):
+    offsets = []
+    body = bytearray()
+    for value in strings:
+        offsets.append(len(body))
+        if utf8:
+            encoded = value.encode('utf-8')
+            body += bytes([len(value), len(encoded)]) + encoded + b'\0'
+        else:
+            body += struct.pack('<H', len(value)) + value.encode('utf-16-le') + b'\0\0'
+    while len(body) % 4:
+        body += b'\0'
+    start = 28 + 4 * len(strings)
+    return (struct.pack('<HHIIIIII', 0x0001, 28, start + len(body), len(strings), 0,
+                        0x100 if utf8 else 0, start, 0)
+            + struct.pack(f'<{len(strings)}I', *offsets) + bytes(body))
+
+
+def binary_manifest(package, permissions, activities, services):
+    """Binary AndroidManifest.xml with android:name resolved through the resource map."""
+    strings = [name for name, _id in ATTR_IDS] + ['android', ANDROID_NS, 'package']
+    index = {value: i for i, value in enumerate(strings)}
+
+    def ref(value):
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    body = bytearray(struct.pack('<HHIIIII', 0x0100, 16, 24, 1, 0xFFFFFFFF, ref('android'), ref(ANDROID_NS)))
+
+    def start(tag, attrs):
+        packed = b''.join(struct.pack('<IIIHBBI', ns, ref(name), ref(value), 8, 0, 0x03, ref(value))
+                          for ns, name, value in attrs)
+        ext = struct.pack('<IIHHHHHH', 0xFFFFFFFF, ref(tag), 20, 20, len(attrs), 0, 0, 0)
+        body.extend(struct.pack('<HHIII', 0x0102, 16, 16 + len(ext) + len(packed), 1, 0xFFFFFFFF) + ext + packed)
+
+    def end(tag):
+        body.extend(struct.pack('<HHIIIII', 0x0103, 16, 24, 1, 0xFFFFFFFF, 0xFFFFFFFF, ref(tag)))
+
+    android = ref(ANDROID_NS)
+    start('manifest', [(0xFFFFFFFF, 'package', package)])
+    for permission in permissions:
+        start('uses-permission', [(android, 'name', permission)])
+        end('uses-permission')
+    start('application', [])
+    for tag, names in (('activity', activities), ('service', services)):
+        for name in names:
+            start(tag, [(android, 'name', name)])
+            end(tag)
+    end('application')
+    end('manifest')
+    pool = _string_pool(strings)
+    resource_map = struct.pack('<HHI', 0x0180, 8, 8 + 4 * len(ATTR_IDS)) + b''.join(
+        struct.pack('<I', res_id) for _name, res_id in ATTR_IDS)
+    return struct.pack('<HHI', 0x0003, 8, 8 + len(pool) + len(resource_map) + len(body)) + pool + resource_map + body
+
+
+def dex_file(methods, rng, size):
+    """Dex with sorted string/type/method id tables referencing methods, padded to about size bytes."""
+    strings = {'V'} | {name for pair in methods for name in pair}
+    strings |= {f'Lcom/synth/C{i};' for i in range(64)}
+    strings = sorted(strings)
+    string_index = {value: i for i, value in enumerate(strings)}
+    types = sorted({cls for cls, _name in methods} | {'V'} | {s for s in strings if s.startswith('Lcom/')},
+                   key=string_index.__getitem__)
+    type_index = {value: i for i, value in enumerate(types)}
+    method_ids = sorted({(type_index[cls], string_index[name]) for cls, name in methods})
+
+    string_ids_off = 0x70
+    type_ids_off = string_ids_off + 4 * len(strings)
+    proto_ids_off = type_ids_off + 4 * len(types)
+    method_ids_off = proto_ids_off + 12
+    data_off = method_ids_off + 8 * len(method_ids)
+    string_data = bytearray()
+    offsets = []
+    for value in strings:
+        offsets.append(data_off + len(string_data))
+        string_data += _uleb128(len(value)) + value.encode('utf-8') + b'\0'
+    padding = max(size - data_off - len(string_data), 0)
+    string_data += _filler(rng, padding)
+
+    header = bytearray(b'dex\n035\0' + bytes(0x70 - 8))
+    struct.pack_into('<I', header, 32, data_off + len(string_data))
+    struct.pack_into('<I', header, 36, 0x70)
+    struct.pack_into('<I', header, 40, 0x12345678)
+    struct.pack_into('<10I', header, 56, len(strings), string_ids_off, len(types), type_ids_off,
+                     1, proto_ids_off, 0, 0, len(method_ids), method_ids_off)
+    return (bytes(header) + struct.pack(f'<{len(offsets)}I', *offsets)
+            + struct.pack(f'<{len(types)}I', *(string_index[t] for t in types))
+            + struct.pack('<III', string_index['V'], type_index['V'], 0)
+            + b''.join(struct.pack('<HHI', cls, 0, name) for cls, name in method_ids)
+            + bytes(string_data))
+
+
+def resource_table(strings, package='com.synth'):
+    """resources.arsc with one 'string' type whose entries point at strings."""
+    global_pool = _string_pool(strings, utf8=True)
+    keys = [f'str_{i}' for i in range(len(strings))]
+    type_pool = _string_pool(['string'])
+    key_pool = _string_pool(keys, utf8=True)
+    count = len(strings)
+    spec = struct.pack('<HHIBBHI', 0x0202, 16, 16 + 4 * count, 1, 0, 0, count) + bytes(4 * count)
+    entries = b''.join(struct.pack('<HHIHBBI', 8, 0, i, 8, 0, 0x03, i) for i in range(count))
+    header_size = 20 + 64
+    entries_start = header_size + 4 * count
+    type_chunk = (struct.pack('<HHIBBHII', 0x0201, header_size, entries_start + len(entries), 1, 0, 0,
+                              count, entries_start)
+                  + struct.pack('<I', 64) + bytes(60)
+                  + struct.pack(f'<{count}I', *(16 * i for i in range(count))) + entries)
+    header_size = 288
+    name = package.encode('utf-16-le').ljust(256, b'\0')
+    package_chunk = (struct.pack('<HHII', 0x0200, header_size,
+                                 header_size + len(type_pool) + len(key_pool) + len(spec) + len(type_chunk), 0x7F)
+                     + name + struct.pack('<IIIII', header_size, 0, header_size + len(type_pool), 0, 0)
+                     + type_pool + key_pool + spec + type_chunk)
+    return struct.pack('<HHII', 0x0002, 12, 12 + len(global_pool) + len(package_chunk), 1) + global_pool + package_chunk
+
+
+def elf_library(soname, needed, imports, exports, rng, size):
+    """ELF64 AArch64 shared object with a real .dynsym/.dynstr/.dynamic, padded to about size bytes.
+
+    imports are undefined functions and exports functions defined in .text;
+    the one PT_LOAD maps the whole file at address 0, so offsets are addresses.
+    """
+    names = [soname] + needed + imports + exports
+    dynstr = bytearray(b'\0')
+    offsets = {}
+    for name in names:
+        offsets[name] = len(dynstr)
+        dynstr += name.encode() + b'\0'
+    shstrtab = bytearray(b'\0')
+    section_names = {}
+    for name in ('.dynsym', '.dynstr', '.dynamic', '.text', '.shstrtab'):
+        section_names[name] = len(shstrtab)
+        shstrtab += name.encode() + b'\0'
+
+    dynsym_off = 64 + 2 * 56
+    symbols = [struct.pack('<IBBHQQ', 0, 0, 0, 0, 0, 0)]
+    symbols += [struct.pack('<IBBHQQ', offsets[name], 0x12, 0, 0, 0, 0) for name in imports]
+    dynstr_off = dynsym_off + 24 * (1 + len(imports) + len(exports))
+    dynamic_off = (dynstr_off + len(dynstr) + 7) & ~7
+    dynamic = [(1, offsets[name]) for name in needed] + [(14, offsets[soname]), (5, dynstr_off),
+                                                         (6, dynsym_off), (10, len(dynstr)), (11, 24), (0, 0)]
+    text_off = dynamic_off + 16 * len(dynamic)
+    text = _filler(rng, max(size - text_off, 64), text_ratio=0.2)
+    # Exports are defined in .text, section 4
+    symbols += [struct.pack('<IBBHQQ', offsets[name], 0x12, 0, 4, text_off + 16 * i, 16)
+                for i, name in enumerate(exports)]
+    shstrtab_off = text_off + len(text)
+    shoff = (shstrtab_off + len(shstrtab) + 7) & ~7
+    file_end = shoff + 6 * 64
+
+    header = (b'\x7fELF' + bytes([2, 1, 1, 0]) + bytes(8)
+              + struct.pack('<HHIQQQIHHHHHH', 3, 183, 1, 0, 64, shoff, 0, 64, 56, 2, 64, 6, 5))
+    segments = (struct.pack('<IIQQQQQQ', 1, 5, 0, 0, 0, file_end, file_end, 0x1000)
+                + struct.pack('<IIQQQQQQ', 2, 6, dynamic_off, dynamic_off, dynamic_off,
+                              16 * len(dynamic), 16 * len(dynamic), 8))
+    sections = bytes(64) + b''.join(struct.pack('<IIQQQQIIQQ', *fields) for fields in [
+        (section_names['.dynsym'], 11, 2, dynsym_off, dynsym_off, 24 * len(symbols), 2, 1, 8, 24),
+        (section_names['.dynstr'], 3, 2, dynstr_off, dynstr_off, len(dynstr), 0, 0, 1, 0),
+        (section_names['.dynamic'], 6, 3, dynamic_off, dynamic_off, 16 * len(dynamic), 2, 0, 8, 16),
+        (section_names['.text'], 1, 6, text_off, text_off, len(text), 0, 0, 16, 0),
+        (section_names['.shstrtab'], 3, 0, 0, shstrtab_off, len(shstrtab), 0, 0, 1, 0),
+    ])
+    image = bytearray(header + segments + b''.join(symbols))
+    image += bytes(dynstr)
+    image += bytes(dynamic_off - len(image))
+    image += b''.join(struct.pack('<qQ', tag, value) for tag, value in dynamic)
+    image += text + bytes(shstrtab)
+    image += bytes(shoff - len(image))
+    return bytes(image + sections)
+
+
+def _filler(rng, size, text_ratio=0.5):
+    """size bytes, roughly half word-like (compressible) and half random."""
+    text_size = int(size * text_ratio)
+    words = []
+    length = 0
+    while length < text_size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return (b' '.join(words)[:text_size] + rng.randbytes(size - text_size))[:size]
+
+
+def _sizes(rng, count, median):
+    """Log-normally distributed entry sizes around median."""
+    return [max(16, int(rng.lognormvariate(0, 1.2) * median)) for _ in range(count)]
+
+
+def make_apk(path, entries=300, dex_count=1, dex_size=1 << 20, so_count=1, so_size=1 << 20, images=60,
+             asset_median=2048, planted=True, seed=1):
+    """Write a synthetic APK to path and return a dict describing what was planted."""
+    rng = random.Random(seed)
+    expected = {'permissions': [], 'apis': [], 'text_files': [], 'native_imports': {}}
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as apk:
+        permissions = ['android.permission.INTERNET'] + (PLANTED_PERMISSIONS if planted else [])
+        expected['permissions'] = permissions[1:]
+        apk.writestr('AndroidManifest.xml', binary_manifest(
+            'com.synth.app', permissions,
+            [f'.ui.Activity{i}' for i in range(20)], ['.core.SyncService']))
+
+        for index in range(dex_count):
+            name = 'classes.dex' if index == 0 else f'classes{index + 1}.dex'
+            methods = [(f'Lcom/synth/C{i};', f'm{i}') for i in range(64)]
+            if planted and index == dex_count - 1:
+                methods += PLANTED_APIS
+                expected['apis'] = list(PLANTED_APIS)
+            apk.writestr(name, dex_file(methods, rng, dex_size))
+
+        strings = [f'label {i}' for i in range(500)]
+        if planted:
+            strings[250] = 'Tap to unlock the screen'
+        apk.writestr(zipfile.ZipInfo('resources.arsc', (2008, 1, 1, 0, 0, 0)), resource_table(strings))
+
+        for index in range(so_count):
+            name = f'libsynth{index}.so'
+            imports = ['malloc', 'free'] + (PLANTED_IMPORTS if planted and index == 0 else [])
+            if planted and index == 0:
+                expected['native_imports'][f'lib/arm64-v8a/{name}'] = sorted(PLANTED_IMPORTS)
+            library = elf_library(name, ['libc.so', 'liblog.so'], imports,
+                                  ['JNI_OnLoad', f'Java_com_synth_Native_run{index}'], rng, so_size)
+            apk.writestr(zipfile.ZipInfo(f'lib/arm64-v8a/{name}', (2008, 1, 1, 0, 0, 0)), library)
+
+        # Every payload exists in several densities, as launcher icons and drawables do
+        for index in range(images // len(DENSITIES) + 1):
+            payload = b'\x89PNG\r\n\x1a\n' + rng.randbytes(rng.randint(200, 12000))
+            for density in DENSITIES[:min(len(DENSITIES), images - index * len(DENSITIES))]:
+                info = zipfile.ZipInfo(f'res/drawable-{density}/img{index}.png', (2008, 1, 1, 0, 0, 0))
+                apk.writestr(info, payload)
+
+        remaining = max(entries - dex_count - so_count - images - 2, 0)
+        for index, size in enumerate(_sizes(rng, remaining, asset_median)):
+            data = bytearray(_filler(rng, size))
+            if planted and index % 50 == 0:
+                marker = PLANTED_TEXT[(index // 50) % len(PLANTED_TEXT)]
+                position = rng.randrange(max(len(data) - len(marker), 1))
+                data[position:position + len(marker)] = marker
+                expected['text_files'].append(f'assets/data/f{index}.txt')
+            apk.writestr(f'assets/data/f{index}.txt', bytes(data))
+    return expected
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='生成用于基准测试的合成 APK')
+    parser.add_argument('output')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    make_apk(args.output, seed=args.seed, **PRESETS[args.preset])
@@ -5,9 +5,10 @@ package.domain = org.test
 
 source.dir = .
 source.include_exts = py,png,jpg,kv
+source.exclude_dirs = benchmarks, tests
 
 version = 2.0
-requirements = python3,kivy
+requirements = python3,kivy,sqlite3
 
 # Use sdl2 bootstrap for Kivy apps on Android
 bootstrap = sdl2
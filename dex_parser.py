@@ -0,0 +1,151 @@
+import struct
+
+DEX_MAGIC = b'dex\n'
+
+DANGEROUS_APIS = [
+    ('Ljava/lang/Runtime;', 'exec', '执行系统命令'),
+    ('Ljava/lang/ProcessBuilder;', 'start', '执行系统命令'),
+    ('Landroid/app/admin/DevicePolicyManager;', 'lockNow', '强制锁屏'),
+    ('Landroid/app/admin/DevicePolicyManager;', 'resetPassword', '重置锁屏密码'),
+    ('Landroid/app/admin/DevicePolicyManager;', 'wipeData', '清除设备数据'),
+    ('Landroid/app/admin/DevicePolicyManager;', None, '设备管理器'),
+    ('Landroid/app/admin/DeviceAdminReceiver;', None, '设备管理器'),
+    ('Landroid/accessibilityservice/AccessibilityService;', None, '无障碍服务'),
+    ('Landroid/view/WindowManager;', 'addView', '悬浮窗覆盖'),
+    ('Landroid/app/ActivityManager;', 'killBackgroundProcesses', '进程操作'),
+    ('Landroid/content/pm/PackageManager;', 'setComponentEnabledSetting', '隐藏图标'),
+    ('Landroid/telephony/SmsManager;', 'sendTextMessage', '发送短信'),
+    ('Ldalvik/system/DexClassLoader;', '<init>', '动态加载代码'),
+]
+
+
+class DexError(ValueError):
+    pass
+
+
+def _uleb128_end(data, pos):
+    while data[pos] & 0x80:
+        pos += 1
+    return pos + 1
+
+
+def _bisect(count, key, target):
+    """First index in [0, count) whose key is not less than target."""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key(mid) < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def pretty_api(descriptor, method=None):
+    name = descriptor[1:-1].replace('/', '.') if descriptor.startswith('L') else descriptor
+    return f"{name}.{method}" if method else name
+
+
+class DexFile:
+    """Random-access view of a .dex image.
+
+    data can be bytes or an mmap. The string, type and method id tables are
+    sorted by the format, so lookups binary-search them in place and decode
+    only the O(log n) strings they compare against; nothing is materialised
+    and resolved lookups are memoised in a dict.
+    """
+
+    def __init__(self, data):
+        if len(data) < 0x70 or data[:4] != DEX_MAGIC:
+            raise DexError('not a dex file')
+        self.data = data
+        (self.string_ids_size, self.string_ids_off,
+         self.type_ids_size, self.type_ids_off,
+         _proto_size, _proto_off, _field_size, _field_off,
+         self.method_ids_size, self.method_ids_off) = struct.unpack_from('<10I', data, 56)
+        for size, offset, item in ((self.string_ids_size, self.string_ids_off, 4),
+                                   (self.type_ids_size, self.type_ids_off, 4),
+                                   (self.method_ids_size, self.method_ids_off, 8)):
+            if offset + size * item > len(data):
+                raise DexError('id table out of bounds')
+        self._strings = {}
+        self._references = {}
+
+    def string(self, index):
+        if index in self._strings:
+            return self._strings[index]
+        data = self.data
+        offset = struct.unpack_from('<I', data, self.string_ids_off + 4 * index)[0]
+        try:
+            start = _uleb128_end(data, offset)
+        except IndexError:
+            raise DexError(f'string {index} out of bounds')
+        end = data.find(b'\x00', start)
+        if end < 0:
+            end = len(data)
+        value = bytes(data[start:end]).decode('utf-8', errors='replace')
+        self._strings[index] = value
+        return value
+
+    def find_string(self, value):
+        """Index of value in the (sorted) string table, or None."""
+        index = _bisect(self.string_ids_size, self.string, value)
+        if index < self.string_ids_size and self.string(index) == value:
+            return index
+        return None
+
+    def type_index(self, descriptor):
+        """Index into type_ids of descriptor (e.g. 'Ljava/lang/Runtime;'), or None."""
+        string_idx = self.find_string(descriptor)
+        if string_idx is None:
+            return None
+        index = _bisect(self.type_ids_size, self._type_descriptor, string_idx)
+        if index < self.type_ids_size and self._type_descriptor(index) == string_idx:
+            return index
+        return None
+
+    def has_method(self, type_idx, name_idx):
+        index = _bisect(self.method_ids_size, self._method_key, (type_idx, name_idx))
+        return index < self.method_ids_size and self._method_key(index) == (type_idx, name_idx)
+
+    def _type_descriptor(self, index):
+        return struct.unpack_from('<I', self.data, self.type_ids_off + 4 * index)[0]
+
+    def _method_key(self, index):
+        class_idx, _proto_idx, name_idx = struct.unpack_from('<HHI', self.data, self.method_ids_off + 8 * index)
+        return class_idx, name_idx
+
+    def raw_strings(self):
+        """Yield every string of the table as raw MUTF-8 bytes, in table order."""
+        data = self.data
+        offsets = struct.unpack_from(f'<{self.string_ids_size}I', data, self.string_ids_off)
+        for offset in offsets:
+            try:
+                start = _uleb128_end(data, offset)
+            except IndexError:
+                raise DexError('string data out of bounds')
+            end = data.find(b'\x00', start)
+            if end < 0:
+                end = len(data)
+            yield data[start:end]
+
+    def references(self, descriptor, method=None):
+        """Whether the dex references the class (and, if given, the method)."""
+        key = (descriptor, method)
+        if key not in self._references:
+            type_idx = self.type_index(descriptor)
+            if type_idx is None or method is None:
+                found = type_idx is not None
+            else:
+                name_idx = self.find_string(method)
+                found = name_idx is not None and self.has_method(type_idx, name_idx)
+            self._references[key] = found
+        return self._references[key]
+
+
+def find_dangerous_apis(data, apis=DANGEROUS_APIS):
+    """Return (description, api) for every entry of apis the dex references."""
+    dex = DexFile(data)
+    return [(description, pretty_api(descriptor, method))
+            for descriptor, method, description in apis
+            if dex.references(descriptor, method)]
@@ -0,0 +1,233 @@
+import fnmatch
+import struct
+
+ELF_MAGIC = b'\x7fELF'
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+SHT_DYNAMIC = 6
+SHT_DYNSYM = 11
+PT_LOAD = 1
+PT_DYNAMIC = 2
+DT_NULL = 0
+DT_NEEDED = 1
+DT_HASH = 4
+DT_STRTAB = 5
+DT_SYMTAB = 6
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_GNU_HASH = 0x6ffffef5
+SHN_UNDEF = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+STT_FUNC = 2
+
+MACHINES = {3: 'x86', 40: 'arm', 62: 'x86_64', 183: 'arm64'}
+
+JNI_ENTRY_POINTS = {'JNI_OnLoad', 'JNI_OnUnload'}
+
+SENSITIVE_IMPORTS = {
+    'execve': '执行命令', 'execv': '执行命令', 'execvp': '执行命令', 'execl': '执行命令',
+    'execlp': '执行命令', 'system': '执行命令', 'popen': '执行命令',
+    'ptrace': '反调试', 'inotify_add_watch': '反调试',
+    'dlopen': '动态加载', 'android_dlopen_ext': '动态加载',
+    'mprotect': '修改内存权限',
+    'fork': '创建进程', 'kill': '进程操作',
+    '__system_property_get': '读取系统属性',
+}
+
+# (packer, library name patterns); names are matched against the entry's
+# file name, its SONAME and its DT_NEEDED dependencies.
+PACKER_SIGNATURES = [
+    ('360加固', ['libjiagu*.so', 'libprotectclass.so']),
+    ('梆梆加固', ['libsecexe*.so', 'libsecmain*.so', 'libdexhelper*.so']),
+    ('爱加密', ['libexec.so', 'libexecmain.so', 'ijiami*.so']),
+    ('腾讯乐固', ['libshella*.so', 'libshellx*.so', 'libtup.so', 'liblegudb.so']),
+    ('百度加固', ['libbaiduprotect*.so']),
+    ('阿里聚安全', ['libmobisec*.so', 'libaliutils.so']),
+    ('娜迦', ['libddog.so', 'libchaosvmp.so', 'libedog.so']),
+    ('几维安全', ['libkwscmm.so', 'libkwscr.so', 'libkwslinker.so']),
+    ('网易易盾', ['libnesec*.so']),
+    ('通付盾', ['libegis*.so', 'libnqshield*.so']),
+]
+UPX_MARKER = b'UPX!'
+UPX_SEARCH_BYTES = 4096
+
+
+class ELFError(ValueError):
+    pass
+
+
+def packers_for_name(name):
+    """Packers whose library names match name (a file name or SONAME)."""
+    name = name.rsplit('/', 1)[-1].lower()
+    return [packer for packer, patterns in PACKER_SIGNATURES
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+class ELFFile:
+    """Reads the dynamic symbol table and dynamic section of an ELF image.
+
+    data can be bytes or an mmap. Only the headers, .dynsym, .dynstr and
+    the dynamic section are touched, located through the section headers
+    or, when those are stripped or damaged (as packers leave them), through
+    the program headers.
+    """
+
+    def __init__(self, data):
+        if len(data) < 64 or data[:4] != ELF_MAGIC:
+            raise ELFError('not an ELF file')
+        if data[4] not in (ELFCLASS32, ELFCLASS64) or data[5] not in (ELFDATA2LSB, ELFDATA2MSB):
+            raise ELFError(f'unknown ELF class {data[4]} or byte order {data[5]}')
+        self.data = data
+        self.is64 = data[4] == ELFCLASS64
+        e = self._endian = '<' if data[5] == ELFDATA2LSB else '>'
+        self.machine = struct.unpack_from(e + 'H', data, 18)[0]
+        if self.is64:
+            phoff, shoff = struct.unpack_from(e + 'QQ', data, 0x20)
+            phentsize, phnum, shentsize, shnum, shstrndx = struct.unpack_from(e + 'HHHHH', data, 0x36)
+            self._section = struct.Struct(e + 'IIQQQQIIQQ')
+            self._segment = struct.Struct(e + 'IIQQQQQQ')
+            self._symbol = struct.Struct(e + 'IBBHQQ')
+            self._dyn = struct.Struct(e + 'qQ')
+        else:
+            phoff, shoff = struct.unpack_from(e + 'II', data, 0x1C)
+            phentsize, phnum, shentsize, shnum, shstrndx = struct.unpack_from(e + 'HHHHH', data, 0x2A)
+            self._section = struct.Struct(e + 'IIIIIIIIII')
+            self._segment = struct.Struct(e + 'IIIIIIII')
+            self._symbol = struct.Struct(e + 'IIIBBH')
+            self._dyn = struct.Struct(e + 'iI')
+        # Normalised to (type, offset, vaddr, filesz) and (name, type, offset, size, link)
+        self.segments = [(p[0], p[2], p[3], p[5]) if self.is64 else (p[0], p[1], p[2], p[4])
+                         for p in self._read_table(phoff, phnum, phentsize, self._segment)]
+        self.sections = [(h[0], h[1], h[4], h[5], h[6])
+                         for h in self._read_table(shoff, shnum, shentsize, self._section)]
+        self.section_names = []
+        if shstrndx < len(self.sections):
+            names = self.sections[shstrndx]
+            self.section_names = [self._string(names[2], names[3], section[0]) for section in self.sections]
+        self.dynamic = self._read_dynamic()
+        self._tables = self._symbol_tables()
+
+    def _read_table(self, offset, count, entsize, layout):
+        if not offset or not count or entsize != layout.size or offset + count * entsize > len(self.data):
+            return []
+        return [layout.unpack_from(self.data, offset + i * entsize) for i in range(count)]
+
+    def _string(self, table_offset, table_size, index):
+        if index >= table_size:
+            return ''
+        start = table_offset + index
+        end = self.data.find(b'\x00', start, table_offset + table_size)
+        if end < 0:
+            end = table_offset + table_size
+        return bytes(self.data[start:end]).decode('utf-8', errors='replace')
+
+    def _vaddr_to_offset(self, vaddr):
+        for p_type, p_offset, p_vaddr, p_filesz in self.segments:
+            if p_type == PT_LOAD and p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + p_offset
+        return None
+
+    def _read_dynamic(self):
+        """[(tag, value)] of the dynamic section, up to DT_NULL."""
+        ranges = [(offset, size) for _name, sh_type, offset, size, _link in self.sections if sh_type == SHT_DYNAMIC]
+        ranges += [(offset, size) for p_type, offset, _vaddr, size in self.segments if p_type == PT_DYNAMIC]
+        if not ranges:
+            return []
+        offset, size = ranges[0]
+        entries = []
+        for pos in range(offset, min(offset + size, len(self.data)) - self._dyn.size + 1, self._dyn.size):
+            tag, value = self._dyn.unpack_from(self.data, pos)
+            if tag == DT_NULL:
+                break
+            entries.append((tag, value))
+        return entries
+
+    def _symbol_tables(self):
+        """(symtab offset, symbol count, strtab offset, strtab size), or None."""
+        for _name, sh_type, offset, size, link in self.sections:
+            if sh_type == SHT_DYNSYM and link < len(self.sections):
+                strtab = self.sections[link]
+                return offset, size // self._symbol.size, strtab[2], strtab[3]
+        tags = dict(self.dynamic)
+        symtab = self._vaddr_to_offset(tags.get(DT_SYMTAB, -1))
+        strtab = self._vaddr_to_offset(tags.get(DT_STRTAB, -1))
+        if symtab is None or strtab is None:
+            return None
+        return symtab, self._symbol_count(tags, symtab, strtab), strtab, tags.get(DT_STRSZ, len(self.data) - strtab)
+
+    def _symbol_count(self, tags, symtab, strtab):
+        hash_offset = self._vaddr_to_offset(tags.get(DT_HASH, -1))
+        if hash_offset is not None:
+            return struct.unpack_from(self._endian + 'I', self.data, hash_offset + 4)[0]
+        gnu_hash = self._vaddr_to_offset(tags.get(DT_GNU_HASH, -1))
+        if gnu_hash is not None:
+            return self._gnu_hash_count(gnu_hash)
+        # The string table conventionally follows the symbol table
+        return max(strtab - symtab, 0) // self._symbol.size
+
+    def _gnu_hash_count(self, offset):
+        """Number of symbols covered by a DT_GNU_HASH table: end of the last chain + 1."""
+        e = self._endian
+        nbuckets, symoffset, bloom_size, _shift = struct.unpack_from(e + '4I', self.data, offset)
+        buckets = offset + 16 + bloom_size * (8 if self.is64 else 4)
+        last = max(struct.unpack_from(f'{e}{nbuckets}I', self.data, buckets), default=0)
+        if last < symoffset:
+            return symoffset
+        chains = buckets + 4 * nbuckets
+        while not struct.unpack_from(e + 'I', self.data, chains + 4 * (last - symoffset))[0] & 1:
+            last += 1
+        return last + 1
+
+    def symbols(self):
+        """Yield (name, defined, binding, type) for every dynamic symbol."""
+        if self._tables is None:
+            return
+        symtab, count, strtab, strsz = self._tables
+        count = min(count, (len(self.data) - symtab) // self._symbol.size)
+        for index in range(1, count):
+            fields = self._symbol.unpack_from(self.data, symtab + index * self._symbol.size)
+            if self.is64:
+                name, info, _other, shndx = fields[:4]
+            else:
+                name, _value, _size, info, _other, shndx = fields
+            yield self._string(strtab, strsz, name), shndx != SHN_UNDEF, info >> 4, info & 0xF
+
+    def dynamic_strings(self, tag):
+        """Strings the dynamic entries with tag point at (e.g. DT_NEEDED)."""
+        if self._tables is None:
+            return []
+        _symtab, _count, strtab, strsz = self._tables
+        return [self._string(strtab, strsz, value) for entry_tag, value in self.dynamic if entry_tag == tag]
+
+
+def analyze_elf(data):
+    """Per-library record: architecture, SONAME, DT_NEEDED, JNI exports, sensitive imports and packers."""
+    elf = ELFFile(data)
+    jni_exports = []
+    imports = []
+    for name, defined, binding, sym_type in elf.symbols():
+        if defined:
+            if binding in (STB_GLOBAL, STB_WEAK) and sym_type == STT_FUNC and (
+                    name.startswith('Java_') or name in JNI_ENTRY_POINTS):
+                jni_exports.append(name)
+        elif name in SENSITIVE_IMPORTS:
+            imports.append(name)
+    needed = elf.dynamic_strings(DT_NEEDED)
+    soname = elf.dynamic_strings(DT_SONAME)
+    packers = set()
+    for name in needed + soname:
+        packers.update(packers_for_name(name))
+    if UPX_MARKER in bytes(data[:UPX_SEARCH_BYTES]) or any(n.startswith('UPX') for n in elf.section_names):
+        packers.add('UPX')
+    return {
+        'arch': MACHINES.get(elf.machine, str(elf.machine)),
+        'soname': soname[0] if soname else None,
+        'needed': needed,
+        'jni_exports': sorted(set(jni_exports)),
+        'imports': sorted(set(imports)),
+        'packers': sorted(packers)
+    }
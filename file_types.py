@@ -0,0 +1,88 @@
+"""Content type of an entry from its first bytes.
+
+sniff() looks at magic numbers only, so the extension an entry claims
+plays no part; is_disguised() compares the two.
+"""
+
+from pathlib import Path
+
+SNIFF_BYTES = 512
+
+# Types that carry code or further archives
+PAYLOAD_KINDS = {'dex', 'elf', 'zip'}
+
+EXTENSION_KINDS = {
+    '.dex': 'dex', '.odex': 'dex', '.vdex': 'dex',
+    '.so': 'elf',
+    '.zip': 'zip', '.jar': 'zip', '.apk': 'zip', '.aar': 'zip',
+    '.png': 'image', '.jpg': 'image', '.jpeg': 'image', '.gif': 'image', '.webp': 'image',
+    '.bmp': 'image', '.ico': 'image',
+}
+
+_PREFIXES = [
+    (b'dex\n', 'dex'), (b'dey\n', 'dex'), (b'cdex', 'dex'),
+    (b'\x7fELF', 'elf'),
+    (b'\x03\x00\x08\x00', 'axml'),
+    (b'\x02\x00\x0c\x00', 'arsc'),
+    (b'PK\x03\x04', 'zip'), (b'PK\x05\x06', 'zip'), (b'PK\x07\x08', 'zip'),
+    (b'\x89PNG\r\n\x1a\n', 'image'), (b'\xff\xd8\xff', 'image'), (b'GIF87a', 'image'), (b'GIF89a', 'image'),
+    (b'\x00\x00\x01\x00', 'image'), (b'\x00\x00\x02\x00', 'image'),
+    (b'\x00\x01\x00\x00', 'font'), (b'OTTO', 'font'), (b'true', 'font'), (b'ttcf', 'font'),
+    (b'wOFF', 'font'), (b'wOF2', 'font'),
+    (b'OggS', 'media'), (b'ID3', 'media'), (b'fLaC', 'media'), (b'#!AMR', 'media'),
+    (b'\x1aE\xdf\xa3', 'media'),
+    (b'\x1f\x8b', 'compressed'), (b'BZh', 'compressed'), (b'\xfd7zXZ\x00', 'compressed'),
+    (b"7z\xbc\xaf'\x1c", 'compressed'), (b'(\xb5/\xfd', 'compressed'), (b'\x04"M\x18', 'compressed'),
+]
+
+_RIFF_KINDS = {b'WEBP': 'image', b'WAVE': 'media', b'AVI ': 'media'}
+_BMP_HEADER_SIZES = {12, 40, 52, 56, 108, 124}
+
+
+def _is_text(head):
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return True
+    if b'\0' in head:
+        return False
+    # The head may end inside a multi-byte character
+    for cut in range(4):
+        try:
+            head[:len(head) - cut].decode('utf-8')
+            return True
+        except UnicodeDecodeError:
+            continue
+    return False
+
+
+def sniff(head):
+    """Content type of data starting with head (ideally SNIFF_BYTES long).
+
+    One of 'empty', 'dex', 'elf', 'axml', 'arsc', 'zip', 'image', 'font',
+    'media', 'compressed', 'text' or 'binary'.
+    """
+    head = bytes(head[:SNIFF_BYTES])
+    if not head:
+        return 'empty'
+    for prefix, kind in _PREFIXES:
+        if head.startswith(prefix):
+            return kind
+    if head.startswith(b'RIFF') and head[8:12] in _RIFF_KINDS:
+        return _RIFF_KINDS[head[8:12]]
+    if head[4:8] == b'ftyp':
+        return 'media'
+    if (head.startswith(b'BM') and len(head) >= 18 and head[6:10] == b'\0\0\0\0'
+            and int.from_bytes(head[14:18], 'little') in _BMP_HEADER_SIZES):
+        return 'image'
+    return 'text' if _is_text(head) else 'binary'
+
+
+def is_disguised(name, kind):
+    """True when the content does not match what the extension claims.
+
+    Code and archives are flagged under any name but their own; image
+    extensions are flagged when the content is not an image.
+    """
+    expected = EXTENSION_KINDS.get(Path(name).suffix.lower())
+    if kind in PAYLOAD_KINDS:
+        return expected != kind
+    return expected == 'image' and kind not in ('image', 'empty')
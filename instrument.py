@@ -0,0 +1,193 @@
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+
+class StageStats:
+    """Counters for one stage.
+
+    For 'extract' bytes_read is compressed bytes taken from the archive and
+    bytes_decompressed what inflating them produced; for the entry stages
+    (code, dex, images, ...) bytes_read is the decompressed bytes the stage
+    consumed. peak_memory is the tracemalloc peak (bytes) and is only filled
+    when memory tracing is on; for charged stages it is the highest peak
+    over the calls charged to them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.entries = 0
+        self.bytes_read = 0
+        self.bytes_decompressed = 0
+        self.peak_memory = None
+        self.rules = None
+
+    def as_dict(self):
+        record = {
+            'stage': self.name,
+            'wall': round(self.wall, 6),
+            'cpu': round(self.cpu, 6),
+            'entries': self.entries,
+            'bytes_read': self.bytes_read,
+            'bytes_decompressed': self.bytes_decompressed,
+            'peak_memory': self.peak_memory
+        }
+        if self.rules is not None:
+            record['rules'] = {name: round(seconds, 6) for name, seconds in self.rules.items()}
+        return record
+
+
+class JsonLinesSink:
+    """Appends one JSON object per stage to a file (path or open text file), with fields added to each."""
+
+    def __init__(self, target, fields=None):
+        self.target = target
+        self.fields = dict(fields or {})
+
+    def emit(self, record):
+        line = json.dumps(dict(self.fields, **record), ensure_ascii=False) + '\n'
+        if isinstance(self.target, str):
+            with open(self.target, 'a', encoding='utf-8') as f:
+                f.write(line)
+        else:
+            self.target.write(line)
+            self.target.flush()
+
+
+class Instrumentation:
+    """Per-stage timing, byte and entry counters for one analysis run.
+
+    Stages are either measured as a block with stage() or charged piecemeal
+    with charge() (scan_apk does that for the interleaved entry stages).
+    progress(done_bytes, total_bytes) is called as uncompressed bytes are
+    processed. finish() hands every stage's record to the sinks and, when
+    profile_path is set, dumps the cProfile stats of the whole run there.
+    With trace_memory, tracemalloc runs for the whole run (slowing it
+    noticeably) and the stages that read or parse get a peak_memory.
+    """
+
+    def __init__(self, sinks=(), progress=None, profile_path=None, trace_memory=False):
+        self.sinks = list(sinks)
+        self.progress = progress
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.total_bytes = 0
+        self.done_bytes = 0
+        self._profiler = None
+        self._open = []     # stats of the stage() blocks being measured
+        self._started_tracing = False
+        self._finished = False
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+
+    def begin(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stats(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    def charge(self, name, wall=0.0, cpu=0.0, entries=0, bytes_read=0, bytes_decompressed=0, peak_memory=None):
+        stats = self.stats(name)
+        stats.wall += wall
+        stats.cpu += cpu
+        stats.entries += entries
+        stats.bytes_read += bytes_read
+        stats.bytes_decompressed += bytes_decompressed
+        if peak_memory is not None:
+            stats.peak_memory = max(stats.peak_memory or 0, peak_memory)
+
+    def take_peak(self):
+        """tracemalloc peak since the last call (None when not tracing), then restart it.
+
+        The peak also counts towards every stage() block still open, so a
+        charged call inside one does not hide the block's own peak.
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        peak = tracemalloc.get_traced_memory()[1]
+        for stats in self._open:
+            stats.peak_memory = max(stats.peak_memory or 0, peak)
+        tracemalloc.reset_peak()
+        return peak
+
+    @contextmanager
+    def stage(self, name):
+        stats = self.stats(name)
+        self.take_peak()
+        self._open.append(stats)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stats
+        finally:
+            stats.wall += time.perf_counter() - wall
+            stats.cpu += time.process_time() - cpu
+            self.take_peak()
+            self._open.remove(stats)
+
+    def add_total(self, nbytes):
+        self.total_bytes += nbytes
+
+    def advance(self, nbytes):
+        self.done_bytes += nbytes
+        if self.progress is not None:
+            self.progress(self.done_bytes, self.total_bytes)
+
+    def records(self):
+        return [stats.as_dict() for stats in self.stages.values()]
+
+    def summary(self):
+        """Plain-text table of the stages, for the report."""
+        lines = ['阶段            耗时(s)   CPU(s)   条目     读取字节     解压字节  峰值内存(KB)']
+        for stats in self.stages.values():
+            peak = f"{stats.peak_memory // 1024:>12}" if stats.peak_memory is not None else f"{'-':>12}"
+            lines.append(f"{stats.name:<14} {stats.wall:>8.3f} {stats.cpu:>8.3f} {stats.entries:>6} "
+                         f"{stats.bytes_read:>12} {stats.bytes_decompressed:>12} {peak}")
+            for rule, seconds in sorted((stats.rules or {}).items(), key=lambda item: -item[1]):
+                lines.append(f"  {rule:<20} {seconds:>8.3f}")
+        max_rss = self.max_rss()
+        if max_rss:
+            lines.append(f"峰值内存(RSS): {max_rss // 1024} MB")
+        return '\n'.join(lines)
+
+    def max_rss(self):
+        """Peak resident set size of this process in KB, where the platform reports it."""
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def finish(self):
+        if self._finished:
+            return self.records()
+        self._finished = True
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+        if self._started_tracing:
+            tracemalloc.stop()
+        records = self.records()
+        for sink in self.sinks:
+            for record in records:
+                sink.emit(record)
+        return records
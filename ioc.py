@@ -0,0 +1,113 @@
+"""Domain blocklist for threat-intel feeds.
+
+Rules are stored in a trie keyed by reversed labels (com -> example ->
+www), so looking a host up costs one dict step per label of the host,
+however many rules are loaded.
+
+    example.com         example.com and every subdomain
+    *.example.com       subdomains of example.com only
+    ads.*.example.com   '*' stands for exactly one label
+    =example.com        example.com itself only
+"""
+
+import hashlib
+import ipaddress
+from urllib.parse import urlsplit
+
+_RULE = object()        # trie key: rule matching this node and its subtree
+_EXACT = object()       # trie key: rule matching this node only
+
+
+def url_host(url):
+    """Lower-case host of a URL (scheme optional), or None."""
+    if '://' not in url:
+        url = '//' + url
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    return host.rstrip('.') if host else None
+
+
+def _labels(host):
+    return host.lower().rstrip('.').split('.')[::-1]
+
+
+class DomainBlocklist:
+    def __init__(self, rules=()):
+        self._root = {}
+        self.size = 0
+        self._digest = hashlib.sha256()
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, rule):
+        """Add one rule (see the module docstring); IPs only match themselves."""
+        rule = rule.strip().lower()
+        exact = rule.startswith('=')
+        pattern = rule.lstrip('=')
+        subdomains_only = pattern.startswith('*.')
+        if subdomains_only:
+            pattern = pattern[2:]
+        if not pattern:
+            return
+        try:
+            ipaddress.ip_address(pattern)
+            exact = True
+        except ValueError:
+            pass
+        node = self._root
+        for label in _labels(pattern):
+            node = node.setdefault(label, {})
+        if subdomains_only:
+            node = node.setdefault('*', {})
+        node[_EXACT if exact else _RULE] = rule
+        self.size += 1
+        self._digest.update(rule.encode('utf-8') + b'\n')
+
+    def fingerprint(self):
+        """Digest of the rules added so far, in order; it changes whenever a feed does."""
+        return self._digest.hexdigest()[:16]
+
+    def load(self, path):
+        """Add the rules of a feed file: one per line, hosts-file lines and URLs accepted."""
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                token = line.split()[-1]
+                if '/' in token:
+                    token = url_host(token) or ''
+                self.add(token)
+        return self
+
+    def match(self, host):
+        """The rule a host falls under, or None."""
+        labels = _labels(host)
+        nodes = [self._root]
+        for depth, label in enumerate(labels):
+            last = depth == len(labels) - 1
+            next_nodes = []
+            for node in nodes:
+                for key in (label, '*'):
+                    child = node.get(key)
+                    if child is None:
+                        continue
+                    rule = child.get(_RULE)
+                    if rule is None and last:
+                        rule = child.get(_EXACT)
+                    if rule is not None:
+                        return rule
+                    next_nodes.append(child)
+            if not next_nodes:
+                return None
+            nodes = next_nodes
+        return None
+
+    def match_url(self, url):
+        host = url_host(url)
+        return self.match(host) if host else None
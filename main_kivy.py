@@ -6,35 +6,85 @@ from kivy.uix.checkbox import CheckBox
 from kivy.uix.textinput import TextInput
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.filechooser import FileChooserListView
-from kivy.clock import mainthread
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.clock import Clock, mainthread
+from kivy.metrics import dp
+from collections import deque
 import threading
 import os
-from analyzer import (
-    extract_apk_completely, analyze_file_structure, extract_all_images,
-    analyze_android_manifest, analyze_code_files, analyze_resource_files,
-    detect_malicious_behavior, create_comprehensive_zip
-)
+from analyzer import analyze_apk, detect_malicious_behavior, create_comprehensive_zip, open_cache
+from similarity import SimilarityIndex, sample_label
+from instrument import Instrumentation
+from triage import triage
+
+
+LOG_MAX_LINES = 200
+LOG_FLUSH_INTERVAL = 1 / 10
+
+
+class FindingLabel(Label):
+    """FindingsView row; halign and shorten only take effect once text_size follows the row's size."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('halign', 'left')
+        kwargs.setdefault('valign', 'middle')
+        kwargs.setdefault('shorten', True)
+        super().__init__(**kwargs)
+        self.bind(size=self.setter('text_size'))
+
+
+class FindingsView(RecycleView):
+    """Findings list that only builds widgets for the rows on screen."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.viewclass = FindingLabel
+        layout = RecycleBoxLayout(orientation='vertical', size_hint_y=None,
+                                  default_size=(None, dp(28)), default_size_hint=(1, None))
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+
+    def set_findings(self, findings):
+        self.data = [{'text': finding} for finding in findings]
 
 
 class AnalyzerLayout(BoxLayout):
     def __init__(self, **kwargs):
         super().__init__(orientation='vertical', **kwargs)
-        self.filechooser = FileChooserListView(size_hint=(1, 0.6))
+        # The worker thread appends here; the UI shows the newest lines at a
+        # fixed rate, so logging cost does not grow with the amount logged.
+        self._log = deque(maxlen=LOG_MAX_LINES)
+        self._log_lock = threading.Lock()
+        self._log_dirty = False
+
+        self.filechooser = FileChooserListView(size_hint=(1, 0.45))
         self.add_widget(self.filechooser)
 
         controls = BoxLayout(size_hint=(1, 0.1))
         self.extract_images_cb = CheckBox(active=True)
         controls.add_widget(Label(text='提取图片'))
         controls.add_widget(self.extract_images_cb)
+        self.triage_cb = CheckBox(active=False)
+        controls.add_widget(Label(text='分级快速分析'))
+        controls.add_widget(self.triage_cb)
+        self.trace_memory_cb = CheckBox(active=False)
+        controls.add_widget(Label(text='记录峰值内存'))
+        controls.add_widget(self.trace_memory_cb)
         self.add_widget(controls)
 
         run_btn = Button(text='开始深度分析', size_hint=(1, 0.1))
         run_btn.bind(on_release=self.on_run)
         self.add_widget(run_btn)
 
-        self.output = TextInput(readonly=True, size_hint=(1, 0.2))
+        self.output = TextInput(readonly=True, size_hint=(1, 0.15))
         self.add_widget(self.output)
 
+        self.findings_view = FindingsView(size_hint=(1, 0.2))
+        self.add_widget(self.findings_view)
+
+        Clock.schedule_interval(self.flush_output, LOG_FLUSH_INTERVAL)
+
     def on_run(self, *args):
         selection = self.filechooser.selection
         if not selection:
@@ -44,51 +94,114 @@ class AnalyzerLayout(BoxLayout):
         threading.Thread(target=self.run_analysis, args=(apk_path,)).start()
 
     def append_output(self, text):
-        self.output.text += text + '\n'
+        """Queue text for the log; safe to call from any thread."""
+        with self._log_lock:
+            self._log.extend(text.split('\n'))
+            self._log_dirty = True
+
+    def flush_output(self, dt):
+        with self._log_lock:
+            if not self._log_dirty:
+                return
+            text = '\n'.join(self._log)
+            lines = len(self._log)
+            self._log_dirty = False
+        self.output.text = text
+        self.output.cursor = (0, lines)
 
-    @mainthread
     def update_ui_text(self, text):
         self.append_output(text)
 
+    @mainthread
+    def show_findings(self, findings):
+        self.findings_view.set_findings(findings)
+
+    def make_progress(self, step=10):
+        """Progress callback that reports every `step` percent of bytes processed."""
+        reported = [-step]
+
+        def progress(done, total):
+            percent = done * 100 // total if total else 100
+            if percent >= reported[0] + step:
+                reported[0] = percent - percent % step
+                self.update_ui_text(f'进度: {reported[0]}%')
+        return progress
+
+    def report_tier(self, tier, record):
+        """triage() callback: log each tier as it finishes."""
+        verdict = {'benign': '无害', 'suspicious': '可疑', 'malicious': '恶意'}.get(record['verdict'], '无法判断')
+        reason = f" ({record['reason']})" if record['reason'] else ''
+        self.update_ui_text(f"第 {tier} 层: {verdict}{reason}")
+
     def run_analysis(self, apk_path):
+        self.show_findings([])
+        instrument = Instrumentation(progress=self.make_progress(), trace_memory=self.trace_memory_cb.active)
+        instrument.begin()
         try:
-            self.update_ui_text('正在解压 APK...')
-            extract_dir, files = extract_apk_completely(apk_path)
-
-            self.update_ui_text('分析文件结构...')
-            file_struct = analyze_file_structure(extract_dir)
-
-            image_count = 0
             image_dir = None
             if self.extract_images_cb.active:
-                self.update_ui_text('提取图片...')
                 image_dir = f"{PathName(apk_path).stem}_photos"
-                image_count = extract_all_images(extract_dir, image_dir)
-                self.update_ui_text(f'提取图片: {image_count} 张')
 
-            self.update_ui_text('分析 AndroidManifest...')
-            manifest = analyze_android_manifest(extract_dir)
-
-            self.update_ui_text('分析代码文件...')
-            code = analyze_code_files(extract_dir)
-
-            self.update_ui_text('检测恶意行为...')
-            findings = detect_malicious_behavior(manifest, code, {})
-
-            overview = [f"APK: {os.path.basename(apk_path)}", f"文件数: {file_struct['total_files']}"]
+            cache_path = os.path.join(App.get_running_app().user_data_dir, 'analysis_cache.sqlite')
+            verdict = None
+            with open_cache(cache_path) as cache:
+                if self.triage_cb.active:
+                    self.update_ui_text('分级分析 (摘要/Manifest，必要时完整扫描)...')
+                    result = triage(apk_path, cache=cache, report=self.report_tier, instrument=instrument,
+                                    image_dir=image_dir)
+                    stages, findings, verdict = result['stages'], result['findings'], result['verdict']
+                else:
+                    self.update_ui_text('分析 APK (结构/Manifest/代码/资源)...')
+                    stages = analyze_apk(apk_path, image_dir, cache, instrument=instrument)
+            if 'structure' in stages:
+                if image_dir:
+                    self.update_ui_text(f"提取图片: {stages['images']} 张")
+                if verdict is None:
+                    self.update_ui_text('检测恶意行为...')
+                    with instrument.stage('detection'):
+                        findings = detect_malicious_behavior(stages['manifest'], stages['code'], stages['resources'],
+                                                             stages['budget'], stages['structure'],
+                                                             native_analysis=stages['native'],
+                                                             identity=stages['identity'])
+            else:
+                image_dir = None    # settled before the full scan
+
+            identity = stages['identity']
+            overview = [f"APK: {os.path.basename(apk_path)}", f"文件数: {len(stages['files'])}",
+                        f"MD5: {identity['md5']}", f"SHA-1: {identity['sha1']}", f"SHA-256: {identity['sha256']}",
+                        f"签名方案: {', '.join(identity['signature']['schemes']) or '未签名'}"]
+            for certificate in identity['signature']['certificates']:
+                overview.append(f"签名证书: {certificate['subject'] or '?'} (SHA-256 {certificate['sha256']})")
+            if verdict is not None:
+                overview.append(f"分级结论: {verdict} (第 {result['tier']} 层, {result['reason']})")
+            if stages.get('fingerprint') is not None:
+                index_path = os.path.join(App.get_running_app().user_data_dir, 'similarity.sqlite')
+                with SimilarityIndex(index_path) as index:
+                    for score, _sample, label in index.query_and_add(identity['sha256'], stages['fingerprint'],
+                                                                     sample_label(apk_path, stages)):
+                        overview.append(f"相似样本: 约 {score:.0%} 相似于 {label}")
             if findings:
+                self.update_ui_text('\n'.join(overview + [f'发现可疑项: {len(findings)} 条（见下方列表）']))
                 overview.append('发现可疑项:')
                 overview.extend(findings)
             else:
                 overview.append('未发现明显恶意行为')
+                self.update_ui_text('\n'.join(overview))
+            self.show_findings(findings)
 
-            self.update_ui_text('\n'.join(overview))
-
-            zipfile = create_comprehensive_zip(apk_path, extract_dir, '\n'.join(overview), '', files, image_dir)
-            self.update_ui_text(f'已生成报告压缩: {zipfile}')
+            if verdict == 'benign':
+                self.update_ui_text('判定为无害，未生成报告')
+                return
+            with instrument.stage('packaging') as packaging:
+                zipfile = create_comprehensive_zip(apk_path, None, '\n'.join(overview), instrument.summary(),
+                                                   stages['files'], apk_images=bool(image_dir))
+            self.update_ui_text(f'已生成报告压缩: {zipfile} ({packaging.wall:.2f}s)')
 
         except Exception as e:
             self.update_ui_text(f'分析出错: {e}')
+        finally:
+            # Stops tracemalloc even when the analysis fails
+            instrument.finish()
 
 
 class AnalyzerApp(App):
@@ -126,7 +239,8 @@ import threading
 from pathlib import Path
 import re
 import json
-import hashlib
+from apk_digest import digest_apk
+from axml_parser import parse_manifest
 
 
 # 设置窗口大小
@@ -169,17 +283,13 @@ class APKAnalyzer:
         """解析 AndroidManifest.xml"""
         try:
             manifest_data = apk.read('AndroidManifest.xml')
-            # 简单的二进制解析
-            manifest_str = str(manifest_data)
-            
-            # 提取包名
-            package_match = re.search(r'package=[\'\"]([^\'\"]*)[\'\"]', manifest_str)
-            package = package_match.group(1) if package_match else 'Unknown'
+            # 二进制 AXML 解析
+            manifest = parse_manifest(manifest_data)
             
             return {
-                'package': package,
-                'activities': [],
-                'permissions': []
+                'package': manifest['package'] or 'Unknown',
+                'activities': manifest['activities'],
+                'permissions': manifest['permissions']
             }
         except:
             return {'package': 'Unknown'}
@@ -195,11 +305,7 @@ class APKAnalyzer:
     def calculate_hash(self, apk_path):
         """计算 APK 文件的 MD5 哈希"""
         try:
-            md5 = hashlib.md5()
-            with open(apk_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
-                    md5.update(chunk)
-            return md5.hexdigest()
+            return digest_apk(apk_path, read_v1=False)['md5']
         except Exception as e:
             return f"Error: {str(e)}"
 
@@ -0,0 +1,209 @@
+import re
+import time
+
+_REGEX_META = set('.^$*+?{}[]()')
+
+# Overlap kept between chunks for rules that are real regexes; their match
+# length cannot be bounded in general, so hits longer than this may be missed
+# when they straddle a chunk boundary.
+REGEX_MAX_SPAN = 4096
+
+
+def _literal_alternatives(pattern):
+    """Return the literals of a plain `a|b|c` pattern, or None if it is a real regex."""
+    literals = []
+    current = []
+    chars = iter(pattern)
+    for ch in chars:
+        if ch == '\\':
+            escaped = next(chars, '')
+            if not escaped or escaped.isalnum():
+                return None
+            current.append(escaped)
+        elif ch == '|':
+            literals.append(''.join(current))
+            current = []
+        elif ch in _REGEX_META:
+            return None
+        else:
+            current.append(ch)
+    literals.append(''.join(current))
+    if not all(literals):
+        return None
+    return literals
+
+
+def _charge(rule_times, index, started):
+    rule_times[index] = rule_times.get(index, 0.0) + time.perf_counter() - started
+
+
+class MultiPatternMatcher:
+    """Case-insensitive matcher for a list of (pattern, description) rules over bytes.
+
+    Rules that are alternations of literals are lowered to byte strings in
+    the given encoding (UTF-8 by default) and located with bytes.find() on a
+    single case-folded copy of the data; anything else falls back to a
+    compiled bytes regex. Offsets are byte offsets into the scanned data.
+    """
+
+    def __init__(self, rules, encoding='utf-8'):
+        self.rules = list(rules)
+        self.encoding = encoding
+        self._literal_rules = []
+        self._regex_rules = []
+        for index, (pattern, _description) in enumerate(self.rules):
+            literals = _literal_alternatives(pattern)
+            if literals is None:
+                # Regexes cannot be transcoded, so they only apply to UTF-8 data
+                if encoding == 'utf-8':
+                    self._regex_rules.append((index, re.compile(pattern.encode('utf-8'), re.IGNORECASE)))
+            else:
+                folded = sorted({literal.encode(encoding).lower() for literal in literals})
+                self._literal_rules.append((index, folded))
+        literal_span = max((len(lit) for _index, lits in self._literal_rules for lit in lits), default=0)
+        self.max_span = max(literal_span, REGEX_MAX_SPAN if self._regex_rules else 0)
+
+    def scan(self, data, first_only=False, skip=(), rule_times=None):
+        """Return (offset, rule_index) hits sorted by offset.
+
+        With first_only only the earliest hit of each rule is reported.
+        Rule indexes in skip are not searched at all. A rule_times dict gets
+        the seconds spent on each rule added to rule_times[rule_index].
+        """
+        hits = []
+        timed = rule_times is not None
+        if self._literal_rules:
+            folded = bytes(data).lower()
+            for index, literals in self._literal_rules:
+                if index in skip:
+                    continue
+                if timed:
+                    started = time.perf_counter()
+                rule_hits = []
+                for literal in literals:
+                    pos = folded.find(literal)
+                    while pos >= 0:
+                        rule_hits.append(pos)
+                        if first_only:
+                            break
+                        pos = folded.find(literal, pos + 1)
+                if first_only and rule_hits:
+                    rule_hits = [min(rule_hits)]
+                hits.extend((pos, index) for pos in rule_hits)
+                if timed:
+                    _charge(rule_times, index, started)
+        for index, regex in self._regex_rules:
+            if index in skip:
+                continue
+            if timed:
+                started = time.perf_counter()
+            if first_only:
+                match = regex.search(data)
+                if match:
+                    hits.append((match.start(), index))
+            else:
+                hits.extend((match.start(), index) for match in regex.finditer(data))
+            if timed:
+                _charge(rule_times, index, started)
+        hits.sort()
+        return hits
+
+
+class MatchStream:
+    """Feeds a MultiPatternMatcher chunk by chunk with an overlap window.
+
+    Only max_span - 1 bytes are carried between chunks, so memory is bounded
+    by the chunk size while the hits (absolute offsets) are the same as a
+    scan() over the concatenated data. rule_times is passed on to scan().
+    """
+
+    def __init__(self, matcher, first_only=False, rule_times=None):
+        self.matcher = matcher
+        self.first_only = first_only
+        self.rule_times = rule_times
+        self.hits = []
+        self._found = set()
+        self._overlap = max(matcher.max_span - 1, 0)
+        self._tail = b''
+        self._base = 0
+
+    def feed(self, chunk, final=False):
+        buf = b''.join((self._tail, chunk))
+        limit = len(buf) if final else len(buf) - self._overlap
+        if limit > 0:
+            skip = self._found if self.first_only else ()
+            for offset, index in self.matcher.scan(buf, self.first_only, skip, self.rule_times):
+                if offset >= limit or (self.first_only and index in self._found):
+                    continue
+                self.hits.append((self._base + offset, index))
+                if self.first_only:
+                    self._found.add(index)
+            self._tail = buf[limit:]
+            self._base += limit
+        else:
+            self._tail = buf
+
+    def close(self):
+        self.feed(b'', final=True)
+        self.hits.sort()
+        return self.hits
+
+
+class TokenStream:
+    """Collects regex tokens that run until a delimiter byte, chunk by chunk.
+
+    A match that reaches the end of a chunk is held open and completed at the
+    first delimiter of a later chunk, and the last `lookahead` bytes (enough to
+    hold a partial token prefix) are carried over, so the tokens equal
+    regex.findall() over the concatenated data. Tokens are cut to their first
+    max_length bytes, so an open token never holds more than that.
+    """
+
+    def __init__(self, regex, delimiter, lookahead, max_length):
+        self.regex = regex
+        self.delimiter = delimiter
+        self.lookahead = lookahead
+        self.max_length = max_length
+        self.tokens = []
+        self._open = None
+        self._open_length = 0
+        self._tail = b''
+
+    def _extend(self, piece):
+        piece = piece[:self.max_length - self._open_length]
+        if piece:
+            self._open.append(bytes(piece))
+            self._open_length += len(piece)
+
+    def feed(self, chunk, final=False):
+        start = 0
+        if self._open is not None:
+            end = self.delimiter.search(chunk)
+            if end is None and not final:
+                self._extend(chunk)
+                return
+            stop = end.start() if end else len(chunk)
+            self._extend(chunk[:stop])
+            self.tokens.append(b''.join(self._open))
+            self._open = None
+            start = stop
+            buf = bytes(chunk)
+        else:
+            buf = b''.join((self._tail, chunk))
+        last_end = start
+        for match in self.regex.finditer(buf, start):
+            if not final and match.end() == len(buf):
+                self._open = []
+                self._open_length = 0
+                self._extend(memoryview(buf)[match.start():])
+                break
+            self.tokens.append(match.group()[:self.max_length])
+            last_end = match.end()
+        if final or self._open is not None:
+            self._tail = b''
+        else:
+            self._tail = buf[max(last_end, len(buf) - self.lookahead):]
+
+    def close(self):
+        self.feed(b'', final=True)
+        return self.tokens
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'apk_analyzer', 'results.sqlite')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# A hit only refreshes a row's LRU time when it is older than this, and the
+# refreshes are written in batches rather than one transaction per get().
+TOUCH_INTERVAL = 60
+TOUCH_BATCH = 256
+
+
+class ResultCache:
+    """Persistent JSON result cache in a single SQLite file.
+
+    Rows are tagged with the rule-pack version they were computed under;
+    opening the cache with a different version drops them, so a rule change
+    never serves stale results. Once the stored values exceed max_bytes the
+    least recently used rows are evicted; the running total is kept in the
+    meta table by triggers, so a put() does not sum the whole table. One
+    instance per thread/process; concurrent processes share the file through
+    SQLite's locking.
+    """
+
+    def __init__(self, version, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.version = version
+        self.path = path or DEFAULT_CACHE_PATH
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        # WAL lets batch workers read while one of them writes
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._touched = {}
+        with self._db:
+            self._db.execute('BEGIN IMMEDIATE')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL, '
+                'size INTEGER NOT NULL, used REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            # Caches written before the meta table existed are summed once here
+            self._db.execute("INSERT OR IGNORE INTO meta SELECT 'bytes', COALESCE(SUM(size), 0) FROM results")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS results_added AFTER INSERT ON results BEGIN "
+                             "UPDATE meta SET value = value + new.size WHERE name = 'bytes'; END")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS results_removed AFTER DELETE ON results BEGIN "
+                             "UPDATE meta SET value = value - old.size WHERE name = 'bytes'; END")
+            self._db.execute('DELETE FROM results WHERE version != ?', (version,))
+
+    def get(self, key):
+        row = self._db.execute('SELECT value, used FROM results WHERE key = ? AND version = ?',
+                               (key, self.version)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > TOUCH_INTERVAL:
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH:
+                with self._db:
+                    self._touch()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        text = json.dumps(value, ensure_ascii=False)
+        with self._db:
+            # DELETE + INSERT rather than INSERT OR REPLACE, which skips the delete trigger
+            self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+            self._db.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?)',
+                             (key, self.version, text, len(text), time.time()))
+            self._touched.pop(key, None)
+            self._touch()
+            self._evict()
+
+    def _touch(self):
+        if self._touched:
+            self._db.executemany('UPDATE results SET used = ? WHERE key = ?',
+                                 [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        total = self._db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self._db.execute('SELECT key, size FROM results ORDER BY used'):
+            stale.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._db.executemany('DELETE FROM results WHERE key = ?', stale)
+
+    def close(self):
+        with self._db:
+            self._touch()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
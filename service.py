@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""Local analysis service: queue APKs over HTTP, then poll or stream the results.
+
+    python service.py --port 8765 -j 4
+    curl --data-binary @app.apk 'http://127.0.0.1:8765/jobs?priority=5&name=app.apk'
+    curl -H 'Content-Type: application/json' -d '{"path": "/data/app.apk"}' http://127.0.0.1:8765/jobs
+    curl http://127.0.0.1:8765/jobs/1            # status, progress and, once done, the record
+    curl http://127.0.0.1:8765/jobs/1/events     # one JSON line per event until the job ends
+
+With --triage each job stops at the first tier that settles its verdict
+(see triage.py), streaming a 'tier' event per tier; ?deep=1 (or "deep":
+true) asks for the full scan on one job. name (query or JSON) labels the
+sample in the similarity index; uploads without one use the package name.
+
+Jobs run on a pool of worker processes started once, so the rule sets and
+parsers are compiled before the first request. A worker that dies (e.g.
+killed for memory) fails the jobs that were on the pool and the pool is
+started again. Records are the ones
+batch.py writes (analyze_one), so the service, the batch tool and the GUI
+reach the same findings. Higher priorities run first; at most --jobs run
+at a time and --max-queue wait.
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Queue, active_children
+from urllib.parse import parse_qs, urlsplit
+
+import batch
+from result_cache import DEFAULT_CACHE_PATH
+from triage import add_policy_arguments, policy_from_arguments
+
+PROGRESS_INTERVAL = 0.25
+MAX_FINISHED_JOBS = 1000
+EVENT_WAIT = 15.0
+
+_events = None
+
+
+def _init_worker(events, cache_path, ioc_feeds, similarity_path, triage_policy, trace_memory):
+    global _events
+    _events = events
+    batch._init_worker(cache_path, ioc_feeds=ioc_feeds, similarity_path=similarity_path,
+                       triage_policy=triage_policy, trace_memory=trace_memory)
+
+
+def _ready():
+    """No-op job: a worker runs it once its initializer has finished."""
+    return os.getpid()
+
+
+class _EventSink:
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def emit(self, record):
+        _events.put((self.job_id, dict(record, event='timing')))
+
+
+def _run_job(job_id, apk_path, deep=False, label=None):
+    """Worker side: analyse one APK, posting progress, triage tiers and finally the record as events."""
+    last = 0.0
+
+    def progress(done, total):
+        nonlocal last
+        now = time.monotonic()
+        if now - last >= PROGRESS_INTERVAL or done >= total:
+            last = now
+            _events.put((job_id, {'event': 'progress', 'done': done, 'total': total}))
+
+    def report(tier, result):
+        _events.put((job_id, {'event': 'tier', 'tier': tier, 'verdict': result['verdict'],
+                              'reason': result['reason'], 'findings': result['findings']}))
+
+    _events.put((job_id, {'event': 'started'}))
+    record = batch.analyze_one(apk_path, progress, [_EventSink(job_id)], report, deep, label)
+    _events.put((job_id, {'event': 'result', 'record': record}))
+
+
+class Job:
+    def __init__(self, job_id, apk_path, priority, upload=False, deep=False, label=None):
+        self.id = job_id
+        self.apk_path = apk_path
+        self.priority = priority
+        self.upload = upload
+        self.deep = deep
+        self.label = label
+        self.status = 'queued'
+        self.progress = None
+        self.record = None
+        self.events = [{'event': 'queued'}]
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def add(self, event):
+        with self.changed:
+            if event['event'] == 'started':
+                self.status = 'running'
+            elif event['event'] == 'progress':
+                self.progress = {'done': event['done'], 'total': event['total']}
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def finish(self, record):
+        """Publish the record stage by stage, then end the job."""
+        with self.changed:
+            self.record = record
+            for stage, value in record.get('stages', {}).items():
+                self.events.append({'event': 'stage', 'stage': stage, 'result': value})
+            if 'error' in record:
+                self.status = 'failed'
+                self.events.append({'event': 'failed', 'error': record['error']})
+            else:
+                self.status = 'done'
+                self.events.append({'event': 'findings', 'findings': record['findings']})
+                self.events.append({'event': 'done'})
+            self.changed.notify_all()
+
+    def wait_events(self, start, timeout):
+        """(events after start, finished), waiting up to timeout for something new."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.events) > start or self.finished, timeout)
+            return self.events[start:], self.finished
+
+    def snapshot(self):
+        with self.changed:
+            state = {'id': self.id, 'apk': self.apk_path, 'priority': self.priority,
+                     'status': self.status, 'progress': self.progress}
+            if self.record is not None:
+                state['record'] = self.record
+            return state
+
+
+class AnalysisService:
+    """Priority queue of jobs in front of a pool of warm worker processes.
+
+    The workers are started (and their initializer run) before the
+    service accepts jobs, and again whenever a broken pool is replaced.
+    """
+
+    def __init__(self, workers=1, cache_path=None, max_queue=1000, upload_dir=None, ioc_feeds=(),
+                 similarity_path=None, triage_policy=None, trace_memory=False):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.upload_dir = upload_dir or tempfile.mkdtemp(prefix='apk_service_')
+        self._owns_upload_dir = upload_dir is None
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._order = itertools.count()
+        self._queue = []    # heap of (-priority, order, job)
+        self._lock = threading.Condition()
+        self._running = 0
+        self._closed = False
+        self._events = Queue()
+        self._worker_args = (self._events, cache_path, list(ioc_feeds), similarity_path, triage_policy,
+                             trace_memory)
+        self._pool = self._start_pool()
+        self._warm(self._pool)
+        self._threads = [threading.Thread(target=self._dispatch, daemon=True),
+                         threading.Thread(target=self._collect, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, apk_path, priority=0, upload=False, deep=False, label=None):
+        """Queue an APK; returns the Job, or None when the queue is full.
+
+        deep asks for the full scan even when triage could stop earlier;
+        label is passed on to batch.analyze_one.
+        """
+        with self._lock:
+            if self._closed or len(self._queue) >= self.max_queue:
+                return None
+            job = Job(next(self._ids), apk_path, priority, upload, deep, label)
+            self.jobs[job.id] = job
+            heapq.heappush(self._queue, (-priority, next(self._order), job))
+            self._lock.notify_all()
+        return job
+
+    def _start_pool(self):
+        return ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=self._worker_args)
+
+    def _warm(self, pool):
+        """Start pool's workers and wait for them to initialize.
+
+        ProcessPoolExecutor only starts its processes on the first submit, so
+        without this the first job would pay for them.
+        """
+        for future in [pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._closed or (self._queue and self._running < self.workers))
+                if self._closed:
+                    return
+                job = heapq.heappop(self._queue)[2]
+                self._running += 1
+                pool = self._pool
+            try:
+                future = pool.submit(_run_job, job.id, job.apk_path, job.deep, job.label)
+            except BrokenProcessPool as e:
+                self._job_failed(job, e, pool)
+            else:
+                future.add_done_callback(lambda future, job=job, pool=pool: self._job_done(job, future, pool))
+
+    def _job_done(self, job, future, pool):
+        """Worker results arrive as events; only a job that raised (or lost its worker) is ended here."""
+        if not future.cancelled() and future.exception() is not None:
+            self._job_failed(job, future.exception(), pool)
+
+    def _job_failed(self, job, error, pool):
+        if isinstance(error, BrokenProcessPool):
+            # Every job still on the broken pool fails with it; later ones get a new pool
+            with self._lock:
+                if self._closed or self._pool is not pool:
+                    pool = None
+                else:
+                    self._pool = self._start_pool()
+                    replacement = self._pool
+            if pool is not None:
+                pool.shutdown(wait=False)
+        self._events.put((job.id, {'event': 'result', 'record': {
+            'apk': job.apk_path, 'error': f"{type(error).__name__}: {error}"}}))
+        if isinstance(error, BrokenProcessPool) and pool is not None:
+            try:
+                self._warm(replacement)
+            except BrokenProcessPool:
+                pass    # the next job finds the pool broken and replaces it
+
+    def _collect(self):
+        """Move worker events onto their jobs; a result ends the job and frees its slot."""
+        while True:
+            item = self._events.get()
+            if item is None:
+                return
+            job_id, event = item
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            if event['event'] != 'result':
+                job.add(event)
+                continue
+            if job.finished:
+                continue    # the worker posted its result and then died
+            job.finish(event['record'])
+            if job.upload:
+                try:
+                    os.remove(job.apk_path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._running -= 1
+                self._forget_finished()
+                self._lock.notify_all()
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'running': self._running, 'queued': len(self._queue),
+                    'jobs': len(self.jobs)}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        # Running analyses are not waited for; the pool's workers are this process's only children
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for process in active_children():
+            process.terminate()
+        self._pool.shutdown(wait=True)
+        self._events.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._owns_upload_dir:
+            shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """POST /jobs, GET /jobs, GET /jobs/<id>, GET /jobs/<id>/events, GET /health."""
+
+    server_version = 'APKAnalyzer/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _send_json(self, status, value):
+        body = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def _job(self, job_id):
+        job = self.service.jobs.get(int(job_id))
+        if job is None:
+            self._error(404, '任务不存在')
+        return job
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._send_json(200, self.service.stats())
+        elif path == '/jobs':
+            self._send_json(200, [{'id': job.id, 'apk': job.apk_path, 'status': job.status}
+                                  for job in list(self.service.jobs.values())])
+        elif re.fullmatch(r'/jobs/\d+', path):
+            job = self._job(path.split('/')[2])
+            if job is not None:
+                self._send_json(200, job.snapshot())
+        elif re.fullmatch(r'/jobs/\d+/events', path):
+            job = self._job(path.split('/')[2])
+            if job is not None:
+                self._stream_events(job)
+        else:
+            self._error(404, '未知路径')
+
+    def _stream_events(self, job):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                events, finished = job.wait_events(sent, EVENT_WAIT)
+                for event in events:
+                    self.wfile.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+                self.wfile.flush()
+                sent += len(events)
+                if finished and sent == len(job.events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/jobs':
+            self._error(404, '未知路径')
+            return
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self._error(411, '需要 Content-Length')
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._error(400, 'Content-Length 无效')
+            return
+        if length > self.server.max_upload:
+            self._error(413, f'请求体超过 {self.server.max_upload} 字节')
+            return
+        query = parse_qs(url.query)
+        try:
+            priority = int(query.get('priority', ['0'])[0])
+        except ValueError:
+            self._error(400, 'priority 必须是整数')
+            return
+        deep = query.get('deep', ['0'])[0] not in ('0', 'false', '')
+        label = query.get('name', [None])[0]
+
+        if self.headers.get_content_type() == 'application/json':
+            try:
+                request = json.loads(self.rfile.read(length))
+                apk_path = request['path']
+                priority = int(request.get('priority', priority))
+                deep = bool(request.get('deep', deep))
+                label = request.get('name', label)
+            except (ValueError, KeyError, TypeError):
+                self._error(400, '请求体应为 {"path": ..., "priority": ..., "deep": ..., "name": ...}')
+                return
+            if not os.path.isfile(apk_path):
+                self._error(400, f'文件不存在: {apk_path}')
+                return
+            upload = False
+        else:
+            apk_path = self._save_upload(length)
+            if apk_path is None:
+                return
+            upload = True
+            # The saved file's name means nothing; without a name the package name is used
+            label = label or ''
+
+        job = self.service.submit(apk_path, priority, upload, deep, label)
+        if job is None:
+            if upload:
+                os.remove(apk_path)
+            self._error(503, '队列已满')
+            return
+        self._send_json(202, {'id': job.id, 'status': job.status})
+
+    def _save_upload(self, length):
+        fd, path = tempfile.mkstemp(suffix='.apk', dir=self.service.upload_dir)
+        with os.fdopen(fd, 'wb') as f:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            os.remove(path)
+            self._error(400, '上传不完整')
+            return None
+        return path
+
+
+def make_server(host, port, service, max_upload=1024 * 1024 * 1024):
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_upload = max_upload
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='APK 分析服务（本地 HTTP）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='并行分析的进程数')
+    parser.add_argument('--max-queue', type=int, default=1000, help='最多排队的任务数')
+    parser.add_argument('--max-upload', type=int, default=1024 * 1024 * 1024, help='上传大小上限（字节）')
+    parser.add_argument('--upload-dir', help='上传文件的临时目录')
+    parser.add_argument('--cache', help='结果缓存路径（默认 ~/.cache/apk_analyzer/results.sqlite）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用结果缓存')
+    parser.add_argument('--ioc', action='append', default=[], metavar='FILE',
+                        help='恶意域名情报（每行一个域名，支持 *.example.com），可多次指定')
+    parser.add_argument('--similarity-index', metavar='FILE', help='相似样本索引（SQLite）')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='用 tracemalloc 记录各阶段峰值内存（timing 事件中的 peak_memory，分析会变慢）')
+    add_policy_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error('--jobs 必须大于 0')
+    cache_path = None if args.no_cache else (args.cache or DEFAULT_CACHE_PATH)
+    service = AnalysisService(args.jobs, cache_path, args.max_queue, args.upload_dir, args.ioc,
+                              args.similarity_index, policy_from_arguments(args), args.trace_memory)
+    server = make_server(args.host, args.port, service, args.max_upload)
+    print(f'服务已启动: http://{args.host}:{server.server_address[1]}，{args.jobs} 个进程', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
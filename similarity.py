@@ -0,0 +1,166 @@
+"""MinHash signatures of APKs and a local LSH index over them.
+
+Signatures use one-permutation hashing: every feature is hashed once, the
+top bits of the hash pick one of NUM_BINS bins and each bin keeps its
+smallest value. Bins of disjoint feature sets merge by taking the minimum,
+so per-entry partial signatures can be cached and combined later.
+densify() fills empty bins from their right-hand neighbours, after which
+the share of equal bins between two signatures estimates the Jaccard
+similarity of their feature sets.
+
+The index bands signatures (BANDS bands of ROWS bins) into SQLite, so a
+query only compares against samples sharing at least one band.
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+
+NUM_BINS = 128
+BANDS = 32
+ROWS = NUM_BINS // BANDS
+BIN_BITS = 7                    # log2(NUM_BINS)
+VALUE_BITS = 64 - BIN_BITS
+EMPTY = 1 << VALUE_BITS         # larger than any bin value
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'apk_analyzer', 'similarity.sqlite')
+
+_SIGNATURE = struct.Struct(f'<{NUM_BINS}Q')
+
+
+def new_bins():
+    return [EMPTY] * NUM_BINS
+
+
+def add_features(bins, features):
+    """Fold byte-string features into bins in place."""
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature, digest_size=8).digest(), 'little')
+        index = h >> VALUE_BITS
+        value = h & (EMPTY - 1)
+        if value < bins[index]:
+            bins[index] = value
+    return bins
+
+
+def merge(bins, other):
+    """Fold another set of bins into bins in place (set union)."""
+    for index, value in enumerate(other):
+        if value < bins[index]:
+            bins[index] = value
+    return bins
+
+
+def entry_feature(crc, size):
+    return b'e' + struct.pack('<II', crc, size & 0xFFFFFFFF)
+
+
+def densify(bins):
+    """Signature from bins, or None when no feature was added.
+
+    An empty bin borrows the value of the next non-empty bin to its right,
+    offset by the distance so borrowed values only match when the same
+    bins are empty in both signatures. Values stay below 2**64.
+    """
+    if min(bins) == EMPTY:
+        return None
+    signature = list(bins)
+    for index in range(NUM_BINS):
+        if bins[index] != EMPTY:
+            continue
+        distance = 1
+        while bins[(index + distance) % NUM_BINS] == EMPTY:
+            distance += 1
+        signature[index] = bins[(index + distance) % NUM_BINS] + distance * EMPTY
+    return signature
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_BINS
+
+
+def _band_keys(signature):
+    keys = []
+    for band in range(BANDS):
+        rows = struct.pack(f'<{ROWS}Q', *signature[band * ROWS:(band + 1) * ROWS])
+        keys.append(int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True))
+    return keys
+
+
+def sample_label(apk_path, stages, label=None):
+    """Label of an analysed APK in the index: label, else its file name, else its package name.
+
+    Samples themselves are keyed by SHA-256, so the same APK under another
+    path (or uploaded again) replaces its entry instead of matching itself.
+    """
+    if label is None:
+        label = os.path.basename(apk_path)
+    return label or stages.get('manifest', {}).get('package') or stages['identity']['sha256']
+
+
+class SimilarityIndex:
+    """Signatures of known samples in a SQLite file, banded for LSH lookups.
+
+    One instance per thread/process; concurrent processes share the file
+    through SQLite's locking.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_INDEX_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS samples ('
+                             'sample TEXT PRIMARY KEY, label TEXT, signature BLOB NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS bands ('
+                             'band INTEGER NOT NULL, bucket INTEGER NOT NULL, sample TEXT NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS bands_sample ON bands (sample)')
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+
+    def add(self, sample, signature, label=None):
+        """Store (or replace) a sample's signature."""
+        with self._db:
+            self._db.execute('DELETE FROM bands WHERE sample = ?', (sample,))
+            self._db.execute('INSERT OR REPLACE INTO samples VALUES (?, ?, ?)',
+                             (sample, label, _SIGNATURE.pack(*signature)))
+            self._db.executemany('INSERT INTO bands VALUES (?, ?, ?)',
+                                 [(band, key, sample) for band, key in enumerate(_band_keys(signature))])
+
+    def query(self, signature, threshold=0.5, limit=5, exclude=None):
+        """[(similarity, sample, label)] of the closest samples at or above threshold, best first."""
+        candidates = set()
+        for band, key in enumerate(_band_keys(signature)):
+            candidates.update(row[0] for row in self._db.execute(
+                'SELECT sample FROM bands WHERE band = ? AND bucket = ?', (band, key)))
+        candidates.discard(exclude)
+        matches = []
+        for sample in candidates:
+            row = self._db.execute('SELECT label, signature FROM samples WHERE sample = ?', (sample,)).fetchone()
+            if row is None:
+                continue
+            score = similarity(signature, _SIGNATURE.unpack(row[1]))
+            if score >= threshold:
+                matches.append((score, sample, row[0]))
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return matches[:limit]
+
+    def query_and_add(self, sample, signature, label=None, threshold=0.5, limit=5):
+        """query() against the samples seen so far, then add this one."""
+        matches = self.query(signature, threshold, limit, exclude=sample)
+        self.add(sample, signature, label)
+        return matches
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
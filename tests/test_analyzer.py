@@ -0,0 +1,64 @@
+import json
+import zipfile
+from pathlib import Path
+
+import analyzer
+from benchmarks.synth_apk import make_apk
+
+SMALL = dict(entries=120, images=20, dex_size=1 << 15, so_size=1 << 14)
+
+
+def test_entry_workers_match_a_serial_scan(tmp_path, monkeypatch):
+    apk_path = str(tmp_path / 'app.apk')
+    make_apk(apk_path, **SMALL)
+    serial = analyzer.analyze_apk(apk_path)
+    monkeypatch.setattr(analyzer, 'PARALLEL_MIN_BYTES', 0)
+    assert analyzer.analyze_apk(apk_path, workers=3) == serial
+    # Entry records the pool cached replay to the same result once the APK's own row is gone
+    with analyzer.open_cache(str(tmp_path / 'cache.sqlite')) as cache:
+        assert analyzer.analyze_apk(apk_path, cache=cache, workers=3) == serial
+        with cache._db:
+            cache._db.execute("DELETE FROM results WHERE key LIKE 'apk:%'")
+        assert analyzer.analyze_apk(apk_path, cache=cache, workers=3) == serial
+    assert serial['code']['suspicious_strings'] and not serial['read_errors']
+
+
+def test_report_copies_apk_images_raw(tmp_path):
+    apk_path = str(tmp_path / 'app.apk')
+    make_apk(apk_path, **SMALL)
+    with zipfile.ZipFile(apk_path, 'a') as apk:
+        apk.writestr('res/raw/deflated.webp', b'RIFF' + b'\0' * 4000, zipfile.ZIP_DEFLATED)
+        apk.writestr('res/raw/copy.webp', b'RIFF' + b'\0' * 4000, zipfile.ZIP_DEFLATED)
+    report = analyzer.create_comprehensive_zip(apk_path, None, '概览', '详细', [('a', 1)],
+                                               output_dir=str(tmp_path / 'out'), apk_images=True)
+    with zipfile.ZipFile(apk_path) as apk, zipfile.ZipFile(report) as zipf:
+        assert zipf.testzip() is None
+        index = json.loads(zipf.read('提取图片/images.json'))
+        images = [info for info in apk.infolist() if Path(info.filename).suffix in ('.png', '.webp')]
+        assert sorted(index) == sorted(info.filename for info in images)
+        for info in images:
+            assert zipf.read(f'提取图片/{index[info.filename]}') == apk.read(info)
+        # Density variants and the two equal payloads are stored once
+        assert index['res/raw/deflated.webp'] == index['res/raw/copy.webp']
+        assert len(set(index.values())) < len(index)
+        payloads = {name for name in zipf.namelist() if name.startswith('提取图片/')}
+        assert payloads == {f'提取图片/{name}' for name in [*index.values(), 'images.json']}
+        assert zipf.read('原始APK/app.apk') == Path(apk_path).read_bytes()
+
+
+def test_image_store_is_shared_between_apks(tmp_path):
+    store = tmp_path / 'store'
+    indexes = []
+    for name in ('a', 'b'):
+        # Same seed, so both APKs carry the same images
+        make_apk(str(tmp_path / f'{name}.apk'), **SMALL)
+        results = analyzer.analyze_apk(str(tmp_path / f'{name}.apk'), image_dir=str(tmp_path / name),
+                                       image_store=str(store))
+        assert results['images'] == SMALL['images']
+        indexes.append(json.loads((tmp_path / name / 'images.json').read_text(encoding='utf-8')))
+    blobs = {path.relative_to(tmp_path).as_posix() for path in store.rglob('*') if path.is_file()}
+    assert len(blobs) < SMALL['images'] and not any(blob.endswith('.tmp') for blob in blobs)
+    for name, index in zip(('a', 'b'), indexes):
+        assert len(index) == SMALL['images']
+        assert {(tmp_path / name / path).resolve().relative_to(tmp_path.resolve()).as_posix()
+                for path in index.values()} == blobs
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import random
+import struct
+import zipfile
+
+import pytest
+
+from apk_digest import CONTENT_CHUNK_SIZE, V1_SIGNATURE_MAX_BYTES, digest_apk
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+# Self-signed test certificate (subject C=CN, O=Test Org, CN=Evil Signer) and
+# a PKCS#7 v1 signature block carrying it.
+with open(os.path.join(FIXTURES, 'cert.der'), 'rb') as f:
+    CERTIFICATE = f.read()
+with open(os.path.join(FIXTURES, 'CERT.RSA'), 'rb') as f:
+    V1_SIGNATURE = f.read()
+SUBJECT = 'C=CN, O=Test Org, CN=Evil Signer'
+
+
+def _prefixed(value):
+    return struct.pack('<I', len(value)) + value
+
+
+def _content_digest(sections):
+    """v2 content digest (algorithm 0x0103, SHA-256 over 1 MB chunks) of sections."""
+    chunks = []
+    for section in sections:
+        for start in range(0, len(section), CONTENT_CHUNK_SIZE):
+            chunk = section[start:start + CONTENT_CHUNK_SIZE]
+            chunks.append(hashlib.sha256(b'\xa5' + struct.pack('<I', len(chunk)) + chunk).digest())
+    return hashlib.sha256(b'\x5a' + struct.pack('<I', len(chunks)) + b''.join(chunks)).digest()
+
+
+def write_apk(path, entries, signed=True):
+    """Write a zip of entries to path, with a v2 signing block over it when signed."""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as apk_zip:
+        for name, data in entries.items():
+            apk_zip.writestr(name, data)
+    if not signed:
+        return
+    with open(path, 'rb') as f:
+        data = f.read()
+    eocd = data.rfind(b'PK\x05\x06')
+    cd_offset = struct.unpack_from('<I', data, eocd + 16)[0]
+    # The digested EOCD points its central directory offset at the signing block
+    digested_eocd = bytearray(data[eocd:])
+    struct.pack_into('<I', digested_eocd, 16, cd_offset)
+    digest = _content_digest([data[:cd_offset], data[cd_offset:eocd], bytes(digested_eocd)])
+    signed_data = (_prefixed(_prefixed(struct.pack('<I', 0x0103) + _prefixed(digest)))
+                   + _prefixed(_prefixed(CERTIFICATE)) + _prefixed(b''))
+    signer = _prefixed(signed_data) + _prefixed(b'') + _prefixed(b'public key')
+    value = _prefixed(_prefixed(signer))
+    pairs = struct.pack('<QI', len(value) + 4, 0x7109871a) + value
+    size = len(pairs) + 24
+    block = struct.pack('<Q', size) + pairs + struct.pack('<Q', size) + b'APK Sig Block 42'
+    eocd_bytes = bytearray(data[eocd:])
+    struct.pack_into('<I', eocd_bytes, 16, cd_offset + len(block))
+    with open(path, 'wb') as f:
+        f.write(data[:cd_offset] + block + data[cd_offset:eocd] + bytes(eocd_bytes))
+
+
+# More than one content chunk, so the digest spans chunk boundaries
+ENTRIES = {
+    'classes.dex': random.Random(0).randbytes(CONTENT_CHUNK_SIZE + 12345),
+    'assets/readme.txt': b'fixture\n' * 100,
+}
+
+
+def test_file_digests(tmp_path):
+    path = tmp_path / 'signed.apk'
+    write_apk(path, ENTRIES)
+    data = path.read_bytes()
+    result = digest_apk(path, workers=2)
+    assert result['md5'] == hashlib.md5(data).hexdigest()
+    assert result['sha1'] == hashlib.sha1(data).hexdigest()
+    assert result['sha256'] == hashlib.sha256(data).hexdigest()
+
+
+def test_v2_content_digest_matches(tmp_path):
+    path = tmp_path / 'signed.apk'
+    write_apk(path, ENTRIES)
+    signature = digest_apk(path)['signature']
+    assert signature['schemes'] == ['v2']
+    assert signature['content_digest'] is True
+    [certificate] = signature['certificates']
+    assert certificate['sha256'] == hashlib.sha256(CERTIFICATE).hexdigest()
+    assert certificate['subject'] == SUBJECT
+    assert certificate['schemes'] == ['v2']
+
+
+@pytest.mark.parametrize('offset', [100, CONTENT_CHUNK_SIZE + 100])
+def test_v2_content_digest_detects_changes(tmp_path, offset):
+    path = tmp_path / 'tampered.apk'
+    write_apk(path, ENTRIES)
+    data = bytearray(path.read_bytes())
+    data[offset] ^= 1
+    path.write_bytes(bytes(data))
+    assert digest_apk(path)['signature']['content_digest'] is False
+
+
+def test_unsigned(tmp_path):
+    path = tmp_path / 'unsigned.apk'
+    write_apk(path, ENTRIES, signed=False)
+    assert digest_apk(path)['signature'] == {'schemes': [], 'certificates': [], 'content_digest': None}
+
+
+def test_v1_certificates(tmp_path):
+    path = tmp_path / 'v1.apk'
+    write_apk(path, dict(ENTRIES, **{'META-INF/CERT.RSA': V1_SIGNATURE}))
+    signature = digest_apk(path)['signature']
+    assert signature['schemes'] == ['v1', 'v2']
+    [certificate] = signature['certificates']
+    assert certificate['schemes'] == ['v1', 'v2']
+    assert digest_apk(path, read_v1=False)['signature']['schemes'] == ['v2']
+
+
+def test_oversize_v1_signature_is_not_read(tmp_path):
+    path = tmp_path / 'v1.apk'
+    write_apk(path, {'META-INF/CERT.RSA': V1_SIGNATURE + bytes(V1_SIGNATURE_MAX_BYTES)}, signed=False)
+    assert digest_apk(path)['signature']['certificates'] == []
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.apk'
+    path.write_bytes(b'')
+    assert digest_apk(path)['sha256'] == hashlib.sha256(b'').hexdigest()
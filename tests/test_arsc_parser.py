@@ -0,0 +1,55 @@
+import struct
+
+import pytest
+
+from analyzer import CODE_MATCHER, SUSPICIOUS_PATTERNS, _new_resource_analysis, _parse_resource_table
+from arsc_parser import ARSCError, ResourceTable
+from axml_parser import AXMLError
+from benchmarks.synth_apk import resource_table
+
+STRINGS = ['Hello', '请联系QQ解锁', 'plain text', '设备已锁定']
+
+
+def test_names():
+    table = ResourceTable(resource_table(STRINGS))
+    assert table.names('string') == ['string/str_0', 'string/str_1', 'string/str_2', 'string/str_3']
+    assert table.names('drawable') == []
+
+
+def test_find_strings():
+    table = ResourceTable(resource_table(STRINGS))
+    found = {SUSPICIOUS_PATTERNS[rule][1]: string for rule, string in table.find_strings(CODE_MATCHER)}
+    assert found['社交应用操作'] == '请联系QQ解锁'
+    assert set(found.values()) <= set(STRINGS) - {'Hello', 'plain text'}
+
+
+def test_empty_pool():
+    assert ResourceTable(resource_table([])).find_strings(CODE_MATCHER) == []
+
+
+def test_not_a_resource_table():
+    with pytest.raises(ARSCError):
+        ResourceTable(b'PK\x03\x04' + bytes(60))
+
+
+def test_truncated_tables_raise_arsc_error():
+    # Every prefix either parses or fails with one of the errors the analyzer reports
+    data = resource_table(STRINGS)
+    for end in range(len(data)):
+        try:
+            _parse_resource_table(data[:end], _new_resource_analysis())
+        except (ARSCError, AXMLError, struct.error):
+            pass
+
+
+@pytest.mark.parametrize('chunk_type', [0x0201, 0x0202])
+def test_chunk_ending_at_its_header(chunk_type):
+    data = resource_table(STRINGS)
+    chunk = data.index(struct.pack('<H', chunk_type), data.index(struct.pack('<H', 0x0202)))
+    # The table ends right after the chunk's common 8-byte header
+    with pytest.raises(ARSCError):
+        ResourceTable(data[:chunk + 8])
+    corrupt = bytearray(data)
+    struct.pack_into('<H', corrupt, chunk + 2, 8)
+    with pytest.raises(ARSCError):
+        ResourceTable(bytes(corrupt))
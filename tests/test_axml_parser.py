@@ -0,0 +1,43 @@
+import struct
+
+import pytest
+
+from axml_parser import AXMLDocument, AXMLError, is_axml, parse_manifest
+from benchmarks.synth_apk import binary_manifest
+
+MANIFEST = binary_manifest('com.fixture', ['android.permission.SEND_SMS', 'android.permission.INTERNET'],
+                           ['.MainActivity', 'com.other.Activity'], ['com.fixture.LockService'])
+
+
+def test_parse_manifest():
+    analysis = parse_manifest(MANIFEST)
+    assert analysis['package'] == 'com.fixture'
+    assert analysis['permissions'] == ['android.permission.SEND_SMS', 'android.permission.INTERNET']
+    # A leading '.' is qualified with the package name
+    assert analysis['activities'] == ['com.fixture.MainActivity', 'com.other.Activity']
+    assert analysis['services'] == ['com.fixture.LockService']
+    assert analysis['receivers'] == analysis['providers'] == analysis['features'] == []
+
+
+def test_text_manifest_is_not_axml():
+    assert not is_axml(b'<?xml version="1.0" encoding="utf-8"?><manifest/>')
+    with pytest.raises(AXMLError):
+        parse_manifest(b'<?xml version="1.0" encoding="utf-8"?><manifest/>')
+
+
+def test_missing_string_pool():
+    with pytest.raises(AXMLError):
+        parse_manifest(struct.pack('<HHI', 0x0003, 8, 8))
+
+
+def test_truncated_manifest_keeps_earlier_elements():
+    analysis = parse_manifest(MANIFEST[:len(MANIFEST) - 100])
+    assert analysis['activities'] == ['com.fixture.MainActivity', 'com.other.Activity']
+    assert analysis['services'] == []
+
+
+def test_bad_chunk_size():
+    data = bytearray(MANIFEST)
+    struct.pack_into('<I', data, AXMLDocument(MANIFEST)._body + 4, 0)
+    with pytest.raises(AXMLError):
+        parse_manifest(bytes(data))
@@ -0,0 +1,51 @@
+import io
+import json
+import os
+
+import batch
+from benchmarks.synth_apk import make_apk
+
+SMALL = dict(entries=60, images=10, dex_size=1 << 15, so_size=1 << 14)
+
+
+def test_completed_apks_skips_a_truncated_last_line(tmp_path):
+    output = tmp_path / 'results.jsonl'
+    output.write_text(json.dumps({'apk': 'a.apk'}) + '\n' + json.dumps({'apk': 'b.apk', 'error': 'x'}) + '\n'
+                      + '{"apk": "c.ap', encoding='utf-8')
+    assert batch.completed_apks(str(output)) == {'a.apk', 'b.apk'}
+    assert batch.completed_apks(str(tmp_path / 'missing.jsonl')) == set()
+
+
+def _die_on_crash(apk_path, *args, **kwargs):
+    if 'crash' in os.path.basename(apk_path):
+        os._exit(1)
+    return {'apk': apk_path, 'pid': os.getpid()}
+
+
+def test_run_survives_a_dead_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'analyze_one', _die_on_crash)
+    apks = [f'{i}.apk' for i in range(3)] + ['crash.apk'] + [f'{i}.apk' for i in range(3, 8)]
+    out = io.StringIO()
+    batch.run(apks, out, 2, None)
+    records = {record['apk']: record for record in map(json.loads, out.getvalue().splitlines())}
+    assert sorted(records) == sorted(apks)
+    assert 'BrokenProcessPool' in records['crash.apk']['error']
+    # Only the APKs on the broken pool are lost; the rest ran on a new one
+    assert sum('error' in record for record in records.values()) <= 2
+    assert len({record['pid'] for record in records.values() if 'pid' in record}) > 2
+
+
+def test_run_on_a_pool_matches_a_single_process(tmp_path):
+    apks = [str(tmp_path / f'{i}.apk') for i in range(3)]
+    for seed, apk_path in enumerate(apks):
+        make_apk(apk_path, seed=seed, **SMALL)
+    results = []
+    for jobs in (1, 2):
+        out = io.StringIO()
+        batch.run(apks, out, jobs, None)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        for record in records:
+            record.pop('timings')
+        results.append(sorted(records, key=lambda record: record['apk']))
+    assert results[0] == results[1]
+    assert not any('error' in record for record in results[0])
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from benchmarks.synth_apk import dex_file
+from dex_parser import DexError, DexFile, find_dangerous_apis
+
+METHODS = [('Ljava/lang/Runtime;', 'exec'), ('Landroid/telephony/SmsManager;', 'sendTextMessage'),
+           ('Landroid/app/admin/DevicePolicyManager;', 'isAdminActive')]
+
+
+def fixture_dex():
+    return dex_file(METHODS, random.Random(3), 4096)
+
+
+def test_references():
+    dex = DexFile(fixture_dex())
+    assert dex.references('Ljava/lang/Runtime;', 'exec')
+    assert not dex.references('Ljava/lang/Runtime;', 'halt')
+    assert dex.references('Landroid/app/admin/DevicePolicyManager;')
+    assert not dex.references('Ldalvik/system/DexClassLoader;')
+
+
+def test_find_dangerous_apis():
+    found = find_dangerous_apis(fixture_dex())
+    assert ('执行系统命令', 'java.lang.Runtime.exec') in found
+    assert ('发送短信', 'android.telephony.SmsManager.sendTextMessage') in found
+    # A referenced class flags its class-wide rule, not the methods it does not call
+    assert ('设备管理器', 'android.app.admin.DevicePolicyManager') in found
+    assert not any(api.endswith('.wipeData') for _description, api in found)
+
+
+def test_not_a_dex_file():
+    with pytest.raises(DexError):
+        DexFile(b'PK\x03\x04' + bytes(0x70))
+
+
+def test_id_table_out_of_bounds():
+    with pytest.raises(DexError):
+        DexFile(fixture_dex()[:0x80])
@@ -0,0 +1,62 @@
+import random
+import zipfile
+
+import pytest
+
+import analyzer
+from benchmarks.synth_apk import elf_library
+from elf_parser import ELFError, ELFFile, analyze_elf
+
+
+def fixture_library(soname='libfixture.so'):
+    return elf_library(soname, ['libc.so', 'libdl.so'], ['system', 'ptrace', 'malloc'],
+                       ['Java_com_fixture_Native_run', 'JNI_OnLoad', 'helper'], random.Random(5), 1024)
+
+
+def test_analyze_elf():
+    record = analyze_elf(fixture_library())
+    assert record['arch'] == 'arm64'
+    assert record['soname'] == 'libfixture.so'
+    assert record['needed'] == ['libc.so', 'libdl.so']
+    assert sorted(record['jni_exports']) == ['JNI_OnLoad', 'Java_com_fixture_Native_run']
+    assert sorted(record['imports']) == ['ptrace', 'system']
+    assert record['packers'] == []
+
+
+def test_packer_from_soname():
+    assert analyze_elf(fixture_library('libjiagu_a64.so'))['packers'] == ['360加固']
+
+
+def test_stripped_section_headers():
+    # Packers damage the section headers; the dynamic segment still leads to the symbols
+    data = bytearray(fixture_library())
+    data[0x3C:0x40] = bytes(4)   # e_shnum, e_shstrndx
+    record = analyze_elf(bytes(data))
+    assert record['needed'] == ['libc.so', 'libdl.so']
+    assert sorted(record['imports']) == ['ptrace', 'system']
+
+
+@pytest.mark.parametrize('offset, value', [(4, 0), (4, 3), (5, 0), (5, 3)])
+def test_unknown_class_or_byte_order(offset, value):
+    data = bytearray(fixture_library())
+    data[offset] = value
+    with pytest.raises(ELFError):
+        ELFFile(bytes(data))
+
+
+def test_not_an_elf_file():
+    with pytest.raises(ELFError):
+        ELFFile(b'MZ' + bytes(126))
+
+
+def test_extracted_tree_matches_the_archive_scan(tmp_path):
+    apk_path = str(tmp_path / 'app.apk')
+    with zipfile.ZipFile(apk_path, 'w', zipfile.ZIP_DEFLATED) as apk:
+        apk.writestr('lib/arm64-v8a/libfixture.so', fixture_library())
+        apk.writestr('lib/arm64-v8a/libjiagu.so', b'not an elf')
+        apk.writestr('assets/payload.bin', fixture_library('libhidden.so'))
+        apk.writestr('assets/readme.txt', b'text')
+    native = analyzer.scan_apk(apk_path, [analyzer.NativeVisitor()])['native']
+    extract_dir, _files = analyzer.extract_apk_completely(apk_path, str(tmp_path / 'extract'))
+    assert analyzer.analyze_native_libraries(extract_dir) == native
+    assert sorted(native) == ['assets/payload.bin', 'lib/arm64-v8a/libfixture.so']
@@ -0,0 +1,65 @@
+import random
+import zipfile
+
+import pytest
+
+import analyzer
+from benchmarks.synth_apk import dex_file, elf_library
+from file_types import is_disguised, sniff
+
+
+@pytest.mark.parametrize('head, kind', [
+    (b'', 'empty'),
+    (b'dex\n035\0', 'dex'),
+    (b'\x7fELF\x02\x01', 'elf'),
+    (b'PK\x03\x04', 'zip'),
+    (b'\x89PNG\r\n\x1a\n', 'image'),
+    (b'RIFF\0\0\0\0WEBPVP8 ', 'image'),
+    (b'RIFF\0\0\0\0WAVEfmt ', 'media'),
+    (b'BM' + bytes(4) + bytes(4) + bytes(4) + (40).to_bytes(4, 'little'), 'image'),
+    (b'\x1f\x8b\x08', 'compressed'),
+    ('<resources>屏幕</resources>'.encode('utf-8'), 'text'),
+    # A multi-byte character cut off at the end of the head is still text
+    ('é'.encode('utf-8') * 255 + b'\xc3', 'text'),
+    (b'\x01\x02\x00\x03', 'binary'),
+])
+def test_sniff(head, kind):
+    assert sniff(head) == kind
+
+
+@pytest.mark.parametrize('name, kind, disguised', [
+    ('classes.dex', 'dex', False),
+    ('lib/arm64-v8a/libx.so', 'elf', False),
+    ('assets/plugin.jar', 'zip', False),
+    ('res/drawable/icon.png', 'image', False),
+    ('res/drawable/icon.png', 'empty', False),
+    # Code and archives under any other name
+    ('assets/icon.png', 'dex', True),
+    ('assets/data.bin', 'elf', True),
+    ('assets/payload', 'zip', True),
+    ('classes.dex', 'zip', True),
+    # An image extension over something that is not an image
+    ('assets/logo.jpg', 'text', True),
+    ('assets/logo.jpg', 'binary', True),
+    # Other mismatches are left alone
+    ('assets/readme.txt', 'binary', False),
+    ('assets/font.ttf', 'font', False),
+])
+def test_is_disguised(name, kind, disguised):
+    assert is_disguised(name, kind) == disguised
+
+
+def test_scan_reports_disguised_entries(tmp_path):
+    rng = random.Random(0)
+    path = str(tmp_path / 'app.apk')
+    with zipfile.ZipFile(path, 'w') as apk:
+        apk.writestr('classes.dex', dex_file([('Lcom/a/A;', 'run')], rng, 4096), zipfile.ZIP_DEFLATED)
+        # Sniffed from the inflated start of a deflated entry, and from a stored one
+        apk.writestr('res/drawable/splash.png', dex_file([('Lcom/b/B;', 'run')], rng, 4096), zipfile.ZIP_DEFLATED)
+        apk.writestr('assets/sound.ogg', elf_library('libx.so', [], [], [], rng, 4096), zipfile.ZIP_STORED)
+        apk.writestr('res/drawable/icon.png', b'\x89PNG\r\n\x1a\n' + bytes(100))
+    structure = analyzer.scan_apk(path, [analyzer.StructureVisitor()])['structure']
+    assert structure['disguised_files'] == ['res/drawable/splash.png (dex)', 'assets/sound.ogg (elf)']
+    assert structure['content_types'] == {'dex': 2, 'elf': 1, 'image': 1}
+    findings = analyzer.detect_malicious_behavior({}, {}, {}, structure_analysis=structure)
+    assert '伪装文件: res/drawable/splash.png (dex)' in findings
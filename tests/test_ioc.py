@@ -0,0 +1,53 @@
+import pytest
+
+from ioc import DomainBlocklist, url_host
+
+RULES = ['evil.example', '*.cdn.example', 'ads.*.track.example', '=exact.example', '10.0.0.1']
+
+
+@pytest.mark.parametrize('host, rule', [
+    # A plain rule covers the domain and every subdomain, by whole labels only
+    ('evil.example', 'evil.example'),
+    ('a.b.EVIL.example.', 'evil.example'),
+    ('notevil.example', None),
+    ('evil.example.org', None),
+    # *. matches subdomains but not the domain itself
+    ('cdn.example', None),
+    ('x.cdn.example', '*.cdn.example'),
+    ('y.x.cdn.example', '*.cdn.example'),
+    # An inner * stands for exactly one label
+    ('ads.eu.track.example', 'ads.*.track.example'),
+    ('img.ads.eu.track.example', 'ads.*.track.example'),
+    ('ads.track.example', None),
+    ('eu.track.example', None),
+    # = and IP addresses only match themselves
+    ('exact.example', '=exact.example'),
+    ('www.exact.example', None),
+    ('10.0.0.1', '10.0.0.1'),
+    ('1.10.0.0.1', None),
+])
+def test_match(host, rule):
+    assert DomainBlocklist(RULES).match(host) == rule
+
+
+def test_match_url():
+    blocklist = DomainBlocklist(RULES)
+    assert url_host('HTTPS://User@X.CDN.example:8443/p?q') == 'x.cdn.example'
+    assert blocklist.match_url('https://user@x.cdn.example:8443/pay') == '*.cdn.example'
+    assert blocklist.match_url('www.evil.example/index.html') == 'evil.example'
+    assert blocklist.match_url('http://[::1') is None
+    assert blocklist.match_url('http://safe.example/evil.example') is None
+
+
+def test_load_feed(tmp_path):
+    feed = tmp_path / 'feed.txt'
+    feed.write_text('# hosts file\n0.0.0.0 tracker.example  # ads\n\nhttps://phish.example/login\n*.c2.example\n',
+                    encoding='utf-8')
+    blocklist = DomainBlocklist().load(str(feed))
+    assert len(blocklist) == 3
+    assert blocklist.match('a.tracker.example') == 'tracker.example'
+    assert blocklist.match('phish.example') == 'phish.example'
+    assert blocklist.match('c2.example') is None and blocklist.match('x.c2.example') == '*.c2.example'
+    assert blocklist.fingerprint() != DomainBlocklist(['tracker.example']).fingerprint()
+    same_rules = DomainBlocklist(['tracker.example', 'phish.example', '*.c2.example'])
+    assert blocklist.fingerprint() == same_rules.fingerprint()
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from analyzer import CODE_MATCHER, URL_DELIMITER, URL_LOOKAHEAD, URL_REGEX
+from pattern_matcher import MatchStream, TokenStream
+
+PIECES = [b'http://', b'https://', b'www.', b'example.com/', b'lock', b'LOCK', b'qq', b'root', b'su',
+          b'Runtime.getRuntime', b'\xe5\xbe\xae\xe4\xbf\xa1', b' ', b'<', b'"', b'\n', b'\x1e', b'\x00',
+          b'a', b'/', b'?x=1', b'\xff']
+
+
+def random_data(rng, pieces=200):
+    return b''.join(rng.choice(PIECES) for _ in range(pieces))
+
+
+def random_chunks(rng, data):
+    """data split at random points, with some empty chunks."""
+    cuts = sorted(rng.randrange(len(data) + 1) for _ in range(rng.randrange(1, 30)))
+    bounds = [0] + cuts + [len(data)]
+    return [data[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_match_stream_equals_whole_scan(seed):
+    rng = random.Random(seed)
+    data = random_data(rng)
+    for first_only in (False, True):
+        stream = MatchStream(CODE_MATCHER, first_only)
+        for chunk in random_chunks(rng, data):
+            stream.feed(chunk)
+        expected = CODE_MATCHER.scan(data, first_only)
+        assert stream.close() == expected
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_token_stream_equals_findall(seed):
+    rng = random.Random(seed)
+    data = random_data(rng)
+    max_length = rng.choice([8, 32, 4096])
+    stream = TokenStream(URL_REGEX, URL_DELIMITER, URL_LOOKAHEAD, max_length)
+    for chunk in random_chunks(rng, data):
+        stream.feed(memoryview(chunk) if rng.random() < 0.5 else chunk)
+    assert stream.close() == [token[:max_length] for token in URL_REGEX.findall(data)]
+
+
+def test_token_stream_bounds_an_unterminated_token():
+    stream = TokenStream(URL_REGEX, URL_DELIMITER, URL_LOOKAHEAD, 64)
+    stream.feed(b'x http://evil.example/')
+    for _ in range(100):
+        stream.feed(b'a' * 65536)
+        assert stream._open_length <= 64
+    stream.feed(b' www.example.com')
+    assert stream.close() == [b'http://evil.example/' + b'a' * 44, b'www.example.com']
@@ -0,0 +1,45 @@
+import analyzer
+import result_cache
+from benchmarks.synth_apk import make_apk
+from result_cache import ResultCache
+
+
+def test_version_change_drops_rows(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with ResultCache('v1', path) as cache:
+        cache.put('a', {'x': 1})
+        assert cache.get('a') == {'x': 1}
+    with ResultCache('v1', path) as cache:
+        assert cache.get('a') == {'x': 1}
+    with ResultCache('v2', path) as cache:
+        assert cache.get('a') is None
+        cache.put('b', [])
+    with ResultCache('v1', path) as cache:
+        assert cache.get('a') is None and cache.get('b') is None
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, 'TOUCH_INTERVAL', 0)
+    # Each value is 12 bytes of JSON; room for three
+    with ResultCache('v1', str(tmp_path / 'cache.sqlite'), max_bytes=36) as cache:
+        for key in 'abc':
+            cache.put(key, 'x' * 10)
+        assert cache.get('a') == 'x' * 10   # a is now newer than b
+        cache.put('d', 'x' * 10)
+        assert cache.get('b') is None
+        assert [cache.get(key) for key in 'acd'] == ['x' * 10] * 3
+        total = cache._db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        assert total == 36
+
+
+def test_clean_code_entries_are_not_rescanned(tmp_path, monkeypatch):
+    # Nothing planted: every code entry is clean
+    apk_path = str(tmp_path / 'app.apk')
+    make_apk(apk_path, entries=60, images=10, dex_size=1 << 15, so_size=1 << 14, planted=False)
+    with analyzer.open_cache(str(tmp_path / 'cache.sqlite')) as cache:
+        first = analyzer.scan_apk(apk_path, [analyzer.CodeVisitor()], cache)
+        fed = []
+        monkeypatch.setattr(analyzer.CodeVisitor, 'feed', lambda self, info, chunk: fed.append(info.filename))
+        second = analyzer.scan_apk(apk_path, [analyzer.CodeVisitor()], cache)
+    assert fed == []
+    assert first['code'] == second['code']
@@ -0,0 +1,99 @@
+import http.client
+import json
+import os
+import signal
+import threading
+import time
+from multiprocessing import active_children
+
+import pytest
+
+import service
+from benchmarks.synth_apk import make_apk
+
+SMALL = dict(entries=40, images=4, dex_size=1 << 15, so_size=1 << 14)
+
+
+@pytest.fixture
+def server():
+    analysis = service.AnalysisService(1, None)
+    http_server = service.make_server('127.0.0.1', 0, analysis, max_upload=1 << 20)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    try:
+        yield http_server
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+        analysis.close()
+
+
+def request(http_server, method, path, body=b'', headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', http_server.server_address[1], timeout=60)
+    connection.putrequest(method, path)
+    headers = {'Content-Length': str(len(body)), **(headers or {})}
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.endheaders()
+    connection.send(body)
+    response = connection.getresponse()
+    status, lines = response.status, response.read().decode('utf-8').splitlines()
+    connection.close()
+    return status, [json.loads(line) for line in lines]
+
+
+def test_workers_start_with_the_service(server):
+    assert active_children()
+
+
+def test_upload_status_and_events(server, tmp_path):
+    path = tmp_path / 'app.apk'
+    make_apk(str(path), **SMALL)
+    status, [job] = request(server, 'POST', '/jobs?priority=3&name=app.apk', path.read_bytes(),
+                            {'Content-Type': 'application/octet-stream'})
+    assert status == 202
+    status, events = request(server, 'GET', f"/jobs/{job['id']}/events")
+    kinds = [event['event'] for event in events]
+    assert kinds[0] == 'queued' and kinds[-1] == 'done'
+    assert 'started' in kinds and 'findings' in kinds
+    status, [snapshot] = request(server, 'GET', f"/jobs/{job['id']}")
+    assert status == 200 and snapshot['status'] == 'done' and snapshot['priority'] == 3
+    assert snapshot['record']['findings']
+    # The upload is removed once its job ends
+    assert not os.path.exists(snapshot['apk'])
+    assert request(server, 'GET', '/jobs/999')[0] == 404
+
+
+def test_local_path_job(server, tmp_path):
+    path = tmp_path / 'app.apk'
+    make_apk(str(path), **SMALL)
+    body = json.dumps({'path': str(path)}).encode()
+    status, [job] = request(server, 'POST', '/jobs', body, {'Content-Type': 'application/json'})
+    assert status == 202
+    request(server, 'GET', f"/jobs/{job['id']}/events")
+    assert server.service.jobs[job['id']].status == 'done'
+    missing = json.dumps({'path': str(tmp_path / 'missing.apk')}).encode()
+    assert request(server, 'POST', '/jobs', missing, {'Content-Type': 'application/json'})[0] == 400
+
+
+@pytest.mark.parametrize('length, status', [('abc', 400), ('-5', 400), (str(2 << 20), 413)])
+def test_bad_content_length(server, length, status):
+    assert request(server, 'POST', '/jobs', headers={'Content-Length': length})[0] == status
+
+
+def test_dead_worker_fails_its_job_only(server, tmp_path):
+    slow = tmp_path / 'slow.apk'
+    make_apk(str(slow), entries=2000, dex_size=4 << 20, images=400)
+    quick = tmp_path / 'quick.apk'
+    make_apk(str(quick), **SMALL)
+    analysis = server.service
+    first = analysis.submit(str(slow))
+    deadline = time.monotonic() + 60
+    while first.status != 'running' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for process in active_children():
+        os.kill(process.pid, signal.SIGKILL)
+    second = analysis.submit(str(quick))
+    while not (first.finished and second.finished) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert first.status == 'failed' and 'BrokenProcessPool' in first.record['error']
+    assert second.status == 'done'
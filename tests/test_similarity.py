@@ -0,0 +1,66 @@
+import shutil
+
+import batch
+from benchmarks.synth_apk import make_apk
+from similarity import SimilarityIndex, add_features, densify, new_bins, sample_label, similarity
+
+SMALL = dict(entries=60, images=10, dex_size=1 << 15, so_size=1 << 14)
+
+
+def signature(features):
+    return densify(add_features(new_bins(), features))
+
+
+def test_similarity_estimates_jaccard():
+    features = [b'f%d' % i for i in range(1000)]
+    assert similarity(signature(features), signature(features)) == 1.0
+    assert similarity(signature(features), signature([b'g%d' % i for i in range(1000)])) < 0.1
+    # 900 shared of 1100 features: Jaccard 0.82
+    close = similarity(signature(features), signature(features[100:] + [b'h%d' % i for i in range(100)]))
+    assert 0.7 < close < 0.95
+    assert densify(new_bins()) is None
+
+
+def test_index_add_and_query(tmp_path):
+    features = [b'f%d' % i for i in range(1000)]
+    with SimilarityIndex(str(tmp_path / 'index.sqlite')) as index:
+        index.add('a', signature(features), 'first')
+        index.add('b', signature([b'g%d' % i for i in range(1000)]), 'other')
+        assert len(index) == 2
+        [(score, sample, label)] = index.query(signature(features[:950]))
+        assert (sample, label) == ('a', 'first') and score > 0.8
+        # query_and_add never reports the sample itself, and adding it again replaces it
+        assert index.query_and_add('a', signature(features), 'renamed') == []
+        assert len(index) == 2
+        assert index.query(signature(features))[0][1:] == ('a', 'renamed')
+
+
+def test_sample_label():
+    stages = {'manifest': {'package': 'com.example'}, 'identity': {'sha256': 'ab' * 32}}
+    assert sample_label('/tmp/x/app.apk', stages) == 'app.apk'
+    assert sample_label('/tmp/x/tmp1234.apk', stages, 'upload.apk') == 'upload.apk'
+    assert sample_label('/tmp/x/tmp1234.apk', stages, '') == 'com.example'
+
+
+def test_analyze_one_keys_samples_by_digest(tmp_path, monkeypatch):
+    index = SimilarityIndex(str(tmp_path / 'index.sqlite'))
+    monkeypatch.setattr(batch, '_similarity', index)
+    try:
+        original = tmp_path / 'original.apk'
+        make_apk(str(original), **SMALL)
+        copy = tmp_path / 'copy.apk'
+        shutil.copy(original, copy)
+        variant = tmp_path / 'variant.apk'
+        make_apk(str(variant), planted=False, **SMALL)
+
+        first = batch.analyze_one(str(original))
+        assert 'error' not in first and first['similar'] == []
+        # The same APK under another path is the same sample, not its own near-duplicate
+        assert batch.analyze_one(str(copy))['similar'] == []
+        assert len(index) == 1
+        [match] = batch.analyze_one(str(variant), label='')['similar']
+        assert match['sample'] == first['stages']['identity']['sha256']
+        assert match['label'] == 'copy.apk'
+        assert len(index) == 2
+    finally:
+        index.close()
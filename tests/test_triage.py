@@ -0,0 +1,51 @@
+import zipfile
+
+import pytest
+
+from analyzer import open_cache
+from benchmarks.synth_apk import make_apk
+from ioc import DomainBlocklist
+from triage import TriagePolicy, finding_score, triage
+
+SMALL = dict(entries=40, images=4, dex_size=1 << 15, so_size=1 << 14)
+
+
+def test_finding_score_counts_each_kind_once():
+    score, kinds = finding_score([
+        '危险API: 发送短信: android.telephony.SmsManager.sendTextMessage (classes.dex)',
+        '危险API: 发送短信: android.telephony.SmsManager.sendTextMessage (classes2.dex)',
+        '危险API: 执行命令: system (lib/arm64-v8a/libx.so)',
+        'Root相关: classes.dex',
+        '锁机相关: classes.dex',
+        '可疑URL: http://lock.example.com/pay',
+    ])
+    assert kinds == {'危险API: 发送短信': 2, '危险API: 执行命令': 1, '可疑URL': 1}
+    assert score == 4
+
+
+@pytest.mark.parametrize('planted, verdict', [(True, 'malicious'), (False, 'benign')])
+def test_full_scan_verdict(tmp_path, planted, verdict):
+    path = tmp_path / 'synth.apk'
+    make_apk(str(path), planted=planted, **SMALL)
+    record = triage(str(path), TriagePolicy(deep=True))
+    assert record['tier'] == 2
+    # The keyword rules hit the unplanted APK too, but weigh nothing
+    assert record['findings']
+    assert record['verdict'] == verdict
+
+
+def test_cached_verdict_follows_the_blocklist(tmp_path):
+    path = tmp_path / 'urls.apk'
+    with zipfile.ZipFile(path, 'w') as apk_zip:
+        apk_zip.writestr('assets/config.txt', b'endpoint=http://pay.evil-domain.example/api\n')
+    cache = open_cache(str(tmp_path / 'cache.sqlite'))
+    try:
+        first = triage(str(path), TriagePolicy(), cache, blocklist=DomainBlocklist())
+        assert (first['tier'], first['verdict']) == (2, 'benign')
+        assert triage(str(path), TriagePolicy(), cache, blocklist=DomainBlocklist())['tier'] == 0
+        # A domain blocklisted since is not answered from the cache
+        blocked = triage(str(path), TriagePolicy(), cache, blocklist=DomainBlocklist(['evil-domain.example']))
+        assert blocked['tier'] == 2
+        assert any(finding.startswith('恶意域名') for finding in blocked['findings'])
+    finally:
+        cache.close()
@@ -0,0 +1,56 @@
+import zipfile
+
+import analyzer
+from zip_budget import DecompressionBudget, read_central_directory_size
+
+
+def write_zip(path, entries):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return str(path)
+
+
+def scan(path, budget):
+    return analyzer.scan_apk(path, [analyzer.FileListVisitor(), analyzer.CodeVisitor()], budget=budget)
+
+
+def test_bomb_is_only_sampled(tmp_path):
+    # 32 MiB of spaces deflate to about 32 KiB
+    bomb = b'accessibility ' + b' ' * (32 << 20) + b' killProcess'
+    path = write_zip(tmp_path / 'bomb.apk', [('assets/bomb.txt', bomb), ('assets/ok.txt', b'System.exit')])
+    results = scan(path, DecompressionBudget(sample_bytes=1 << 20))
+    [violation] = results['budget']
+    assert violation.startswith('assets/bomb.txt: 压缩比') and '仅扫描前 1048576 字节' in violation
+    suspicious = results['code']['suspicious_strings']
+    # The rule in the sampled prefix hits, the one past it is never inflated
+    assert '无障碍服务: assets/bomb.txt' in suspicious and '进程操作: assets/bomb.txt' not in suspicious
+    assert '系统操作: assets/ok.txt' in suspicious
+    # Below RATIO_MIN_BYTES compressibility alone is fine
+    assert scan(write_zip(tmp_path / 'small.apk', [('blank.txt', b' ' * 100000)]), None)['budget'] == []
+
+
+def test_oversize_entries_and_total(tmp_path):
+    path = write_zip(tmp_path / 'big.apk', [
+        ('AndroidManifest.xml', b'<manifest/>' * 200),
+        ('assets/a.txt', b'lockNow' * 100),
+        ('assets/b.txt', b'lockNow' * 100),
+    ])
+    budget = DecompressionBudget(max_entry_bytes=1000, sample_bytes=100)
+    results = scan(path, budget)
+    assert results['budget'] == ['AndroidManifest.xml: 声明大小 2200 字节超过单条目上限 1000，仅扫描前 100 字节']
+    with zipfile.ZipFile(path) as archive:
+        assert analyzer.read_manifest(archive, budget.tracker())['error'] == 'Manifest 超出解压限制'
+    results = scan(path, DecompressionBudget(max_total_bytes=3000))
+    assert results['budget'] == ['解压总量达到上限 3000 字节，跳过 1 个条目']
+    assert [name for name, _size in results['files']] == ['AndroidManifest.xml', 'assets/a.txt', 'assets/b.txt']
+    assert results['code']['suspicious_strings'] == ['锁机相关: assets/a.txt']
+
+
+def test_too_many_entries_are_not_opened(tmp_path):
+    path = write_zip(tmp_path / 'many.apk', [(f'assets/{i}.txt', b'lock') for i in range(50)])
+    with open(path, 'rb') as fp:
+        assert read_central_directory_size(fp)[0] == 50
+    results = scan(path, DecompressionBudget(max_entries=10))
+    assert results['budget'] == ['条目数 50 超过上限 10，未解压任何内容']
+    assert results['files'] == [] and results['code']['suspicious_strings'] == []
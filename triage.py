@@ -0,0 +1,236 @@
+"""Tiered triage: stop at the first tier that settles the verdict.
+
+    tier 0  central directory and file digests: decompression budget,
+            known samples and signers, earlier verdicts in the cache
+    tier 1  AndroidManifest.xml alone: dangerous permissions
+    tier 2  the full analyze_apk scan and detect_malicious_behavior
+
+Tier 2 only runs when the first two are inconclusive, or when the policy
+is deep. Verdicts are 'benign', 'suspicious' or 'malicious'.
+"""
+
+import hashlib
+import json
+import zipfile
+from contextlib import ExitStack, nullcontext
+
+from analyzer import (DEFAULT_BUDGET, RULES_VERSION, analyze_apk, dangerous_permissions, detect_malicious_behavior,
+                      read_manifest)
+from apk_digest import digest_apk
+
+VERDICTS = ('benign', 'suspicious', 'malicious')
+
+# Tier-2 score of each kind of finding. A finding's kind is its
+# 'prefix: detail' (e.g. '危险API: 发送短信') when listed here, else its
+# prefix; each kind counts once however many files it hits. The keyword
+# rules ('Root相关', '社交应用操作', ...) match nearly every APK, so kinds
+# not listed weigh nothing.
+FINDING_WEIGHTS = {
+    '恶意域名': 4,
+    '签名摘要不符': 2,
+    '伪装文件': 2,
+    '压缩包异常': 1,
+    '加固': 1,
+    '可疑URL': 1,
+    '危险权限: android.permission.BIND_ACCESSIBILITY_SERVICE': 2,
+    '危险权限: android.permission.SYSTEM_ALERT_WINDOW': 1,
+    '危险权限: android.permission.WRITE_SECURE_SETTINGS': 2,
+    '危险权限: android.permission.DEVICE_ADMIN': 2,
+    '危险权限: android.permission.PACKAGE_USAGE_STATS': 1,
+    '危险API: 执行系统命令': 1,
+    '危险API: 强制锁屏': 2,
+    '危险API: 重置锁屏密码': 3,
+    '危险API: 清除设备数据': 3,
+    '危险API: 设备管理器': 1,
+    '危险API: 无障碍服务': 1,
+    '危险API: 悬浮窗覆盖': 1,
+    '危险API: 隐藏图标': 2,
+    '危险API: 发送短信': 2,
+    '危险API: 动态加载代码': 1,
+    '危险API: 执行命令': 1,
+    '危险API: 反调试': 1,
+}
+
+
+class TriagePolicy:
+    """Thresholds and known samples for triage().
+
+    At tier 1 an APK with at most benign_max_permissions dangerous
+    permissions (and nothing flagged at tier 0) is benign, and one with at
+    least malicious_min_permissions is malicious. After a full scan the
+    findings are scored (see finding_score): at least malicious_min_score
+    is malicious, at least suspicious_min_score suspicious and less benign.
+    known maps the SHA-256 of an APK or of a signer certificate to a
+    verdict; deep always runs tier 2.
+    """
+
+    def __init__(self, benign_max_permissions=0, malicious_min_permissions=3, malicious_min_score=5,
+                 suspicious_min_score=2, known=None, deep=False):
+        self.benign_max_permissions = benign_max_permissions
+        self.malicious_min_permissions = malicious_min_permissions
+        self.malicious_min_score = malicious_min_score
+        self.suspicious_min_score = suspicious_min_score
+        self.known = dict(known or {})
+        self.deep = deep
+
+    def load_known(self, path):
+        """Add '<sha256> <verdict>' lines (APK or certificate digests); '#' starts a comment."""
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                fields = line.split('#', 1)[0].split()
+                if len(fields) >= 2 and fields[1] in VERDICTS:
+                    self.known[fields[0].lower()] = fields[1]
+        return self
+
+    def key(self):
+        """Thresholds as a string, so cached verdicts are only reused under the same ones."""
+        return (f"{self.benign_max_permissions}:{self.malicious_min_permissions}:"
+                f"{self.malicious_min_score}:{self.suspicious_min_score}")
+
+
+# Cached verdicts depend on the scan rules and on the weights
+VERDICT_VERSION = hashlib.sha256(json.dumps(
+    [RULES_VERSION, FINDING_WEIGHTS], ensure_ascii=False, sort_keys=True
+).encode('utf-8')).hexdigest()[:16]
+
+
+def finding_score(findings):
+    """(score, {kind: weight}) of findings, from FINDING_WEIGHTS over their distinct kinds."""
+    kinds = {}
+    for finding in findings:
+        parts = finding.split(': ', 2)
+        kind = ': '.join(parts[:2])
+        if kind not in FINDING_WEIGHTS:
+            kind = parts[0]
+        if FINDING_WEIGHTS.get(kind):
+            kinds[kind] = FINDING_WEIGHTS[kind]
+    return sum(kinds.values()), kinds
+
+
+def _verdict_cache_key(policy, blocklist, sha256):
+    """Cache key of a verdict: it is only reused under the same thresholds, rules, weights and blocklist."""
+    blocklist_key = blocklist.fingerprint() if blocklist is not None else '-'
+    return f"triage:{policy.key()}:{VERDICT_VERSION}:{blocklist_key}:{sha256}"
+
+
+def triage(apk_path, policy=None, cache=None, report=None, workers=1, instrument=None, blocklist=None,
+           image_dir=None, image_store=None, budget=None):
+    """Triage one APK; returns {'verdict', 'tier', 'reason', 'findings', 'stages'}.
+
+    tier is the tier that settled the verdict. stages holds 'identity',
+    'files' and 'budget' from tier 0, 'manifest' once tier 1 has run and
+    every analyze_apk stage once tier 2 has. report(tier, record) is called
+    as each tier finishes, with verdict still None when it was
+    inconclusive. cache is a ResultCache shared with analyze_apk; verdicts
+    settled there are reused for the same APK and thresholds. The other
+    arguments are passed on to analyze_apk at tier 2.
+    """
+    policy = policy or TriagePolicy()
+    record = {'verdict': None, 'tier': 0, 'reason': None, 'findings': [], 'stages': {}}
+    stages = record['stages']
+
+    def stage(name):
+        return instrument.stage(name) if instrument is not None else nullcontext()
+
+    def finish_tier(tier, verdict=None, reason=None):
+        record['tier'] = tier
+        record['verdict'] = verdict
+        record['reason'] = reason
+        if report is not None:
+            report(tier, record)
+        return verdict is not None
+
+    def remember():
+        if cache is not None:
+            cache.put(_verdict_cache_key(policy, blocklist, stages['identity']['sha256']),
+                      {key: record[key] for key in ('verdict', 'tier', 'reason', 'findings')})
+
+    tracker = (budget or DEFAULT_BUDGET).tracker()
+    with open(apk_path, 'rb') as fp, ExitStack() as archive:
+        with stage('tier0'):
+            admitted = tracker.check_archive(fp)
+            identity = stages['identity'] = digest_apk(apk_path, read_v1=admitted)
+            apk_zip = archive.enter_context(zipfile.ZipFile(fp)) if admitted else None
+            stages['files'] = [(info.filename, info.file_size) for info in apk_zip.infolist()
+                               if not info.is_dir()] if admitted else []
+            stages['budget'] = list(tracker.violations)
+            tier0_findings = record['findings'] = detect_malicious_behavior({}, {}, {}, stages['budget'],
+                                                                            identity=identity)
+            verdict = policy.known.get(identity['sha256'])
+            reason = "已知样本" if verdict is not None else None
+            for certificate in identity['signature']['certificates']:
+                if verdict is None and certificate['sha256'] in policy.known:
+                    verdict = policy.known[certificate['sha256']]
+                    reason = f"已知签名证书: {certificate['subject'] or certificate['sha256']}"
+            if verdict is None and cache is not None:
+                cached = cache.get(_verdict_cache_key(policy, blocklist, identity['sha256']))
+                if cached is not None:
+                    record['findings'] = cached['findings']
+                    verdict, reason = cached['verdict'], f"缓存: {cached['reason']}"
+            if verdict is None and not admitted:
+                verdict, reason = 'suspicious', "压缩包超出解压限制，未解压任何内容"
+        if policy.deep and admitted:
+            verdict = reason = None
+        if finish_tier(0, verdict, reason):
+            return record
+
+        with stage('tier1'):
+            manifest = stages['manifest'] = read_manifest(apk_zip, tracker)
+            stages['budget'] = tracker.finish()
+            record['findings'] = detect_malicious_behavior(manifest, {}, {}, stages['budget'], identity=identity)
+            permissions = dangerous_permissions(manifest)
+        verdict = reason = None
+        if 'error' not in manifest and not policy.deep:
+            if len(permissions) >= policy.malicious_min_permissions:
+                verdict, reason = 'malicious', f"危险权限 {len(permissions)} 项"
+            elif len(permissions) <= policy.benign_max_permissions and not tier0_findings:
+                verdict, reason = 'benign', f"危险权限 {len(permissions)} 项"
+        if finish_tier(1, verdict, reason):
+            remember()
+            return record
+
+    with stage('tier2'):
+        stages.update(analyze_apk(apk_path, image_dir, cache, workers, image_store, instrument, budget, identity))
+        record['findings'] = detect_malicious_behavior(
+            stages['manifest'], stages['code'], stages['resources'], stages['budget'], stages['structure'],
+            blocklist, stages['native'], identity)
+    score, kinds = finding_score(record['findings'])
+    if score >= policy.malicious_min_score:
+        verdict = 'malicious'
+    elif score >= policy.suspicious_min_score:
+        verdict = 'suspicious'
+    else:
+        verdict = 'benign'
+    listed = ', '.join(f"{kind} +{weight}" for kind, weight in kinds.items())
+    finish_tier(2, verdict, f"完整扫描评分 {score}" + (f" ({listed})" if listed else ''))
+    remember()
+    return record
+
+
+def add_policy_arguments(parser):
+    """--triage and its threshold options, shared by batch.py and service.py."""
+    defaults = TriagePolicy()
+    parser.add_argument('--triage', action='store_true',
+                        help='分级分析：先看摘要与 Manifest，只有无法判断时才完整扫描')
+    parser.add_argument('--deep', action='store_true', help='分级分析时总是完整扫描')
+    parser.add_argument('--known', action='append', default=[], metavar='FILE',
+                        help='已知样本列表（每行 "<APK 或证书 SHA-256> <benign|suspicious|malicious>"），可多次指定')
+    parser.add_argument('--benign-max-permissions', type=int, default=defaults.benign_max_permissions,
+                        help='危险权限不超过此数时判为无害（默认 %(default)s）')
+    parser.add_argument('--malicious-min-permissions', type=int, default=defaults.malicious_min_permissions,
+                        help='危险权限达到此数时判为恶意（默认 %(default)s）')
+    parser.add_argument('--malicious-min-score', type=int, default=defaults.malicious_min_score,
+                        help='完整扫描的评分（按可疑项类别加权）达到此数时判为恶意（默认 %(default)s）')
+    parser.add_argument('--suspicious-min-score', type=int, default=defaults.suspicious_min_score,
+                        help='完整扫描的评分达到此数时判为可疑，否则判为无害（默认 %(default)s）')
+
+
+def policy_from_arguments(args):
+    """TriagePolicy from add_policy_arguments options, or None without --triage."""
+    if not args.triage:
+        return None
+    policy = TriagePolicy(args.benign_max_permissions, args.malicious_min_permissions, args.malicious_min_score,
+                          args.suspicious_min_score, deep=args.deep)
+    for path in args.known:
+        policy.load_known(path)
+    return policy
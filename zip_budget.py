@@ -0,0 +1,129 @@
+import os
+import struct
+
+EOCD_SIGNATURE = b'PK\x05\x06'
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_EOCD_SIGNATURE = b'PK\x06\x06'
+EOCD_SIZE = 22
+EOCD_SEARCH = EOCD_SIZE + 0xFFFF
+
+# Small entries compress extremely well without being bombs (blank bitmaps,
+# padding), so the ratio limit only applies above this declared size.
+RATIO_MIN_BYTES = 1024 * 1024
+
+
+def read_central_directory_size(fp):
+    """(declared entry count, central directory size) from the end records, or None.
+
+    Only the tail of the file is read, so this is safe to call before
+    zipfile.ZipFile loads the whole central directory into memory.
+    """
+    fp.seek(0, os.SEEK_END)
+    file_size = fp.tell()
+    fp.seek(max(file_size - EOCD_SEARCH, 0))
+    tail = fp.read()
+    pos = tail.rfind(EOCD_SIGNATURE)
+    if pos < 0 or pos + EOCD_SIZE > len(tail):
+        return None
+    entries, cd_size = struct.unpack_from('<HI', tail, pos + 10)
+    locator = pos - 20
+    if locator >= 0 and tail[locator:locator + 4] == ZIP64_LOCATOR_SIGNATURE:
+        zip64_offset = struct.unpack_from('<Q', tail, locator + 8)[0]
+        fp.seek(zip64_offset)
+        record = fp.read(56)
+        if len(record) == 56 and record[:4] == ZIP64_EOCD_SIGNATURE:
+            entries, cd_size = struct.unpack_from('<QQ', record, 32)
+    return entries, cd_size
+
+
+class DecompressionBudget:
+    """Limits on what analysing one archive may inflate.
+
+    The limits are checked against the sizes the archive declares. zipfile
+    never inflates an entry past its declared size, so they also bound
+    what is actually produced, and with it memory, spool files and
+    exported images. Use tracker() once per archive.
+    """
+
+    def __init__(self, max_entries=200000, max_central_directory=64 * 1024 * 1024,
+                 max_entry_bytes=512 * 1024 * 1024, max_total_bytes=4 * 1024 * 1024 * 1024,
+                 max_ratio=200, sample_bytes=4 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_central_directory = max_central_directory
+        self.max_entry_bytes = max_entry_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_ratio = max_ratio
+        self.sample_bytes = sample_bytes
+
+    def tracker(self):
+        return BudgetTracker(self)
+
+
+class BudgetTracker:
+    """Per-archive budget state; violations are kept as finding strings."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.violations = []
+        self.entries = 0
+        self.total_bytes = 0
+        self._over_count = 0
+        self._skipped = 0
+
+    def check_archive(self, fp):
+        """False (with a violation recorded) when the archive must not be opened at all."""
+        declared = read_central_directory_size(fp)
+        fp.seek(0)
+        if declared is None:
+            return True     # not a zip; let zipfile report it
+        entries, cd_size = declared
+        if entries > self.budget.max_entries:
+            self.violations.append(f"条目数 {entries} 超过上限 {self.budget.max_entries}，未解压任何内容")
+            return False
+        if cd_size > self.budget.max_central_directory:
+            self.violations.append(f"中央目录 {cd_size} 字节超过上限 {self.budget.max_central_directory}，未解压任何内容")
+            return False
+        return True
+
+    def admit(self, info, sample=True):
+        """How many bytes of the entry may be read: None for all of it, 0 to skip it.
+
+        Entries that are too large or too highly compressed get the first
+        sample_bytes (or are skipped when sample is False); once the total
+        is spent, or max_entries have been admitted, every further entry is
+        skipped.
+        """
+        budget = self.budget
+        self.entries += 1
+        if self.entries > budget.max_entries:
+            self._over_count += 1
+            return 0
+        reason = None
+        if info.file_size > budget.max_entry_bytes:
+            reason = f"声明大小 {info.file_size} 字节超过单条目上限 {budget.max_entry_bytes}"
+        elif info.file_size > RATIO_MIN_BYTES and info.file_size > budget.max_ratio * max(info.compress_size, 1):
+            ratio = info.file_size / max(info.compress_size, 1)
+            reason = f"压缩比 {ratio:.0f}:1 超过上限 {budget.max_ratio}:1"
+        limit = None
+        if reason is not None:
+            limit = budget.sample_bytes if sample else 0
+            action = f"仅扫描前 {limit} 字节" if limit else "已跳过"
+            self.violations.append(f"{info.filename}: {reason}，{action}")
+        size = info.file_size if limit is None else limit
+        if self.total_bytes + size > budget.max_total_bytes:
+            self._skipped += 1
+            return 0
+        self.total_bytes += size
+        return limit
+
+    def finish(self):
+        """Record the summary violations and return all of them."""
+        if self._over_count:
+            self.violations.append(
+                f"条目数超过上限 {self.budget.max_entries}，跳过 {self._over_count} 个条目")
+            self._over_count = 0
+        if self._skipped:
+            self.violations.append(
+                f"解压总量达到上限 {self.budget.max_total_bytes} 字节，跳过 {self._skipped} 个条目")
+            self._skipped = 0
+        return self.violations